@@ -8,7 +8,7 @@ Abstract class to perform normalization on data
 
 __email__ = "m.langguth@fz-juelich.de"
 __author__ = "Michael Langguth"
-__update__ = "2023-01-31"
+__update__ = "2023-05-15"
 
 from abc import ABC, abstractmethod
 from typing import Union, List
@@ -29,6 +29,7 @@ class Normalize(ABC):
         self.method = method
         self.norm_dims = norm_dims
         self.norm_stats = None
+        self.norm_metadata = None
 
     def normalize(self, data: xr.DataArray, **stats):
         """
@@ -68,6 +69,81 @@ class Normalize(ABC):
 
         return data_denorm
 
+    def normalize_block(self, data: np.ndarray, varnames: List, data_dims: List):
+        """
+        Normalize a numpy-array in-place with the variables constituting the last dimension (channel last).
+        In contrast to normalize, the normalization parameters must already be available and are broadcasted
+        to the data only once (see get_block_params).
+        :param data: the numpy-array to be normalized (must be a float array)
+        :param varnames: names of the variables along the last dimension
+        :param data_dims: names of the remaining dimensions of the data (without the variable dimension)
+        :return: the normalized data (same object as data)
+        """
+        norm_params = self.get_block_params(varnames, data_dims, data.dtype)
+        return self.normalize_block_data(data, *norm_params)
+
+    def denormalize_block(self, data: np.ndarray, varnames: List, data_dims: List):
+        """
+        Denormalize a numpy-array in-place with the variables constituting the last dimension (channel last).
+        See normalize_block for further details.
+        :param data: the numpy-array to be denormalized (must be a float array)
+        :param varnames: names of the variables along the last dimension
+        :param data_dims: names of the remaining dimensions of the data (without the variable dimension)
+        :return: the denormalized data (same object as data)
+        """
+        norm_params = self.get_block_params(varnames, data_dims, data.dtype)
+        return self.denormalize_block_data(data, *norm_params)
+
+    def get_block_params(self, varnames: List, data_dims: List, dtype="float32"):
+        """
+        Get the normalization parameters as contiguous numpy-arrays which can be broadcasted against data with
+        dimensions (*data_dims, variables). The arrays are cached for the given variables, dimensions and data type.
+        :param varnames: names of the variables along the last dimension (duplicates are allowed)
+        :param data_dims: names of the remaining dimensions of the data
+        :param dtype: data type of the parameters (should be the one of the data)
+        :return: tuple of normalization parameters
+        """
+        key = (tuple(varnames), tuple(data_dims), np.dtype(dtype).str)
+        if key not in self._block_cache:
+            stats_list = [self.get_required_stats(None, varname=var) for var in varnames]
+            stats_block = []
+            for i in range(len(stats_list[0])):
+                stat_arrs = [Normalize._broadcast_stat(stats[i], data_dims) for stats in stats_list]
+                stats_block.append(np.stack(stat_arrs, axis=-1).astype(np.float64))
+            self._block_cache[key] = tuple(np.ascontiguousarray(param, dtype=dtype) for param in
+                                           self.prepare_block_params(*stats_block))
+
+        return self._block_cache[key]
+
+    @staticmethod
+    def _broadcast_stat(stat: xr.DataArray, data_dims: List):
+        """
+        Get values of a normalization parameter with dimensions ordered as in data_dims. Dimensions over which the
+        parameter has been reduced are kept with size 1.
+        :param stat: the normalization parameter of one variable
+        :param data_dims: names of the dimensions of the data
+        :return: numpy-array with len(data_dims) dimensions
+        """
+        stat_dims = [dim for dim in stat.dims if dim != "variables"]
+        if not all(dim in data_dims for dim in stat_dims):
+            raise ValueError(f"Dimensions of normalization parameter {stat_dims} are not part of data dimensions " +
+                             f"{data_dims}.")
+
+        stat = stat.squeeze(drop=True).transpose(*[dim for dim in data_dims if dim in stat_dims])
+        shape = [stat.sizes[dim] if dim in stat_dims else 1 for dim in data_dims]
+
+        return stat.values.reshape(shape)
+
+    @property
+    def norm_stats(self):
+        return self._norm_stats
+
+    @norm_stats.setter
+    def norm_stats(self, norm_stats):
+        # cached parameters become invalid with new normalization parameters
+        self._block_cache = {}
+        self._norm_stats = norm_stats
+
     @property
     def norm_dims(self):
         return self._norm_dims
@@ -132,11 +208,13 @@ class Normalize(ABC):
 
         return args_new
 
-    def save_norm_to_file(self, js_file, missdir_ok: bool = True):
+    def save_norm_to_file(self, js_file, missdir_ok: bool = True, metadata: dict = None):
         """
         Write normalization parameters to file
         :param js_file: Path to JSON-file to be created
         :param missdir_ok: If True, base-directory of JSON-file can be missing and will be created then
+        :param metadata: optional dictionary with metadata (e.g. to identify the data from which the parameters
+                         have been derived). If None, self.norm_metadata is written (if available).
         :return: -
         """
         if self.norm_stats is None:
@@ -155,6 +233,10 @@ class Normalize(ABC):
         elif isinstance(d0, xr.Dataset):
             norm_serialized["data_type"] = "data_set"
 
+        metadata = self.norm_metadata if metadata is None else metadata
+        if metadata is not None:
+            norm_serialized["metadata"] = metadata
+
         if missdir_ok: os.makedirs(os.path.dirname(js_file), exist_ok=True)
 
         with open(js_file, "w") as jsf:
@@ -164,12 +246,13 @@ class Normalize(ABC):
         """
         Read normalization parameters from file. Inverse function to write_norm_from_file.
         :param js_file: Path to JSON-file to be read.
-        :return: Parameters set to self.norm_stats
+        :return: Parameters set to self.norm_stats (and optional metadata to self.norm_metadata)
         """
         with open(js_file, "r") as jsf:
             norm_data = js.load(jsf)
 
         data_type = norm_data.pop('data_type', None)
+        self.norm_metadata = norm_data.pop('metadata', None)
 
         if data_type == "data_array":
             xr_obj = xr.DataArray
@@ -208,3 +291,24 @@ class Normalize(ABC):
         """
         pass
 
+    @staticmethod
+    def prepare_block_params(*norm_param):
+        """
+        Function to derive the (cached) parameters for block-wise (de-)normalization from the normalization parameters.
+        """
+        return norm_param
+
+    @staticmethod
+    def normalize_block_data(data, *norm_param):
+        """
+        Function to normalize a numpy-array in-place.
+        """
+        raise NotImplementedError("Block-wise normalization is not implemented for this normalization method.")
+
+    @staticmethod
+    def denormalize_block_data(data, *norm_param):
+        """
+        Function to denormalize a numpy-array in-place.
+        """
+        raise NotImplementedError("Block-wise denormalization is not implemented for this normalization method.")
+
@@ -9,11 +9,17 @@ All implemented classes to perform normalization on data
 __email__ = "m.langguth@fz-juelich.de"
 __author__ = "Michael Langguth"
 __date__ = "2022-10-06"
-__update__ = "2023-01-31"
+__update__ = "2023-05-26"
 
+import os
+import time
+import hashlib
+from functools import partial, reduce
 from typing import List, Union
+import multiprocessing
 from abstract_data_normalization import Normalize
 import dask
+import numpy as np
 import xarray as xr
 
 da_or_ds = Union[xr.DataArray, xr.Dataset]
@@ -55,6 +61,118 @@ class ZScore(Normalize):
 
         return mu, std
 
+    def get_stats_from_files(self, files: List, var_list: List = None, nworkers: int = None, norm_cache: str = None,
+                             **kwargs):
+        """
+        Compute mean and standard deviation over norm_dims from a set of netCDF-files in one pass over the data.
+        Each file is processed independently (in parallel) and the partial statistics are merged afterwards
+        (see WelfordAccumulator). As with get_required_stats, the standard deviation is computed with ddof=0.
+        The parameters can be cached in a JSON-file which is re-used as long as the set of files
+        (incl. their modification times and sizes) and norm_dims remain unchanged.
+        :param files: list of netCDF-files
+        :param var_list: list of variables for which parameters are computed (None: all data variables)
+        :param nworkers: number of worker processes (None: number of CPUs, but at most number of files)
+        :param norm_cache: path to JSON-file to cache the parameters (None: no caching)
+        :param kwargs: keyword arguments passed to xr.open_dataset
+        :return (mu, sigma): Parameters for normalization
+        """
+        cache_key = self.get_files_key(files, var_list)
+
+        if norm_cache and self.read_norm_cache(norm_cache, cache_key):
+            return self.norm_stats["mu"], self.norm_stats["sigma"]
+        elif norm_cache and os.path.isfile(norm_cache):
+            print(f"Cache-file '{norm_cache}' does not match the data and will be replaced.")
+
+        print(f"Retrieve mu and sigma from {len(files)} files...")
+        nworkers = min(multiprocessing.cpu_count(), len(files)) if not nworkers else nworkers
+        func_acc = partial(WelfordAccumulator.from_file, norm_dims=self.norm_dims, var_list=var_list, **kwargs)
+        if nworkers > 1:
+            with multiprocessing.Pool(nworkers) as pool:
+                accs = pool.map(func_acc, files)
+        else:
+            accs = [func_acc(f) for f in files]
+
+        acc = reduce(WelfordAccumulator.merge, accs)
+
+        with xr.open_dataset(files[0], decode_cf=kwargs.get("decode_cf", False)) as ds_templ:
+            mu, std = acc.to_datasets(ds_templ)
+
+        self.norm_stats = {"mu": mu, "sigma": std}
+        self.norm_metadata = {"files_key": cache_key, "nfiles": len(files)}
+
+        if norm_cache:
+            try:
+                self.save_norm_to_file(norm_cache)
+                print(f"Normalization parameters have been cached to '{norm_cache}'.")
+            except OSError as err:
+                print(f"WARNING: Could not cache normalization parameters to '{norm_cache}': {err}")
+
+        return mu, std
+
+    def read_norm_cache(self, norm_cache: str, cache_key: str) -> bool:
+        """
+        Read normalization parameters from cache-file if it matches the cache key (see get_files_key).
+        :param norm_cache: path to JSON-file with cached parameters
+        :param cache_key: key identifying the set of files
+        :return: True if the parameters have been read
+        """
+        if not os.path.isfile(norm_cache):
+            return False
+
+        norm_tmp = ZScore(self.norm_dims)
+        try:
+            norm_tmp.read_norm_from_file(norm_cache)
+        except (OSError, ValueError, KeyError):
+            # cache-file may be incomplete or corrupted
+            return False
+
+        if (norm_tmp.norm_metadata or {}).get("files_key") != cache_key:
+            return False
+
+        print(f"Read mu and sigma from cache-file '{norm_cache}'.")
+        self.norm_stats, self.norm_metadata = norm_tmp.norm_stats, norm_tmp.norm_metadata
+
+        return True
+
+    def wait_for_norm_cache(self, files: List, norm_cache: str, var_list: List = None, timeout: float = 7200.,
+                            poll_interval: float = 5.):
+        """
+        Wait until the normalization parameters for a set of files are available in the cache-file.
+        Used in distributed training where only one process computes the parameters (see get_stats_from_files)
+        and shares them via the (shared) file system.
+        :param files: list of netCDF-files
+        :param norm_cache: path to JSON-file with cached parameters
+        :param var_list: list of variables for which parameters are computed (None: all data variables)
+        :param timeout: maximum waiting time in seconds
+        :param poll_interval: time interval in seconds to check the cache-file
+        :return (mu, sigma): Parameters for normalization
+        """
+        cache_key = self.get_files_key(files, var_list)
+        t0 = time.time()
+
+        while not self.read_norm_cache(norm_cache, cache_key):
+            if time.time() - t0 > timeout:
+                raise TimeoutError(f"Normalization parameters were not provided in '{norm_cache}' within {timeout}s.")
+            time.sleep(poll_interval)
+
+        return self.norm_stats["mu"], self.norm_stats["sigma"]
+
+    def get_files_key(self, files: List, var_list: List = None):
+        """
+        Get a key identifying a set of files (incl. their modification times and sizes), the normalization dimensions
+        and the selected variables.
+        :param files: list of files
+        :param var_list: list of selected variables
+        :return: hash string
+        """
+        hasher = hashlib.sha256()
+        for f in sorted(files):
+            fstat = os.stat(f)
+            hasher.update(f"{os.path.basename(f)}:{fstat.st_mtime_ns}:{fstat.st_size};".encode())
+        hasher.update(f"norm_dims:{self.norm_dims};vars:{var_list}".encode())
+
+        return hasher.hexdigest()
+
     @staticmethod
     def normalize_data(data, mu, std):
         """
@@ -80,3 +198,141 @@ class ZScore(Normalize):
         data = data * std + mu
 
         return data
+
+    @staticmethod
+    def prepare_block_params(mu, std):
+        """
+        Get parameters for block-wise (de-)normalization.
+        :param mu: mean of data
+        :param std: standard deviation of data
+        :return: mean, inverse standard deviation and standard deviation
+        """
+        return mu, 1. / std, std
+
+    @staticmethod
+    def normalize_block_data(data, mu, inv_std, std):
+        """
+        Perform z-score normalization in-place on numpy-array, i.e. (data - mu) * inv_std
+        :param data: numpy-array of interest
+        :param mu: mean of data for normalization
+        :param inv_std: inverse standard deviation of data for normalization
+        :param std: standard deviation of data (unused)
+        :return data: normalized data
+        """
+        np.subtract(data, mu, out=data)
+        np.multiply(data, inv_std, out=data)
+
+        return data
+
+    @staticmethod
+    def denormalize_block_data(data, mu, inv_std, std):
+        """
+        Perform z-score denormalization in-place on numpy-array, i.e. data * std + mu
+        :param data: numpy-array of interest
+        :param mu: mean of data for denormalization
+        :param inv_std: inverse standard deviation of data (unused)
+        :param std: standard deviation of data for denormalization
+        :return data: denormalized data
+        """
+        np.multiply(data, std, out=data)
+        np.add(data, mu, out=data)
+
+        return data
+
+
+class WelfordAccumulator(object):
+    """
+    Mergeable accumulator of count, mean and sum of squared deviations (M2) per variable based on the parallel
+    algorithm of Chan et al. (1979). Partial accumulators (e.g. from different files or workers) can be merged
+    without loss of accuracy. NaNs are ignored.
+    """
+
+    def __init__(self, norm_dims: List, stats: dict = None):
+        """
+        :param norm_dims: dimensions over which the statistics are accumulated
+        :param stats: dictionary {varname: (count, mean, M2)} with numpy-arrays over the remaining dimensions
+        """
+        self.norm_dims = list(norm_dims)
+        self.stats = {} if stats is None else stats
+
+    @classmethod
+    def from_data(cls, ds: xr.Dataset, norm_dims: List, var_list: List = None):
+        """
+        Compute the partial statistics of a dataset.
+        :param ds: the dataset
+        :param norm_dims: dimensions over which the statistics are accumulated
+        :param var_list: list of variables to consider (None: all data variables spanning norm_dims)
+        :return: accumulator instance
+        """
+        if var_list is None:
+            var_list = [var for var in ds.data_vars if all(dim in ds[var].dims for dim in norm_dims)]
+
+        stats = {}
+        for var in var_list:
+            da = ds[var]
+            other_dims = [dim for dim in da.dims if dim not in norm_dims]
+            data = da.transpose(*other_dims, *norm_dims).values.astype(np.float64)
+            data = data.reshape(*data.shape[:len(other_dims)], -1)
+            count = np.sum(~np.isnan(data), axis=-1)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                mean = np.nansum(data, axis=-1) / count
+                m2 = np.nansum((data - mean[..., None])**2, axis=-1)
+            stats[var] = (count, np.where(count > 0, mean, 0.), np.where(count > 0, m2, 0.))
+
+        return cls(norm_dims, stats)
+
+    @classmethod
+    def from_file(cls, fname: str, norm_dims: List, var_list: List = None, decode_cf: bool = False, **kwargs):
+        """
+        Compute the partial statistics of a netCDF-file.
+        :param fname: path to netCDF-file
+        :param norm_dims: dimensions over which the statistics are accumulated
+        :param var_list: list of variables to consider (None: all data variables spanning norm_dims)
+        :param decode_cf: flag to decode the data according to the CF-conventions
+        :param kwargs: keyword arguments passed to xr.open_dataset
+        :return: accumulator instance
+        """
+        with xr.open_dataset(fname, decode_cf=decode_cf, **kwargs) as ds:
+            return cls.from_data(ds, norm_dims, var_list)
+
+    def merge(self, other):
+        """
+        Merge the statistics of another accumulator into this one (in-place).
+        :param other: accumulator instance
+        :return: merged accumulator (self)
+        """
+        if self.norm_dims != other.norm_dims:
+            raise ValueError(f"Cannot merge accumulators with different norm_dims ({self.norm_dims} vs. " +
+                             f"{other.norm_dims}).")
+
+        for var, (n_b, mean_b, m2_b) in other.stats.items():
+            if var not in self.stats:
+                self.stats[var] = (n_b, mean_b, m2_b)
+                continue
+            n_a, mean_a, m2_a = self.stats[var]
+            n = n_a + n_b
+            delta = mean_b - mean_a
+            with np.errstate(invalid="ignore", divide="ignore"):
+                frac_b = np.where(n > 0, n_b / n, 0.)
+                mean = mean_a + delta * frac_b
+                m2 = m2_a + m2_b + delta**2 * n_a * frac_b
+            self.stats[var] = (n, mean, m2)
+
+        return self
+
+    def to_datasets(self, ds_templ: xr.Dataset, ddof: int = 0):
+        """
+        Convert the accumulated statistics into datasets of mean and standard deviation.
+        :param ds_templ: dataset from which dimensions and coordinates of the variables are retrieved
+        :param ddof: delta degrees of freedom for the standard deviation
+        :return: tuple of datasets (mu, sigma)
+        """
+        mu, std = {}, {}
+        for var, (count, mean, m2) in self.stats.items():
+            da_templ = ds_templ[var].isel({dim: 0 for dim in self.norm_dims}, drop=True)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                var_now = np.where(count > ddof, m2 / (count - ddof), np.nan)
+            mu[var] = da_templ.copy(data=np.where(count > 0, mean, np.nan))
+            std[var] = da_templ.copy(data=np.sqrt(var_now))
+
+        return xr.Dataset(mu), xr.Dataset(std)
@@ -0,0 +1,195 @@
+# SPDX-FileCopyrightText: 2023 Earth System Data Exploration (ESDE), Jülich Supercomputing Center (JSC)
+#
+# SPDX-License-Identifier: MIT
+
+"""
+Manifest of netCDF-files in a data directory. For each file, the number of samples, the variables with their dimensions,
+the time range as well as the size and the modification time are recorded in a JSON-file. The manifest is built once
+and validated with a stat-call per file, so that data streaming and date range selection do not require opening the
+files.
+"""
+
+__author__ = "agent"
+__email__ = "agent@local"
+__date__ = "2026-10-18"
+__update__ = "2026-10-18"
+
+import os
+import json as js
+from typing import List
+from timeit import default_timer as timer
+from multiprocessing.pool import ThreadPool
+from functools import partial
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+
+class FileManifest(object):
+    """
+    Manifest of netCDF-files (stored as JSON-file in the data directory by default).
+    """
+    manifest_name = "manifest.json"
+
+    def __init__(self, datadir: str, files: List, manifest_file: str = None, sample_dim: str = "time",
+                 nworkers: int = 10):
+        """
+        Read the manifest and update it for new or modified files.
+        :param datadir: directory of the netCDF-files
+        :param files: list of netCDF-files to be covered by the manifest
+        :param manifest_file: path to manifest (JSON-)file (default: manifest.json in datadir)
+        :param sample_dim: name of sample dimension
+        :param nworkers: number of worker threads to scan new or modified files (only metadata is read)
+        """
+        self.datadir = datadir
+        self.manifest_file = os.path.join(datadir, FileManifest.manifest_name) if manifest_file is None \
+            else manifest_file
+        self.sample_dim = sample_dim
+        self.entries = self.read_manifest()
+        self.update(files, nworkers)
+
+    def __contains__(self, fname):
+        return os.path.basename(fname) in self.entries
+
+    def read_manifest(self) -> dict:
+        """
+        Read entries from the manifest file.
+        :return: dictionary of entries with the file basenames as keys (empty if manifest file does not exist)
+        """
+        if not os.path.isfile(self.manifest_file):
+            return {}
+
+        with open(self.manifest_file, "r") as jsf:
+            manifest = js.load(jsf)
+
+        if manifest.get("sample_dim", None) != self.sample_dim:
+            print(f"WARNING: Manifest '{self.manifest_file}' was built for another sample dimension and is rebuilt.")
+            return {}
+
+        return manifest["files"]
+
+    def write_manifest(self):
+        """
+        Write manifest file. The manifest is written to a temporary file first which is then renamed to avoid
+        that concurrent processes read incomplete manifests.
+        """
+        manifest_tmp = f"{self.manifest_file}.{os.getpid()}.tmp"
+        try:
+            with open(manifest_tmp, "w") as jsf:
+                js.dump({"sample_dim": self.sample_dim, "files": self.entries}, jsf, indent=1)
+            os.replace(manifest_tmp, self.manifest_file)
+        except OSError as err:
+            print(f"WARNING: Could not write manifest '{self.manifest_file}': {err}")
+
+    def update(self, files: List, nworkers: int = 10):
+        """
+        Validate the manifest against the file system and scan new or modified files.
+        Only one stat-call per file is required if the manifest is up-to-date.
+        :param files: list of netCDF-files to be covered by the manifest
+        :param nworkers: number of worker threads to scan new or modified files (only metadata is read)
+        """
+        lchanged = False
+        # remove entries of deleted files
+        for key in list(self.entries):
+            if not os.path.isfile(os.path.join(self.datadir, key)):
+                del self.entries[key]
+                lchanged = True
+
+        files_scan = []
+        for f in files:
+            stat, entry = os.stat(f), self.entries.get(os.path.basename(f), None)
+            if entry is None or entry["size"] != stat.st_size or entry["mtime_ns"] != stat.st_mtime_ns:
+                files_scan.append(f)
+
+        if files_scan:
+            t0 = timer()
+            func_scan = partial(FileManifest.scan_file, sample_dim=self.sample_dim)
+            nworkers = min(nworkers or 1, len(files_scan))
+            if nworkers > 1:
+                with ThreadPool(nworkers) as pool:
+                    new_entries = pool.map(func_scan, files_scan)
+            else:
+                new_entries = [func_scan(f) for f in files_scan]
+            self.entries.update({os.path.basename(f): entry for f, entry in zip(files_scan, new_entries)})
+            lchanged = True
+            print(f"Scanning {len(files_scan):d} file(s) for manifest '{self.manifest_file}' took {timer() - t0:.2f}s.")
+
+        if lchanged:
+            self.write_manifest()
+
+    @staticmethod
+    def scan_file(fname: str, sample_dim: str = "time") -> dict:
+        """
+        Get manifest entry of a netCDF-file.
+        :param fname: path to netCDF-file
+        :param sample_dim: name of sample dimension
+        :return: dictionary with size, modification time, number of samples, variables, coordinates, dimensions
+                 and time range of the file
+        """
+        stat = os.stat(fname)
+        with xr.open_dataset(fname) as ds:
+            if sample_dim not in ds.dims:
+                raise KeyError(f"Could not find dimension '{sample_dim}' in '{fname}'.")
+            times = ds[sample_dim].values
+            if np.issubdtype(times.dtype, np.datetime64):
+                time_range = [np.datetime_as_string(t, unit="s") for t in (times.min(), times.max())]
+            else:
+                time_range = [str(times.min()), str(times.max())]
+
+            entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "nsamples": int(ds.dims[sample_dim]),
+                     "variables": {var: list(ds[var].dims) for var in ds.variables}, "coords": list(ds.coords),
+                     "dims": {dim: int(size) for dim, size in ds.dims.items()}, "time_start": time_range[0],
+                     "time_end": time_range[1]}
+
+        return entry
+
+    def get_entry(self, fname: str) -> dict:
+        try:
+            return self.entries[os.path.basename(fname)]
+        except KeyError:
+            raise KeyError(f"File '{fname}' is not covered by manifest '{self.manifest_file}'.")
+
+    def get_nsamples(self, files: List) -> List:
+        """
+        Get number of samples for each file.
+        :param files: list of files
+        :return: list of number of samples
+        """
+        return [self.get_entry(f)["nsamples"] for f in files]
+
+    def get_size(self, files: List) -> int:
+        """
+        Get total size of files in bytes.
+        :param files: list of files
+        :return: total size in bytes
+        """
+        return sum(self.get_entry(f)["size"] for f in files)
+
+    def get_varnames(self, fname: str) -> List:
+        return list(self.get_entry(fname)["variables"])
+
+    def get_var_dims(self, fname: str, var: str) -> List:
+        return self.get_entry(fname)["variables"][var]
+
+    def get_coords(self, fname: str) -> List:
+        return self.get_entry(fname)["coords"]
+
+    def get_dims(self, fname: str) -> dict:
+        return self.get_entry(fname)["dims"]
+
+    def select_files(self, files: List, date_range: List) -> List:
+        """
+        Select files whose time range overlaps with a date range.
+        :param files: list of files to select from
+        :param date_range: list of start and end date (strings or datetime-objects, end date is inclusive)
+        :return: list of selected files
+        """
+        if len(date_range) != 2:
+            raise ValueError(f"date_range must comprise a start and an end date, but {len(date_range)} items were parsed.")
+
+        start, end = pd.Timestamp(date_range[0]), pd.Timestamp(date_range[1])
+        if start > end:
+            raise ValueError(f"Start date {start} is later than end date {end}.")
+
+        return [f for f in files if pd.Timestamp(self.get_entry(f)["time_start"]) <= end and
+                pd.Timestamp(self.get_entry(f)["time_end"]) >= start]
@@ -5,29 +5,53 @@
 __author__ = "Michael Langguth"
 __email__ = "m.langguth@fz-juelich.de"
 __date__ = "2022-01-20"
-__update__ = "2023-04-17"
+__update__ = "2026-10-18"
 
 import os, glob
+import sys
+import json
 from typing import List
 import re
 from operator import itemgetter
 from functools import partial
 import socket
 import gc
+import threading
+import queue
 from collections import OrderedDict
+from contextlib import contextmanager
 from timeit import default_timer as timer
-import random
 import numpy as np
 import xarray as xr
 import tensorflow as tf
 from abstract_data_normalization import Normalize
 import multiprocessing
-try:
-    from multiprocessing import Pool as ThreadPool
-except:
-    from multiprocessing.pool import ThreadPool
+from multiprocessing.pool import ThreadPool
+from multiprocessing import shared_memory, resource_tracker
 from all_normalizations import ZScore
-from other_utils import to_list, find_closest_divisor, free_mem
+from sample_store import SampleStore
+from file_manifest import FileManifest
+from tfrecords_utils import IFS2TFRecords
+from other_utils import to_list, find_closest_divisor, get_np_dtype
+
+module_name = os.path.splitext(os.path.basename(__file__))[0]
+
+
+@contextmanager
+def hide_main_module():
+    """
+    Hide the main module from multiprocessing while starting processes, so that the child processes do not re-import
+    the main script. Only usable if the child processes do not require objects defined in the main script.
+    """
+    main_module = sys.modules["__main__"]
+    main_file, main_spec = main_module.__dict__.pop("__file__", None), getattr(main_module, "__spec__", None)
+    main_module.__spec__ = None
+    try:
+        yield
+    finally:
+        main_module.__spec__ = main_spec
+        if main_file is not None:
+            main_module.__file__ = main_file
 
 
 class HandleDataClass(object):
@@ -138,20 +162,7 @@ class HandleDataClass(object):
         :param predictors: List of selected predictor variables; parse None to use all predictors (vars with suffix _in)
         :return: The split data array.
         """
-        da_vars = list(da["variables"].values)
-
-        if predictors is None:
-            invars = [var for var in da_vars if var.endswith("_in")]
-        else:
-            assert all([predictor in da_vars for predictor in
-                        predictors]), f"At least one predictor is not a data variable. Available variables are {*da_vars,}"
-            invars = list(predictors)
-        if predictands is None:
-            tarvars = [var for var in da_vars if var.endswith("_tar")]
-        else:
-            assert all([predictand in da_vars for predictand in
-                        predictands]), f"At least one predictor is not a data variable. Available variables are {*da_vars,}"
-            tarvars = list(predictands)
+        invars, tarvars = HandleDataClass.get_in_tar_vars(list(da["variables"].values), predictands, predictors)
 
         # DEPRECATED CODE #
         # Unnecessary as predictands-list must be parsed to all data stream-methods
@@ -173,17 +184,49 @@ class HandleDataClass(object):
 
         return da_in, da_tar
 
+    @staticmethod
+    def get_in_tar_vars(da_vars: List, predictands: List = None, predictors: List = None) -> (List, List):
+        """
+        Get names of input and target variables for downscaling (see split_in_tar)
+        :param da_vars: List of all available variables
+        :param predictands: List of selected predictand variables; parse None to use
+                            all predictands (vars with suffix _tar)
+        :param predictors: List of selected predictor variables; parse None to use all predictors (vars with suffix _in)
+        :return: tuple of lists with input and target variable names
+        """
+        if predictors is None:
+            invars = [var for var in da_vars if var.endswith("_in")]
+        else:
+            assert all([predictor in da_vars for predictor in
+                        predictors]), f"At least one predictor is not a data variable. Available variables are {*da_vars,}"
+            invars = list(predictors)
+        if predictands is None:
+            tarvars = [var for var in da_vars if var.endswith("_tar")]
+        else:
+            assert all([predictand in da_vars for predictand in
+                        predictands]), f"At least one predictor is not a data variable. Available variables are {*da_vars,}"
+            tarvars = list(predictands)
+
+        return invars, tarvars
+
     @staticmethod
     def make_tf_dataset_dyn(datadir: str, file_patt: str, batch_size: int, nepochs: int, nfiles2merge: int,
                             predictands: List, predictors: List = None, lshuffle: bool = True,
                             named_targets: bool = False, var_tar2in: str = None, norm_obj=None, norm_dims: List = None,
-                            nworkers: int = 10):
+                            nworkers: int = 10, read_backend: str = "thread", prefetch_depth: int = 2,
+                            max_prefetch_mem: float = None, norm_cache: str = None, manifest_file: str = None,
+                            rank: int = None, world_size: int = None, seed: int = 42, data_dtype: str = "float32"):
         """
         Build TensorFlow dataset by streaming from netCDF using xarray's open_mfdatset-method.
         To fit into memory, only a subset of all netCDF-files is processed at once (nfiles2merge-parameter).
+        Each subset emits as many (complete) mini-batches as its number of samples allows, i.e. subsets may differ in
+        size. The number of mini-batches per epoch is provided by the nbatches_epoch-attribute of the returned
+        StreamMonthlyNetCDF-instance and should be used as steps_per_epoch for training.
+        For distributed training, each rank streams a disjoint set of data subsets (see StreamMonthlyNetCDF) and
+        auto-sharding of the TF dataset is disabled.
         TO-DO: Add flags for repeat and drop_remainder (cf. make_tf_dataset_allmem-method)
         :param datadir: directory where netCDF-files for TF dataset are strored
-        :param file_patt: filename pattern to glob files from datadir
+        :param file_patt: filename pattern to glob files from datadir or list of files
         :param batch_size: desired mini-batch size
         :param nepochs: (effective) number of epochs for training
         :param nfiles2merge: number if files to merge for streaming
@@ -197,6 +240,19 @@ class HandleDataClass(object):
         :param norm_obj: normalization instance used to normalize the data.
                          If not passed, the normalization instance is retrieved from the data
         :param nworkers: numbers of workers to read in netCDF-files
+        :param read_backend: backend of the workers, either 'thread' (default) or 'process' (decoded data is passed
+                             via shared memory)
+        :param prefetch_depth: number of data subsets that are pre-loaded by a background thread.
+                               Set to 0 to read the data subsets on demand of the TF dataset (no background loader).
+        :param max_prefetch_mem: memory budget in GB for the data subsets held in memory (incl. the subset in use),
+                                 the prefetch depth will be reduced accordingly (None: no limit)
+        :param norm_cache: JSON-file to cache the normalization parameters if they are computed from the data
+        :param manifest_file: JSON-file of the file manifest (default: manifest.json in datadir)
+        :param rank: rank of the process in distributed training (None: retrieved from TF_CONFIG)
+        :param world_size: number of processes in distributed training (None: retrieved from TF_CONFIG)
+        :param seed: seed to shuffle the files into data subsets (must be the same on all ranks)
+        :param data_dtype: data type to store the normalized data subsets, e.g. 'float16' or 'bfloat16' to halve
+                           the memory footprint (mini-batches are provided as float32)
         :return: tuple of (normalization object, TensorFlow dataset object)
         """
         assert norm_obj or norm_dims, f"Neither norm_obj nor norm_dims has been provided."
@@ -209,11 +265,16 @@ class HandleDataClass(object):
 
         ds_obj = StreamMonthlyNetCDF(datadir, file_patt, nfiles_merge=nfiles2merge, selected_predictands=predictands,
                                      selected_predictors=predictors, var_tar2in=var_tar2in, norm_obj=norm_obj,
-                                     norm_dims=norm_dims, nworkers=nworkers)
+                                     norm_dims=norm_dims, nworkers=nworkers, read_backend=read_backend,
+                                     prefetch_depth=prefetch_depth, max_prefetch_mem=max_prefetch_mem,
+                                     norm_cache=norm_cache, manifest_file=manifest_file, rank=rank,
+                                     world_size=world_size, seed=seed, data_dtype=data_dtype)
 
         tf_read_nc = lambda ind_set: tf.py_function(ds_obj.read_netcdf, [ind_set], tf.int64)
-        tf_choose_data = lambda il: tf.py_function(ds_obj.choose_data, [il], tf.bool)
-        tf_getdata = lambda i: tf.numpy_function(ds_obj.getitems, [i], tf.float32)
+        tf_choose_data = lambda il: tf.py_function(ds_obj.choose_data, [il], [tf.int64, tf.int64])
+        tf_next_subset = lambda ind_set: tf.py_function(ds_obj.next_subset, [ind_set], [tf.int64, tf.int64])
+        tf_getdata = lambda i: tf.cast(tf.numpy_function(ds_obj.getitems, [i], tf.as_dtype(ds_obj.data_dtype)),
+                                       tf.float32)
         if named_targets:
             varnames = ds_obj.predictand_list
             tf_split = lambda arr: (arr[..., 0:-ds_obj.n_predictands],
@@ -226,25 +287,138 @@ class HandleDataClass(object):
         else:
             nshuffle = 1          # equivalent to no shuffling
 
-        # enable flexibility in factor for range
-        n_reads = int(ds_obj.nfiles_merged*nepochs)
-        tfds = tf.data.Dataset.range(n_reads).map(tf_read_nc).prefetch(1)
-        tfds = tfds.flat_map(lambda x: tf.data.Dataset.from_tensors(x).map(tf_choose_data))
+        # assign the data subsets of all epochs to the ranks
+        ds_obj.set_subset_plan(batch_size, nepochs)
+        n_reads = len(ds_obj.subset_plan)
+        if ds_obj.prefetch_depth > 0:
+            # data subsets are read by a background thread, the TF dataset just fetches them from the queue
+            ds_obj.start_loader(n_reads)
+            # the data stream ends after the last data subset of the plan (see next_subset), i.e. no repeat
+            tfds = tf.data.Dataset.range(n_reads).map(tf_next_subset)
+        else:
+            tfds = tf.data.Dataset.range(n_reads).map(tf_read_nc).prefetch(1)
+            tfds = tfds.flat_map(lambda x: tf.data.Dataset.from_tensors(x).map(tf_choose_data))
+        # the data subsets return their number of samples and their budget of mini-batches
         tfds = tfds.flat_map(
-            lambda x: tf.data.Dataset.range(ds_obj.samples_merged).shuffle(nshuffle)
-            .batch(batch_size, drop_remainder=True).map(tf_getdata, num_parallel_calls=tf.data.AUTOTUNE))
+            lambda nsamples, nbatches: tf.data.Dataset.range(tf.reshape(nsamples, [])).shuffle(nshuffle)
+            .take(tf.reshape(nbatches, []) * batch_size).batch(batch_size, drop_remainder=True)
+            .map(tf_getdata, num_parallel_calls=tf.data.AUTOTUNE))
+
+        tfds = tfds.map(tf_split, num_parallel_calls=tf.data.AUTOTUNE)
+        if ds_obj.prefetch_depth == 0:
+            tfds = tfds.repeat()
 
-        tfds = tfds.map(tf_split, num_parallel_calls=tf.data.AUTOTUNE).repeat()
+        # data is already sharded across the ranks
+        options = tf.data.Options()
+        options.experimental_distribute.auto_shard_policy = tf.data.experimental.AutoShardPolicy.OFF
+        tfds = tfds.with_options(options)
 
         return ds_obj, tfds
 
+    @staticmethod
+    def make_tf_dataset_store(store_dir: str, batch_size: int, lshuffle: bool = True, named_targets: bool = False,
+                              lrepeat: bool = True, drop_remainder: bool = True):
+        """
+        Build TensorFlow dataset from a pre-compiled sample store (see SampleStore.compile).
+        Sample indices are shuffled across all shards and mini-batches are read from the memory-mapped shards.
+        Samples stored with reduced precision are cast to float32.
+        :param store_dir: directory of the sample store
+        :param batch_size: desired mini-batch size
+        :param lshuffle: boolean to enable sample shuffling
+        :param named_targets: boolean if targets will be provided as dictionary with named variables for data stream
+        :param lrepeat: flag if dataset should be repeated
+        :param drop_remainder: flag if samples will be dropped in case batch size is not a divisor of # data samples
+        :return: tuple of (sample store object, TensorFlow dataset object)
+        """
+        store = SampleStore(store_dir)
+
+        bs = batch_size if drop_remainder else None
+        shape_batch = (bs, *store.sample_shape)
+
+        def tf_getdata(inds):
+            data = tf.numpy_function(store.getitems, [inds], tf.as_dtype(store.dtype))
+            return tf.cast(tf.ensure_shape(data, shape_batch), tf.float32)
+
+        if named_targets:
+            varnames = store.predictands
+            tf_split = lambda arr: (arr[..., 0:-store.n_predictands],
+                                    {var: arr[..., -store.n_predictands + i] for i, var in enumerate(varnames)})
+        else:
+            tf_split = lambda arr: (arr[..., 0:-store.n_predictands], arr[..., -store.n_predictands:])
+
+        tfds = tf.data.Dataset.range(store.nsamples)
+        if lshuffle:
+            tfds = tfds.shuffle(store.nsamples, reshuffle_each_iteration=True)
+        tfds = tfds.batch(batch_size, drop_remainder=drop_remainder)
+        tfds = tfds.map(tf_getdata, num_parallel_calls=tf.data.AUTOTUNE).map(tf_split,
+                                                                             num_parallel_calls=tf.data.AUTOTUNE)
+        if lrepeat:
+            tfds = tfds.repeat()
+
+        return store, tfds.prefetch(tf.data.AUTOTUNE)
+
+    @staticmethod
+    def make_tf_dataset_tfr(tfr_dir: str, batch_size: int, predictands: List, norm_obj: Normalize,
+                            predictors: List = None, lshuffle: bool = True, shuffle_samples: int = 20000,
+                            named_targets: bool = False, var_tar2in: str = None, lrepeat: bool = True,
+                            drop_remainder: bool = True, compression: str = "GZIP", patt: str = "*.tfrecords"):
+        """
+        Build TensorFlow dataset from TFRecord-files (see IFS2TFRecords). The files are read interleaved,
+        parsed in parallel and normalized on-the-fly.
+        :param tfr_dir: directory where the TFRecord-files (and the metadata.json) are stored
+        :param batch_size: desired mini-batch size
+        :param predictands: List of selected predictand variables
+        :param norm_obj: z-score normalization instance providing the normalization parameters
+        :param predictors: List of selected predictor variables; parse None to use all predictors (vars with suffix _in)
+        :param lshuffle: boolean to enable sample shuffling
+        :param shuffle_samples: size of the shuffle buffer
+        :param named_targets: boolean if targets will be provided as dictionary with named variables for data stream
+        :param var_tar2in: name of target variable to be added to input
+        :param lrepeat: flag if dataset should be repeated
+        :param drop_remainder: flag if samples will be dropped in case batch size is not a divisor of # data samples
+        :param compression: compression type of the TFRecord-files ("", "GZIP" or "ZLIB")
+        :param patt: filename pattern of the TFRecord-files
+        :return: tuple of (number of samples, TensorFlow dataset object)
+        """
+        with open(os.path.join(tfr_dir, "metadata.json"), "r") as jsf:
+            meta_dict = json.load(jsf)
+        variables = meta_dict["coordinates"]["variable"]
+        ifs_tfr = IFS2TFRecords(tfr_dir, None, create_tfr_dir=False, meta_dict=meta_dict)
+
+        invars, tarvars = HandleDataClass.get_in_tar_vars(variables, predictands, predictors)
+        if var_tar2in is not None:
+            # NOTE: var_tar2in must appear at first place (see StreamMonthlyNetCDF.getitems)
+            invars = to_list(var_tar2in) + invars
+        inds_in, inds_tar = [variables.index(var) for var in invars], [variables.index(var) for var in tarvars]
+
+        # the data is stored with dimensions (lat, lon, variables), see IFS2TFRecords.parse_example
+        mu, inv_std, _ = norm_obj.get_block_params(variables, ["lat", "lon"], "float32")
+
+        def tf_norm_split(data):
+            data = (data - mu) * inv_std
+            x_in, x_tar = tf.gather(data, inds_in, axis=-1), tf.gather(data, inds_tar, axis=-1)
+            if named_targets:
+                x_tar = {var: x_tar[..., i] for i, var in enumerate(tarvars)}
+            return x_in, x_tar
+
+        tfds = ifs_tfr.get_dataset(patt, compression=compression, lshuffle=lshuffle)
+        tfds = tfds.map(tf_norm_split, num_parallel_calls=tf.data.AUTOTUNE)
+        if lshuffle:
+            tfds = tfds.shuffle(shuffle_samples)
+        tfds = tfds.batch(batch_size, drop_remainder=drop_remainder)
+        if lrepeat:
+            tfds = tfds.repeat()
+
+        return ifs_tfr.get_nsamples(patt), tfds.prefetch(tf.data.AUTOTUNE)
+
     @staticmethod
     def make_tf_dataset_allmem(da: xr.DataArray, batch_size: int, predictands: List, predictors: List = None,
                                lshuffle: bool = True, shuffle_samples: int = 20000, named_targets: bool = False,
                                var_tar2in: str = None, lrepeat: bool = True, drop_remainder: bool = True,
-                               lembed: bool = False) -> tf.data.Dataset:
+                               lembed: bool = False, data_backend: str = "numpy",
+                               data_dtype: str = "float32") -> tf.data.Dataset:
         """
-        Build-up TensorFlow dataset from a generator based on the xarray-data array.
+        Build-up TensorFlow dataset from the xarray-data array.
         NOTE: All data is loaded into memory
         :param da: the data-array from which the dataset should be cretaed. Must have dimensions [time, ..., variables].
                    Input variable names must carry the suffix '_in', whereas it must be '_tar' for target variables
@@ -259,8 +433,24 @@ class HandleDataClass(object):
         :param lrepeat: flag if dataset should be repeated
         :param drop_remainder: flag if samples will be dropped in case batch size is not a divisor of # data samples
         :param lembed: flag to trigger temporal embedding (not implemented yet!)
+        :param data_backend: 'numpy' to gather mini-batches from contiguous numpy-arrays (shuffle_samples is without
+                             effect since all samples are shuffled) or 'generator' to build the dataset from a
+                             (cached) generator yielding single samples
+        :param data_dtype: data type to keep the data (or the cached samples) in memory, e.g. 'float16' or 'bfloat16'
+                           to halve the memory footprint (mini-batches are provided as float32)
         """
-        da = da.load()
+        if lembed is True:
+            raise ValueError("Time embedding is not supported yet.")
+
+        if data_backend == "numpy":
+            return HandleDataClass.make_tf_dataset_np(da, batch_size, predictands, predictors=predictors,
+                                                      lshuffle=lshuffle, named_targets=named_targets,
+                                                      var_tar2in=var_tar2in, lrepeat=lrepeat,
+                                                      drop_remainder=drop_remainder, data_dtype=data_dtype)
+        elif data_backend != "generator":
+            raise ValueError(f"Unknown data_backend '{data_backend}'. Choose either 'numpy' or 'generator'.")
+
+        da = da.load().astype(get_np_dtype(data_dtype), copy=False)
         da_in, da_tar = HandleDataClass.split_in_tar(da, predictands=predictands, predictors=predictors)
         if var_tar2in is not None:
             # NOTE: * The order of the following operation must be the same as in StreamMonthlyNetCDF.getitems
@@ -301,11 +491,7 @@ class HandleDataClass(object):
         # re-instantiate the generator and build TF dataset
         gen_train = gen_now(da_in, da_tar)
 
-        if lembed is True:
-            raise ValueError("Time embedding is not supported yet.")
-        else:
-            data_iter = tf.data.Dataset.from_generator(lambda: gen_train,
-                                                       output_signature=(sample_spec_in, sample_spec_tar))
+        data_iter = tf.data.Dataset.from_generator(lambda: gen_train, output_signature=(sample_spec_in, sample_spec_tar))
 
         # Notes:
         # * cache is reuqired to make repeat work properly on datasets based on generators
@@ -320,12 +506,70 @@ class HandleDataClass(object):
         if lrepeat:
             data_iter = data_iter.repeat()
 
+        if get_np_dtype(data_dtype) != np.dtype("float32"):
+            data_iter = data_iter.map(lambda x_in, x_tar: tf.nest.map_structure(lambda x: tf.cast(x, tf.float32),
+                                                                                (x_in, x_tar)))
+
         # clean-up to free some memory
         del da
         gc.collect()
 
         return data_iter
 
+    @staticmethod
+    def make_tf_dataset_np(da: xr.DataArray, batch_size: int, predictands: List, predictors: List = None,
+                           lshuffle: bool = True, named_targets: bool = False, var_tar2in: str = None,
+                           lrepeat: bool = True, drop_remainder: bool = True, sample_dim: str = "time",
+                           data_dtype: str = "float32") -> tf.data.Dataset:
+        """
+        Build-up TensorFlow dataset from contiguous numpy-arrays of the input and target data.
+        The arrays are created once and mini-batches are gathered from them by index, i.e. neither a generator
+        nor caching of the dataset is required. See make_tf_dataset_allmem for a description of the parameters.
+        :return: TensorFlow dataset object
+        """
+        da_vars = list(da["variables"].values)
+        invars, tarvars = HandleDataClass.get_in_tar_vars(da_vars, predictands, predictors)
+        if var_tar2in is not None:
+            # NOTE: var_tar2in must appear at first place (see StreamMonthlyNetCDF.getitems)
+            invars = to_list(var_tar2in) + invars
+
+        # get contiguous arrays of input and target data (with channels last)
+        data_all = da.transpose(sample_dim, ..., "variables").values
+        data_in = np.take(data_all, [da_vars.index(var) for var in invars], axis=-1).astype(get_np_dtype(data_dtype),
+                                                                                           copy=False)
+        data_tar = np.take(data_all, [da_vars.index(var) for var in tarvars], axis=-1).astype(get_np_dtype(data_dtype),
+                                                                                             copy=False)
+        del data_all
+        nsamples = data_in.shape[0]
+
+        def gather(inds):
+            return data_in[inds], data_tar[inds]
+
+        bs = batch_size if drop_remainder else None
+        shape_in, shape_tar = (bs, *data_in.shape[1:]), (bs, *data_tar.shape[1:])
+
+        def tf_gather(inds):
+            x_in, x_tar = tf.numpy_function(gather, [inds], (tf.as_dtype(data_in.dtype), tf.as_dtype(data_tar.dtype)))
+            x_in, x_tar = tf.ensure_shape(x_in, shape_in), tf.ensure_shape(x_tar, shape_tar)
+            x_in, x_tar = tf.cast(x_in, tf.float32), tf.cast(x_tar, tf.float32)
+            if named_targets:
+                x_tar = {var: x_tar[..., i] for i, var in enumerate(tarvars)}
+            return x_in, x_tar
+
+        # Notes:
+        # * shuffling is applied on the sample indices only and thus cheap, all samples are shuffled in each epoch
+        # * batch-size is increased to allow substepping in train_step
+        data_iter = tf.data.Dataset.range(nsamples)
+        if lshuffle:
+            data_iter = data_iter.shuffle(nsamples, reshuffle_each_iteration=True)
+        data_iter = data_iter.batch(batch_size, drop_remainder=drop_remainder)
+        data_iter = data_iter.map(tf_gather, num_parallel_calls=tf.data.AUTOTUNE)
+
+        if lrepeat:
+            data_iter = data_iter.repeat()
+
+        return data_iter.prefetch(tf.data.AUTOTUNE)
+
     @staticmethod
     def ds_to_netcdf(ds: xr.Dataset, fname: str, comp_lvl=5):
         """
@@ -364,8 +608,19 @@ class HandleDataClass(object):
         return False
 
 
-def get_dataset_filename(datadir: str, dataset_name: str, subset: str, laugmented: bool = False):
-
+def get_dataset_filename(datadir: str, dataset_name: str, subset: str, laugmented: bool = False,
+                         date_range: List = None, manifest_file: str = None):
+    """
+    Get filename (or filename pattern) of dataset.
+    :param datadir: directory of the dataset files
+    :param dataset_name: name of dataset ('tier1' or 'tier2')
+    :param subset: subset of dataset ('train', 'val' or 'test')
+    :param laugmented: flag to get augmented dataset (Tier-1 only)
+    :param date_range: start and end date to select files (only for datasets with several files, e.g. Tier-2 training).
+                       The selection is based on the file manifest (see FileManifest), so that no file is opened.
+    :param manifest_file: JSON-file of the file manifest (default: manifest.json in datadir)
+    :return: filename, filename pattern or (if date_range is parsed) list of files
+    """
     allowed_subsets = ("train", "val", "test")
 
     if subset in allowed_subsets:
@@ -388,6 +643,13 @@ def get_dataset_filename(datadir: str, dataset_name: str, subset: str, laugmente
 
     if "*" in fname_suffix:
         ds_filename = fname_suffix
+        if date_range is not None:
+            files = glob.glob(os.path.join(datadir, f"{fname_suffix}.nc"))
+            manifest = FileManifest(datadir, files, manifest_file=manifest_file)
+            ds_filename = sorted(manifest.select_files(files, date_range))
+            if not ds_filename:
+                raise FileNotFoundError(f"Could not find any files of dataset '{dataset_name}' within date range " +
+                                        f"{date_range[0]} to {date_range[1]}.")
     else:
         ds_filename = os.path.join(datadir, f"{fname_suffix}.nc")
 
@@ -397,16 +659,45 @@ def get_dataset_filename(datadir: str, dataset_name: str, subset: str, laugmente
     return ds_filename
 
 
+def get_dist_rank_size(rank: int = None, world_size: int = None) -> (int, int):
+    """
+    Get rank and world size of the current process for distributed training. Values which are not parsed are
+    retrieved from the TF_CONFIG environment variable (as used by tf.distribute.MultiWorkerMirroredStrategy) where
+    the chief (if present) has rank 0. Without TF_CONFIG, a single process is assumed.
+    :param rank: rank of the process
+    :param world_size: number of processes
+    :return: tuple of rank and world size
+    """
+    tf_config = json.loads(os.environ.get("TF_CONFIG", "{}"))
+    cluster, task = tf_config.get("cluster", {}), tf_config.get("task", {})
+    nchief = len(cluster.get("chief", []))
+
+    if world_size is None:
+        world_size = max(nchief + len(cluster.get("worker", [])), 1)
+    if rank is None:
+        rank = task.get("index", 0) + (nchief if task.get("type", "worker") == "worker" else 0) if task else 0
+
+    if not 0 <= rank < world_size:
+        raise ValueError(f"Rank {rank} is invalid for world size {world_size}.")
+
+    return int(rank), int(world_size)
+
+
 class StreamMonthlyNetCDF(object):
     def __init__(self, datadir, patt, nfiles_merge: int, selected_predictands: List, sample_dim: str = "time",
                  selected_predictors: List = None, var_tar2in: str = None, norm_dims: List = None, norm_obj=None,
-                 nworkers: int = 10):
+                 nworkers: int = 10, read_backend: str = "thread", prefetch_depth: int = 2,
+                 max_prefetch_mem: float = None, norm_cache: str = None, manifest_file: str = None,
+                 rank: int = None, world_size: int = None, seed: int = 42, data_dtype: str = "float32"):
         """
         Class object providing all methods to create a TF dataset that iterates over a set of (monthly) netCDF-files
         rather than loading all into memory. Instead, only a subset of all netCDF-files is loaded into memory.
-        Furthermore, the class attributes provide key information on the handled dataset
+        Furthermore, the class attributes provide key information on the handled dataset.
+        For distributed training, the files are reshuffled into data subsets for each epoch, and each rank gets a
+        disjoint set of data subsets with balanced sample counts (see set_subset_plan). The normalization parameters
+        are computed by rank 0 only and shared via norm_cache.
         :param datadir: directory where set of netCDF-files are located
-        :param patt: filename pattern to allow globbing for netCDF-files
+        :param patt: filename pattern to allow globbing for netCDF-files or list of netCDF-files
         :param nfiles_merge: number of files that will be loaded into memory (corresponding to one dataset subset)
         :param selected_predictands: list of predictand variables names to be obtained
         :param sample_dim: name of dimension in the data over which sampling should be performed
@@ -416,69 +707,213 @@ class StreamMonthlyNetCDF(object):
                           (e.g. static variables known a priori such as the surface topography)
         :param norm_dims: list of dimensions over which data will be normalized
         :param norm_obj: normalization object providing parameters for (de-)normalization
-        :param nworkers: number of threads to read the netCDF-files
+        :param nworkers: number of workers to read the netCDF-files
+        :param read_backend: 'thread' to read the netCDF-files with a thread pool (default) or 'process' to use a
+                             process pool (decoding and normalization are not limited by the GIL, data is returned
+                             via shared memory). The worker processes are not forked from the main process
+                             (see get_process_pool).
+        :param prefetch_depth: maximum number of data subsets pre-loaded by the background loader (see start_loader).
+                               Set to 0 to disable the background loader.
+        :param max_prefetch_mem: memory budget in GB for all data subsets held in memory (None: no limit)
+        :param norm_cache: JSON-file to cache the normalization parameters if they are computed from the data
+        :param manifest_file: JSON-file of the file manifest (default: manifest.json in datadir, see FileManifest)
+        :param rank: rank of the process in distributed training (None: retrieved from TF_CONFIG)
+        :param world_size: number of processes in distributed training (None: retrieved from TF_CONFIG)
+        :param seed: seed to shuffle the files into data subsets (must be the same on all ranks)
+        :param data_dtype: data type to store the normalized data subsets (e.g. 'float16' or 'bfloat16'). Files are
+                           still read and normalized in float32 and only cast when the data subset is assembled.
         """
         self.data_dir = datadir
         self.file_list = patt
         self.nfiles = len(self.file_list)
+        # meta data of the files is taken from the manifest to avoid opening the files
+        self.manifest = FileManifest(self.data_dir, self.file_list, manifest_file=manifest_file,
+                                     sample_dim=sample_dim, nworkers=nworkers)
         self.dataset_size = self.get_dataset_size()
-        self.file_list_random = random.sample(self.file_list, self.nfiles)
+        self.rank, self.world_size = get_dist_rank_size(rank, world_size)
+        self.data_dtype = get_np_dtype(data_dtype)
+        self.seed = seed
         self.nfiles2merge = nfiles_merge
         self.nfiles_merged = int(self.nfiles / self.nfiles2merge)
-        self.samples_merged = self.get_samples_per_merged_file()
+        if self.nfiles_merged < self.world_size:
+            raise ValueError(f"Number of data subsets ({self.nfiles_merged:d}) is smaller than the number of ranks " +
+                             f"({self.world_size:d}). Reduce nfiles_merge.")
+        self.nsubsets_rank = self.nfiles_merged // self.world_size
+        self.nsamples_files = dict(zip(self.file_list, self.manifest.get_nsamples(self.file_list)))
+        self.samples_merged = self.get_max_subset_size()
+        # data subsets and their budget of mini-batches (depends on batch size, see set_subset_plan)
+        self.subset_plan, self.nbatches_epoch = None, None
         self.varnames_list = self.get_all_varnames()
-        print(f"Data subsets will comprise {self.samples_merged} samples.")
+        print(f"Data subsets will comprise up to {self.samples_merged} samples " +
+              f"({self.nsubsets_rank:d} subsets per epoch on rank {self.rank:d}/{self.world_size:d}).")
         self.predictor_list = selected_predictors
         self.predictand_list = selected_predictands
         self.n_predictands, self.n_predictors = len(self.predictand_list), len(self.predictor_list)
         self.all_vars = self.predictor_list + self.predictand_list
-        self.ds_all = xr.open_mfdataset(list(self.file_list), decode_cf=False, cache=False)  # , parallel=True)
         self.var_tar2in = var_tar2in
         if self.var_tar2in is not None:
             self.n_predictors += len(to_list(self.var_tar2in))
         self.sample_dim = sample_dim
-        self.nsamples = self.ds_all.dims[sample_dim]
+        self.nsamples = sum(self.manifest.get_nsamples(self.file_list))
         self.data_dim = self.get_data_dim()
         t0 = timer()
         self.normalization_time = -999.
         if norm_obj is None:
-            print("Start computing normalization parameters.")
             self.data_norm = ZScore(norm_dims)  # TO-DO: Allow for arbitrary normalization
-            self.norm_params = self.data_norm.get_required_stats(self.ds_all)
+            if self.world_size > 1 and self.rank > 0:
+                # normalization parameters are computed once by rank 0 and shared via the cache-file
+                if not norm_cache:
+                    raise ValueError("norm_cache must be parsed for distributed training to share the " +
+                                     "normalization parameters across ranks.")
+                print(f"Wait for normalization parameters from rank 0 in '{norm_cache}'.")
+                self.norm_params = self.data_norm.wait_for_norm_cache(self.file_list, norm_cache)
+            else:
+                print("Start computing normalization parameters.")
+                self.norm_params = self.data_norm.get_stats_from_files(self.file_list, nworkers=nworkers,
+                                                                       norm_cache=norm_cache)
             self.normalization_time = timer() - t0
         else:
             self.data_norm = norm_obj
             self.norm_params = norm_obj.norm_stats
 
-        self.data_loaded = [xr.Dataset, xr.Dataset]
+        # order of variables in the data blocks; var_tar2in must appear first (see getitems)
+        self.block_vars = self.get_block_vars()
+        var_dims = self.manifest.get_var_dims(self.file_list[0], self.block_vars[0])
+        self.block_dims = (self.sample_dim, *[dim for dim in var_dims if dim != self.sample_dim])
+
+        self.data_loaded, self.nbatches_loaded = [None, None], [0, 0]
         self.iload_next, self.iuse_next = 0, 0
         self.reading_times = []
         self.ds_proc_size = 0.
         self.data_now = None
         if not nworkers:
             nworkers = min((multiprocessing.cpu_count(), self.nfiles2merge))
-        self.pool = ThreadPool(nworkers)
+        self.read_backend = read_backend
+        self.pool = self.get_process_pool(nworkers) if self.read_backend == "process" else ThreadPool(nworkers)
+        # attributes for the background loader
+        self.subset_size = self.get_subset_size()
+        self.prefetch_depth = self.get_prefetch_depth(prefetch_depth, max_prefetch_mem)
+        self.data_queue = queue.Queue(maxsize=max(self.prefetch_depth, 1))
+        self.loader, self.stop_event = None, threading.Event()
+        # marks the end of the data stream in the queue of the background loader
+        self.end_of_stream = object()
+        self.stall_times, self.compute_times = [], []
+        self.t_last_switch = None
 
     def __len__(self):
         return self.nsamples
 
+    @staticmethod
+    def get_process_pool(nworkers: int):
+        """
+        Create a pool of worker processes to read the netCDF-files. The workers are started from a fork server
+        (or spawned if forkserver is not available) since forking the main process after TensorFlow has started its
+        threads may deadlock. The main script is not re-imported by the workers.
+        :param nworkers: number of worker processes
+        :return: process pool
+        """
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            ctx = multiprocessing.get_context("forkserver")
+            ctx.set_forkserver_preload([module_name])
+        else:
+            ctx = multiprocessing.get_context("spawn")
+        with hide_main_module():
+            pool = ctx.Pool(nworkers)
+
+        return pool
+
     def getitems(self, indices):
-        da_now = self.data_now.isel({self.sample_dim: indices}).to_array("variables")
-        if self.var_tar2in is not None:
+        """
+        Gather samples from the currently used data block. Since the data block is already a contiguous array
+        with shape (sample_dim, ..., variables) in which var_tar2in has been placed at first position,
+        this is a single fancy-index operation.
+        Note that indices may also be a 2D-array of shape (nbatches, batch_size) to gather several batches at once.
+        :param indices: indices of samples to gather
+        :return: array of shape (*indices.shape, ..., variables)
+        """
+        return np.take(self.data_now, indices, axis=0)
+
+    @staticmethod
+    def getitems_xr(ds: xr.Dataset, indices, var_tar2in: str = None, sample_dim: str = "time"):
+        """
+        Gather samples from a dataset with xarray (former implementation of getitems, e.g. for benchmarking).
+        In contrast to getitems, the variables are stacked for each mini-batch.
+        :param ds: dataset holding the (normalized) data
+        :param indices: indices of samples to gather
+        :param var_tar2in: name of target variable to be added to input
+        :param sample_dim: name of sample dimension
+        :return: DataArray with dimensions (sample_dim, ..., variables)
+        """
+        da_now = ds.isel({sample_dim: indices}).to_array("variables")
+        if var_tar2in is not None:
             # NOTE: * The order of the following operation must be the same as in make_tf_dataset_allmem
             #       * The following operation order must concatenate var_tar2in by da_in to ensure
             #         that the variable appears at first place. This is required to avoid
             #         that var_tar2in becomes a predeictand when slicing takes place in tf_split
-            da_now = xr.concat([da_now.sel({"variables": self.var_tar2in}), da_now], dim="variables")
+            da_now = xr.concat([da_now.sel({"variables": var_tar2in}), da_now], dim="variables")
 
-        return da_now.transpose(..., "variables")
+        return da_now.transpose(sample_dim, ..., "variables")
 
-    def get_dataset_size(self):
-        dataset_size = 0.
-        for datafile in self.file_list:
-            dataset_size += os.path.getsize(datafile)
+    def get_block_vars(self):
+        """
+        Get the ordered list of variables constituting the last dimension of the data blocks.
+        NOTE: * The order must be the same as in make_tf_dataset_allmem
+              * var_tar2in must be placed at first position to avoid that var_tar2in becomes a predictand
+                when slicing takes place in tf_split
+        :return: list of variable names (var_tar2in may appear twice)
+        """
+        block_vars = list(self.all_vars)
+        if self.var_tar2in is not None:
+            block_vars = to_list(self.var_tar2in) + block_vars
+
+        return block_vars
+
+    @property
+    def read_backend(self):
+        return self._read_backend
+
+    @read_backend.setter
+    def read_backend(self, backend: str):
+        allowed_backends = ("process", "thread")
+        if backend not in allowed_backends:
+            raise ValueError(f"Unknown read backend '{backend}' chosen. Allowed backends are {*allowed_backends,}")
+
+        self._read_backend = backend
+
+    def get_subset_size(self):
+        """
+        Estimate the memory footprint of one data subset (block) in bytes.
+        :return: size of data subset in bytes
+        """
+        return int(self.samples_merged * np.prod(self.data_dim) * len(self.block_vars) * self.data_dtype.itemsize)
+
+    def get_prefetch_depth(self, prefetch_depth: int, max_prefetch_mem: float = None):
+        """
+        Limit the prefetch depth of the background loader to the memory budget. Note that besides the queued data
+        subsets, the data subset in use and the data subset being read by the loader are held in memory.
+        :param prefetch_depth: desired number of pre-loaded data subsets
+        :param max_prefetch_mem: memory budget in GB (None: no limit)
+        :return: prefetch depth
+        """
+        if prefetch_depth < 0:
+            raise ValueError(f"prefetch_depth must be non-negative, but {prefetch_depth} was parsed.")
+
+        if max_prefetch_mem is None or prefetch_depth == 0:
+            return prefetch_depth
+
+        max_depth = int(max_prefetch_mem * 1.e+09 / self.subset_size) - 2
+        if max_depth < 1:
+            print(f"WARNING: Memory budget of {max_prefetch_mem:.1f} GB is too small for subsets of " +
+                  f"{self.subset_size / 1.e+09:.2f} GB. The prefetch depth is set to 1. Consider to reduce nfiles2merge.")
+            max_depth = 1
+        if max_depth < prefetch_depth:
+            print(f"Prefetch depth is reduced from {prefetch_depth:d} to {max_depth:d} due to memory budget of " +
+                  f"{max_prefetch_mem:.1f} GB.")
+
+        return min(prefetch_depth, max_depth)
 
-        return dataset_size
+    def get_dataset_size(self):
+        return float(self.manifest.get_size(self.file_list))
 
     def get_data_dim(self):
         """
@@ -487,24 +922,77 @@ class StreamMonthlyNetCDF(object):
         :return: tuple of data dimensions
         """
         # get existing dimension names and remove sample_dim
-        dimnames = list(self.ds_all.coords)
+        dimnames = list(self.manifest.get_coords(self.file_list[0]))
         dimnames.remove(self.sample_dim)
 
         # get the dimensionality of the data of interest
-        all_dims = dict(self.ds_all.dims)
+        all_dims = self.manifest.get_dims(self.file_list[0])
         data_dim = itemgetter(*dimnames)(all_dims)
 
         return data_dim
 
-    def get_samples_per_merged_file(self):
-        nsamples_merged = []
-
-        for i in range(self.nfiles_merged):
-            file_list_now = self.file_list_random[i * self.nfiles2merge: (i + 1) * self.nfiles2merge]
-            ds_now = xr.open_mfdataset(list(file_list_now), decode_cf=False)
-            nsamples_merged.append(ds_now.dims["time"])  # To-Do: avoid hard-coding
+    def get_max_subset_size(self):
+        """
+        Get the maximum number of samples of a data subset, i.e. of nfiles2merge files (from the file manifest).
+        :return: maximum number of samples per data subset
+        """
+        return int(sum(sorted(self.nsamples_files.values(), reverse=True)[:self.nfiles2merge]))
 
-        return max(nsamples_merged)
+    def get_epoch_subsets(self, epoch: int):
+        """
+        Shuffle the files into data subsets for an epoch and assign the subsets to the ranks. Each rank gets
+        nsubsets_rank subsets where the subsets are assigned in descending order of their size to the rank with the
+        fewest samples so far to balance the sample counts. Remaining subsets (if the number of subsets is not
+        divisible by world_size) are skipped in this epoch.
+        The result is deterministic for a given seed, i.e. identical on all ranks.
+        :param epoch: the epoch
+        :return: list with the data subsets (list of files) for each rank
+        """
+        rng = np.random.default_rng(self.seed + epoch)
+        files = [self.file_list[i] for i in rng.permutation(self.nfiles)]
+        subsets = [files[i * self.nfiles2merge: (i + 1) * self.nfiles2merge] for i in range(self.nfiles_merged)]
+        nsamples = np.array([sum(self.nsamples_files[f] for f in subset) for subset in subsets])
+
+        rank_subsets, rank_nsamples = [[] for _ in range(self.world_size)], np.zeros(self.world_size)
+        for isubset in np.argsort(nsamples, kind="stable")[::-1][:self.nsubsets_rank * self.world_size]:
+            ranks_free = [r for r in range(self.world_size) if len(rank_subsets[r]) < self.nsubsets_rank]
+            r = min(ranks_free, key=lambda r: rank_nsamples[r])
+            rank_subsets[r].append(subsets[isubset])
+            rank_nsamples[r] += nsamples[isubset]
+
+        # randomize the order of the subsets on each rank
+        return [[subsets_r[i] for i in rng.permutation(len(subsets_r))] for subsets_r in rank_subsets]
+
+    def set_subset_plan(self, batch_size: int, nepochs: int):
+        """
+        Set the data subsets to stream on this rank for all epochs (subset_plan) and the number of mini-batches per
+        epoch (nbatches_epoch). The latter must be the same for all ranks and epochs (steps_per_epoch), so it is given
+        by the minimum number of complete mini-batches over all ranks and epochs. Each subset gets a budget of
+        mini-batches where excess mini-batches are cut from the last subsets of an epoch.
+        :param batch_size: mini-batch size
+        :param nepochs: number of epochs
+        """
+        nepochs = int(nepochs)
+        all_subsets = [self.get_epoch_subsets(epoch) for epoch in range(nepochs)]
+        nbatches = [[[sum(self.nsamples_files[f] for f in subset) // batch_size for subset in subsets_r]
+                     for subsets_r in subsets_epoch] for subsets_epoch in all_subsets]
+        self.nbatches_epoch = int(min(sum(nbatches_r) for nbatches_epoch in nbatches for nbatches_r in nbatches_epoch))
+
+        if self.nbatches_epoch == 0:
+            raise ValueError(f"Not enough samples per rank to build a mini-batch of size {batch_size:d}.")
+
+        self.subset_plan = []
+        for epoch in range(nepochs):
+            budget = list(nbatches[epoch][self.rank])
+            excess = sum(budget) - self.nbatches_epoch
+            for i in reversed(range(len(budget))):
+                cut = min(excess, budget[i])
+                budget[i], excess = budget[i] - cut, excess - cut
+            for subset, nbatches_subset in zip(all_subsets[epoch][self.rank], budget):
+                self.subset_plan.append({"files": subset, "nbatches": nbatches_subset})
+
+        print(f"Rank {self.rank:d} streams {len(self.subset_plan):d} data subsets with {self.nbatches_epoch:d} " +
+              f"mini-batches per epoch.")
 
     @property
     def data_dir(self):
@@ -523,11 +1011,17 @@ class StreamMonthlyNetCDF(object):
 
     @file_list.setter
     def file_list(self, patt):
-        patt = patt if patt.endswith(".nc") else f"{patt}.nc"
-        files = glob.glob(os.path.join(self.data_dir, patt))
+        if isinstance(patt, (list, tuple)):
+            files = [f if os.path.isabs(f) else os.path.join(self.data_dir, f) for f in patt]
+            miss_files = [f for f in files if not os.path.isfile(f)]
+            if not files or miss_files:
+                raise FileNotFoundError(f"Empty file list parsed or could not find the following files: {*miss_files,}")
+        else:
+            patt = patt if patt.endswith(".nc") else f"{patt}.nc"
+            files = glob.glob(os.path.join(self.data_dir, patt))
 
-        if not files:
-            raise FileNotFoundError(f"Could not find any files with pattern '{patt}' under '{self.data_dir}'.")
+            if not files:
+                raise FileNotFoundError(f"Could not find any files with pattern '{patt}' under '{self.data_dir}'.")
 
         self._file_list = list(
             np.asarray(sorted(files, key=lambda s: int(re.search(r'\d+', os.path.basename(s)).group()))))
@@ -550,7 +1044,7 @@ class StreamMonthlyNetCDF(object):
 
     @sample_dim.setter
     def sample_dim(self, sample_dim):
-        if not sample_dim in self.ds_all.dims:
+        if not sample_dim in self.manifest.get_dims(self.file_list[0]):
             raise KeyError(f"Could not find dimension '{sample_dim}' in data.")
 
         self._sample_dim = sample_dim
@@ -582,8 +1076,7 @@ class StreamMonthlyNetCDF(object):
         self._predictand_list = self.check_and_choose_vars(selected_predictands, "_tar")
 
     def get_all_varnames(self):
-        ds_test = xr.open_dataset(self.file_list[0])
-        return list(ds_test.variables)
+        return self.manifest.get_varnames(self.file_list[0])
 
     def check_and_choose_vars(self, var_list: List[str], suffix: str = "*"):
         """
@@ -607,77 +1100,275 @@ class StreamMonthlyNetCDF(object):
         return selected_vars
 
     @staticmethod
-    def _process_one_netcdf(fname, data_norm, engine: str = "netcdf4", var_list: List = None, **kwargs):
+    def _process_one_netcdf(fname, data_norm, block_vars: List, sample_dim: str = "time", engine: str = "netcdf4",
+                            var_list: List = None, **kwargs):
+        with xr.open_dataset(fname, decode_cf=False, engine=engine, **kwargs) as ds_now:
+            if var_list: ds_now = ds_now[var_list]
+            data_block = StreamMonthlyNetCDF.ds_to_block(ds_now, block_vars, sample_dim)
+            block_dims = ds_now[block_vars[0]].transpose(sample_dim, ...).dims
+
+        # normalize in-place with cached normalization parameters
+        data_norm.normalize_block(data_block, block_vars, block_dims)
+
+        return data_block
+
+    @staticmethod
+    def _process_one_netcdf_shm(fname, data_norm, block_vars: List, sample_dim: str = "time",
+                                engine: str = "netcdf4", var_list: List = None, **kwargs):
+        """
+        Same as _process_one_netcdf, but the data block is written into a shared memory block to avoid pickling
+        when running in a worker process. The parent process takes ownership of the shared memory block,
+        i.e. it must unlink it after use (see _read_mfdataset).
+        :return: tuple of (name of shared memory block, shape of data block, data type of data block)
+        """
         with xr.open_dataset(fname, decode_cf=False, engine=engine, **kwargs) as ds_now:
             if var_list: ds_now = ds_now[var_list]
-            ds_now = StreamMonthlyNetCDF._preprocess_ds(ds_now, data_norm)
-            ds_now = ds_now.load()
-            return ds_now
+            da0 = ds_now[block_vars[0]].transpose(sample_dim, ...)
+            shape = (*da0.shape, len(block_vars))
+            dtype = np.dtype("float32")
+
+            shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * dtype.itemsize)
+            try:
+                data_block = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+                StreamMonthlyNetCDF.ds_to_block(ds_now, block_vars, sample_dim, out=data_block)
+                data_norm.normalize_block(data_block, block_vars, da0.dims)
+                del data_block
+            except Exception as err:
+                shm.close()
+                shm.unlink()
+                raise err
+
+        # avoid that the resource tracker of the worker removes the shared memory block
+        resource_tracker.unregister(shm._name, "shared_memory")
+        shm.close()
+
+        return shm.name, shape, dtype.str
 
     @staticmethod
-    def _preprocess_ds(ds, data_norm):
+    def _preprocess_ds(ds, data_norm, dtype: str = "float32"):
         ds = data_norm.normalize(ds)
-        return ds.astype("float32")
+        return ds.astype(get_np_dtype(dtype))
+
+    @staticmethod
+    def ds_to_block(ds: xr.Dataset, block_vars: List, sample_dim: str = "time", dtype: str = "float32",
+                    out: np.ndarray = None):
+        """
+        Convert dataset into one contiguous array with shape (sample_dim, ..., variables).
+        The variables are filled one by one into the pre-allocated array to avoid the full-size temporaries
+        of to_array, concat and transpose.
+        :param ds: the dataset (all variables must share the same dimensions)
+        :param block_vars: ordered list of variables to fill the last dimension (duplicates are allowed)
+        :param sample_dim: name of sample dimension which will become the first dimension
+        :param dtype: data type of the resulting array
+        :param out: optional pre-allocated array to fill (e.g. a view on shared memory), dtype is then ignored
+        :return: the data block as numpy array
+        """
+        da0 = ds[block_vars[0]].transpose(sample_dim, ...)
+        shape = (*da0.shape, len(block_vars))
+        if out is None:
+            data_block = np.empty(shape, dtype=dtype)
+        else:
+            assert out.shape == shape, f"Shape of out-array {out.shape} does not match data block shape {shape}."
+            data_block = out
+        for i, var in enumerate(block_vars):
+            data_block[..., i] = ds[var].transpose(*da0.dims).values
+
+        return data_block
 
     def _read_mfdataset(self, files, **kwargs):
+        """
+        Read and normalize (parallelized) a set of netCDF-files and concatenate the data blocks along the sample axis.
+        The data blocks of the files are float32 and cast to data_dtype when they are concatenated.
+        :param files: list of netCDF-files to read
+        :return: data block with shape (nsamples, ..., variables) and number of samples read from the files
+        """
+        # broadcast normalization parameters once such that the (pickled) normalization object carries them
+        _ = self.data_norm.get_block_params(self.block_vars, self.block_dims)
         # parallel processing of files incl. normalization
-        datasets = self.pool.map(partial(self._process_one_netcdf, data_norm=self.data_norm, **kwargs), files)
-        ds_all = xr.concat(datasets, dim=self.sample_dim)
-        # clean-up
-        del datasets
-        gc.collect()
-
-        return ds_all
+        if self.read_backend == "process":
+            results = self.pool.map(partial(self._process_one_netcdf_shm, data_norm=self.data_norm,
+                                            block_vars=self.block_vars, sample_dim=self.sample_dim, **kwargs), files)
+            # attach to shared memory blocks of the workers to get zero-copy views
+            shms = [shared_memory.SharedMemory(name=name) for name, _, _ in results]
+            blocks = [np.ndarray(shape, dtype=dtype, buffer=shm.buf) for shm, (_, shape, dtype) in zip(shms, results)]
+        else:
+            shms = []
+            blocks = self.pool.map(partial(self._process_one_netcdf, data_norm=self.data_norm,
+                                           block_vars=self.block_vars, sample_dim=self.sample_dim, **kwargs), files)
+        try:
+            nsamples = sum(block.shape[0] for block in blocks)
+            data_all = np.empty((nsamples, *blocks[0].shape[1:]), dtype=self.data_dtype)
+            istart = 0
+            for block in blocks:
+                data_all[istart:istart + block.shape[0]] = block
+                istart += block.shape[0]
+        finally:
+            # clean-up (views must be released before the shared memory blocks can be closed)
+            blocks, block = None, None
+            for shm in shms:
+                shm.close()
+                shm.unlink()
+            gc.collect()
+
+        return data_all, nsamples
 
     def read_netcdf(self, set_ind):
         set_ind = tf.keras.backend.get_value(set_ind)
         set_ind = int(str(set_ind).lstrip("b'").rstrip("'"))
-        set_ind = int(set_ind % self.nfiles_merged)
-        file_list_now = self.file_list_random[set_ind * self.nfiles2merge:(set_ind + 1) * self.nfiles2merge]
         il = int(self.iload_next % 2)
+
+        self.data_loaded[il] = self.load_subset(set_ind)
+        self.nbatches_loaded[il] = self.subset_plan[int(set_ind % len(self.subset_plan))]["nbatches"]
+        print(f"Dataset #{set_ind:d} ({il+1:d}/2) loaded.")
+        self.iload_next = il + 1
+
+        return il
+
+    def load_subset(self, set_ind: int):
+        """
+        Read and normalize a data subset comprising nfiles2merge netCDF-files into memory.
+        The data block holds the actual number of samples of the subset (no padding).
+        :param set_ind: index of data subset in subset_plan (see set_subset_plan)
+        :return: data block of the subset
+        """
+        if self.subset_plan is None:
+            raise AttributeError("subset_plan is not set. Run set_subset_plan first.")
+
+        set_ind = int(set_ind % len(self.subset_plan))
+        file_list_now = self.subset_plan[set_ind]["files"]
         # read the normalized data into memory
         # ds_now = xr.open_mfdataset(list(file_list_now), decode_cf=False, data_vars=self.all_vars,
         #                           preprocess=partial(self._preprocess_ds, data_norm=self.data_norm),
         #                           parallel=True).load()
         t0 = timer()
-        data_now = self._read_mfdataset(file_list_now, var_list=self.all_vars).copy()
-        nsamples = data_now.dims[self.sample_dim]
-
-        if nsamples < self.samples_merged:
-            t1 = timer()
-            add_samples = self.samples_merged - nsamples
-            istart = random.randint(0, self.samples_merged - add_samples - 1)
-            # slice data from data_now...
-            ds_add = data_now.isel({self.sample_dim: slice(istart, istart+add_samples)})
-            if ds_add.dims[self.sample_dim] != add_samples:
-                print("WARNING: ds_add contains inconsistent number of samples. Re-try...")
-                add_samples = self.samples_merged - nsamples
-                istart = random.randint(0, self.samples_merged - add_samples - 1)
-                ds_add = data_now.isel({self.sample_dim: slice(istart, istart + add_samples)})
-            # ... and modify underlying sample-dimension to allow clean concatenation
-            ds_add[self.sample_dim] = data_now[self.sample_dim][-1].values + 1 + np.arange(add_samples)
-            ds_add[self.sample_dim] = ds_add[self.sample_dim].assign_attrs(data_now[self.sample_dim].attrs)
-            data_now = xr.concat([data_now, ds_add], dim=self.sample_dim)
-            print(f"Appending data with {add_samples:d} samples took {timer() - t1:.2f}s" +
-                  f"(total #samples: {data_now.dims[self.sample_dim]})")
-            # free memory
-            free_mem([ds_add, add_samples, istart])
-
-        self.data_loaded[il] = data_now
+        data_now, nsamples = self._read_mfdataset(file_list_now, var_list=self.all_vars)
+
         # timing
         t_read = timer() - t0
         self.reading_times.append(t_read)
         self.ds_proc_size += data_now.nbytes
-        print(f"Dataset #{set_ind:d} ({il+1:d}/2) reading time: {t_read:.2f}s.")
-        self.iload_next = il + 1
-        # free memory
-        free_mem([nsamples, t_read, data_now])
+        print(f"Dataset #{set_ind:d} ({nsamples:d} samples) reading time: {t_read:.2f}s.")
 
-        return il
+        return data_now
 
     def choose_data(self, _):
         ik = int(self.iuse_next % 2)
         self.data_now = self.data_loaded[ik]
         print(f"Use data subset {ik:d}...")
         self.iuse_next = ik + 1
-        return True
+        return self.data_now.shape[0], self.nbatches_loaded[ik]
+
+    def start_loader(self, n_reads: int):
+        """
+        Start the background thread that reads the data subsets into a bounded queue.
+        The thread blocks as long as the queue is full, i.e. prefetch_depth subsets are ready for use.
+        :param n_reads: total number of data subsets to read
+        """
+        if self.loader is not None and self.loader.is_alive():
+            raise RuntimeError("Background loader is already running.")
+
+        self.stop_event.clear()
+        self.loader = threading.Thread(target=self._loader_loop, args=(n_reads,), daemon=True)
+        self.loader.start()
+        print(f"Started background loader with prefetch depth {self.prefetch_depth:d} " +
+              f"(data subset size: {self.subset_size / 1.e+09:.2f} GB).")
+
+    def stop_loader(self, timeout: float = 10.):
+        """
+        Stop the background loader and clear the queue to release memory.
+        The end of the data stream is signalled to the queue so that a consumer waiting in next_subset is released.
+        :param timeout: timeout in seconds to wait for the loader thread
+        """
+        self.stop_event.set()
+        # empty queue to release a loader which is blocked on a full queue
+        self._clear_queue()
+        if self.loader is not None:
+            self.loader.join(timeout)
+        self.loader = None
+        # remove a data subset which has been queued while stopping
+        self._clear_queue()
+        try:
+            self.data_queue.put_nowait(self.end_of_stream)
+        except queue.Full:
+            pass
+
+    def _clear_queue(self):
+        while not self.data_queue.empty():
+            try:
+                self.data_queue.get_nowait()
+            except queue.Empty:
+                break
+
+    def _loader_loop(self, n_reads: int):
+        for i in range(n_reads):
+            if self.stop_event.is_set():
+                break
+            try:
+                item = (self.load_subset(i), self.subset_plan[i % len(self.subset_plan)]["nbatches"])
+            except Exception as err:
+                # the error is raised by the consumer (see next_subset)
+                item = err
+            while not self.stop_event.is_set():
+                try:
+                    self.data_queue.put(item, timeout=1.)
+                    break
+                except queue.Full:
+                    continue
+            if isinstance(item, Exception):
+                break
+            del item
+        # signal the end of the data stream (also after an error) to the consumer
+        while not self.stop_event.is_set():
+            try:
+                self.data_queue.put(self.end_of_stream, timeout=1.)
+                break
+            except queue.Full:
+                continue
+
+    def next_subset(self, _):
+        """
+        Fetch the next data subset from the queue of the background loader and make it the data subset in use.
+        The time waiting for the data (stall time) and the time spent on the previous data subset (compute time)
+        are tracked.
+        At the end of the data stream, StopIteration is raised which ends the TF dataset (OutOfRangeError).
+        :return: number of samples and budget of mini-batches of the data subset
+        """
+        t0 = timer()
+        if self.t_last_switch is not None:
+            self.compute_times.append(t0 - self.t_last_switch)
+
+        # release the previous data subset before waiting
+        self.data_now = None
+        item = self.data_queue.get()
+        if item is self.end_of_stream:
+            # keep the marker for further calls, e.g. by parallel map-calls of the TF dataset
+            self.data_queue.put(item)
+            raise StopIteration("End of data stream reached.")
+        if isinstance(item, Exception):
+            raise item
+        self.data_now, nbatches = item
+
+        self.t_last_switch = timer()
+        self.stall_times.append(self.t_last_switch - t0)
+        print(f"Use next data subset (stall time: {self.stall_times[-1]:.2f}s, queued: {self.data_queue.qsize():d})")
+
+        return self.data_now.shape[0], nbatches
+
+    def get_stream_stats(self):
+        """
+        Get statistics on the data stream to evaluate if reading keeps up with training.
+        If the mean reading time exceeds the mean compute time per data subset, training stalls regardless of the
+        prefetch depth. In this case, nfiles2merge (and thus the compute time per subset) should be increased or more
+        workers should be used for reading.
+        :return: dictionary with statistics
+        """
+        stall_tot, compute_tot = np.sum(self.stall_times), np.sum(self.compute_times)
+        mean_read = np.mean(self.reading_times) if self.reading_times else np.nan
+        mean_compute = np.mean(self.compute_times) if self.compute_times else np.nan
+
+        stream_stats = {"total stall time": stall_tot, "total compute time": compute_tot,
+                        "stall fraction": stall_tot / max(stall_tot + compute_tot, 1.e-12),
+                        "mean reading time per subset": mean_read, "mean compute time per subset": mean_compute,
+                        "read-compute ratio": mean_read / mean_compute, "prefetch depth": self.prefetch_depth}
+
+        return stream_stats
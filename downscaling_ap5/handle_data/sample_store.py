@@ -0,0 +1,192 @@
+# SPDX-FileCopyrightText: 2023 Earth System Data Exploration (ESDE), Jülich Supercomputing Center (JSC)
+#
+# SPDX-License-Identifier: MIT
+
+"""
+Binary sample store for training: Normalized samples are written once into fixed-size shard files
+which are memory-mapped for training. A small JSON-file serves as index of the store.
+"""
+
+__author__ = "agent"
+__email__ = "agent@local"
+__date__ = "2026-10-18"
+__update__ = "2026-10-18"
+
+import os
+import json as js
+from functools import partial
+from typing import List
+from timeit import default_timer as timer
+import multiprocessing
+import numpy as np
+import xarray as xr
+from abstract_data_normalization import Normalize
+from all_normalizations import ZScore
+from other_utils import to_list
+
+
+class SampleStore(object):
+    """
+    Memory-mapped sample store. Each sample has the shape (..., channels) where the channels are ordered as
+    [var_tar2in, *predictors, *predictands] (see StreamMonthlyNetCDF.get_block_vars).
+    """
+    index_file = "index.json"
+    norm_file = "norm.json"
+
+    def __init__(self, store_dir: str):
+        """
+        Open an existing sample store.
+        :param store_dir: directory of the sample store
+        """
+        self.store_dir = store_dir
+        index_file = os.path.join(self.store_dir, SampleStore.index_file)
+        if not os.path.isfile(index_file):
+            raise FileNotFoundError(f"Could not find index-file of sample store under '{index_file}'.")
+
+        with open(index_file, "r") as jsf:
+            self.index = js.load(jsf)
+
+        self.channels = self.index["channels"]
+        self.predictors, self.predictands = self.index["predictors"], self.index["predictands"]
+        self.var_tar2in = self.index["var_tar2in"]
+        self.n_predictands = len(self.predictands)
+        self.n_predictors = len(self.channels) - self.n_predictands
+        self.sample_shape = tuple(self.index["sample_shape"])
+        self.dtype = np.dtype(self.index["dtype"])
+        self.shard_sizes = np.array([shard["nsamples"] for shard in self.index["shards"]])
+        self.shard_offsets = np.concatenate([[0], np.cumsum(self.shard_sizes)])
+        self.nsamples = int(self.shard_offsets[-1])
+        self.nbytes = self.nsamples * int(np.prod(self.sample_shape)) * self.dtype.itemsize
+        self.shards = [np.memmap(os.path.join(self.store_dir, shard["file"]), dtype=self.dtype, mode="r",
+                                 shape=(shard["nsamples"], *self.sample_shape)) for shard in self.index["shards"]]
+
+    def __len__(self):
+        return self.nsamples
+
+    def getitems(self, indices):
+        """
+        Gather samples from the memory-mapped shards. Only the pages of the requested samples are read from disk.
+        :param indices: global indices of samples
+        :return: array of shape (len(indices), *sample_shape)
+        """
+        indices = np.asarray(indices)
+        ishards = np.searchsorted(self.shard_offsets, indices, side="right") - 1
+        data = np.empty((len(indices), *self.sample_shape), dtype=self.dtype)
+
+        for ishard in np.unique(ishards):
+            mask = ishards == ishard
+            local_inds = indices[mask] - self.shard_offsets[ishard]
+            # sorted access to the memory-mapped file is more efficient
+            isort = np.argsort(local_inds)
+            data[np.nonzero(mask)[0][isort]] = self.shards[ishard][local_inds[isort]]
+
+        return data
+
+    def get_norm_obj(self, norm_dims: List) -> Normalize:
+        """
+        Get normalization object with the parameters used to normalize the data of the store.
+        :param norm_dims: dimensions over which data has been normalized
+        :return: normalization object
+        """
+        data_norm = ZScore(norm_dims)
+        data_norm.read_norm_from_file(os.path.join(self.store_dir, SampleStore.norm_file))
+
+        return data_norm
+
+    def get_times(self):
+        """
+        Get the time coordinates of all samples in the store.
+        :return: numpy-array of datetime64-objects
+        """
+        return np.concatenate([np.array(shard["times"], dtype="datetime64[ns]") for shard in self.index["shards"]])
+
+    @staticmethod
+    def compile(files: List, store_dir: str, data_norm: Normalize, predictands: List, predictors: List,
+                var_tar2in: str = None, sample_dim: str = "time", dtype: str = "float32",
+                samples_per_shard: int = 2048, nworkers: int = 10):
+        """
+        Compile a sample store from a set of netCDF-files. The data is normalized and written to shards with
+        samples_per_shard samples each (the last shard may be smaller).
+        :param files: list of netCDF-files (samples are stored in the order of the files)
+        :param store_dir: directory of the sample store to create
+        :param data_norm: normalization object (normalization parameters must be available)
+        :param predictands: list of predictand variables
+        :param predictors: list of predictor variables
+        :param var_tar2in: predictand variable that is also used as input
+        :param sample_dim: name of sample dimension
+        :param dtype: data type of stored samples (float32 or float16)
+        :param samples_per_shard: number of samples per shard file
+        :param nworkers: number of worker processes to read and normalize the netCDF-files
+        :return: SampleStore instance of the compiled store
+        """
+        # import here to avoid circular imports
+        from handle_data_class import StreamMonthlyNetCDF
+
+        method = SampleStore.compile.__name__
+
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"%{method}: Unsupported data type '{dtype}'. Choose either 'float32' or 'float16'.")
+
+        os.makedirs(store_dir, exist_ok=True)
+        t0 = timer()
+
+        channels = to_list(var_tar2in) + list(predictors) + list(predictands) if var_tar2in is not None else \
+            list(predictors) + list(predictands)
+        all_vars = list(predictors) + list(predictands)
+
+        # get number of samples and time coordinates
+        times = []
+        for f in files:
+            with xr.open_dataset(f) as ds:
+                times.append(np.datetime_as_string(ds[sample_dim].values, unit="s"))
+                sample_dims = ds[channels[0]].transpose(sample_dim, ...).dims
+                sample_shape = (*ds[channels[0]].transpose(sample_dim, ...).shape[1:], len(channels))
+        times = np.concatenate(times)
+        nsamples = len(times)
+        nshards = int(np.ceil(nsamples / samples_per_shard))
+
+        # broadcast normalization parameters once such that the (pickled) normalization object carries them
+        _ = data_norm.get_block_params(channels, sample_dims)
+        data_norm.save_norm_to_file(os.path.join(store_dir, SampleStore.norm_file))
+
+        shards = []
+        for ishard in range(nshards):
+            nsamples_shard = min(samples_per_shard, nsamples - ishard * samples_per_shard)
+            shards.append({"file": f"shard_{ishard:05d}.bin", "nsamples": nsamples_shard,
+                           "times": list(times[ishard * samples_per_shard: ishard * samples_per_shard + nsamples_shard])})
+
+        print(f"%{method}: Write {nsamples:d} samples of shape {sample_shape} to {nshards:d} shards under '{store_dir}'.")
+        func_read = partial(StreamMonthlyNetCDF._process_one_netcdf, data_norm=data_norm, block_vars=channels,
+                            sample_dim=sample_dim, var_list=all_vars)
+
+        ishard, istart, mm = -1, 0, None
+        with multiprocessing.Pool(nworkers) as pool:
+            # imap preserves the order of the files
+            for data_block in pool.imap(func_read, files):
+                iblock = 0
+                while iblock < data_block.shape[0]:
+                    if mm is None or istart == shards[ishard]["nsamples"]:
+                        if mm is not None: mm.flush()
+                        ishard += 1
+                        mm = np.memmap(os.path.join(store_dir, shards[ishard]["file"]), dtype=dtype, mode="w+",
+                                       shape=(shards[ishard]["nsamples"], *sample_shape))
+                        istart = 0
+                    ncopy = min(data_block.shape[0] - iblock, shards[ishard]["nsamples"] - istart)
+                    mm[istart:istart + ncopy] = data_block[iblock:iblock + ncopy]
+                    istart, iblock = istart + ncopy, iblock + ncopy
+        if mm is not None:
+            mm.flush()
+            del mm
+
+        index = {"channels": channels, "predictors": list(predictors), "predictands": list(predictands),
+                 "var_tar2in": var_tar2in, "sample_dim": sample_dim, "sample_dims": list(sample_dims[1:]),
+                 "sample_shape": list(sample_shape), "dtype": dtype, "norm_file": SampleStore.norm_file,
+                 "source_files": [os.path.basename(f) for f in files], "shards": shards}
+
+        # the index-file is written last to mark the store as complete
+        with open(os.path.join(store_dir, SampleStore.index_file), "w") as jsf:
+            js.dump(index, jsf)
+
+        print(f"%{method}: Compiling the sample store took {timer() - t0:.2f}s.")
+
+        return SampleStore(store_dir)
@@ -0,0 +1,85 @@
+# SPDX-FileCopyrightText: 2023 Earth System Data Exploration (ESDE), Jülich Supercomputing Center (JSC)
+#
+# SPDX-License-Identifier: MIT
+
+"""
+Driver-script to compile the (monthly) training netCDF-files into a memory-mapped sample store.
+The store directory can then be set with the key 'sample_store' in the dataset configuration for training.
+"""
+
+__author__ = "agent"
+__email__ = "agent@local"
+__date__ = "2026-10-18"
+__update__ = "2026-10-18"
+
+import os
+import glob
+import argparse
+import json as js
+from datetime import datetime as dt
+from timeit import default_timer as timer
+import xarray as xr
+from all_normalizations import ZScore
+from handle_data_class import HandleDataClass, get_dataset_filename
+from sample_store import SampleStore
+
+
+def main(parser_args):
+    t0 = timer()
+
+    with parser_args.conf_ds as dsf:
+        ds_dict = js.load(dsf)
+
+    fname_or_patt = get_dataset_filename(parser_args.input_dir, parser_args.dataset.lower(), "train",
+                                         ds_dict.get("laugmented", False))
+    if "*" in fname_or_patt:
+        patt = fname_or_patt if fname_or_patt.endswith(".nc") else f"{fname_or_patt}.nc"
+        files = sorted(glob.glob(os.path.join(parser_args.input_dir, patt)))
+    else:
+        files = [fname_or_patt]
+
+    if not files:
+        raise FileNotFoundError(f"Could not find any training data files under '{parser_args.input_dir}'.")
+
+    # get normalization parameters
+    data_norm = ZScore(ds_dict["norm_dims"])
+    if parser_args.js_norm:
+        data_norm.read_norm_from_file(parser_args.js_norm)
+    else:
+        _ = data_norm.get_stats_from_files(files, nworkers=parser_args.nworkers, norm_cache=ds_dict.get("norm_cache"))
+
+    with xr.open_dataset(files[0]) as ds:
+        predictors, predictands = HandleDataClass.get_in_tar_vars(list(ds.data_vars), ds_dict["predictands"],
+                                                                   ds_dict.get("predictors", None))
+
+    store = SampleStore.compile(files, parser_args.output_dir, data_norm, predictands, predictors,
+                                var_tar2in=ds_dict.get("var_tar2in", None), dtype=parser_args.dtype,
+                                samples_per_shard=parser_args.samples_per_shard, nworkers=parser_args.nworkers)
+
+    print(f"Sample store with {store.nsamples:d} samples ({store.nbytes / 1.e+09:.2f} GB) created under " +
+          f"'{parser_args.output_dir}'.")
+    print(f"Total runtime: {timer() - t0:.1f}s")
+    print("Finished job at {0}".format(dt.strftime(dt.now(), "%Y-%m-%d %H:%M:%S")))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input_dir", "-in", dest="input_dir", type=str, required=True,
+                        help="Directory where input netCDF-files are stored.")
+    parser.add_argument("--output_dir", "-out", dest="output_dir", type=str, required=True,
+                        help="Directory of the sample store to create.")
+    parser.add_argument("--downscaling_dataset", "-dataset", dest="dataset", type=str, required=True,
+                        help="Name of dataset to be used for downscaling model.")
+    parser.add_argument("--configuration_dataset", "-conf_ds", dest="conf_ds", type=argparse.FileType("r"),
+                        required=True, help="JSON-file to configure dataset to be used for training.")
+    parser.add_argument("--json_norm_file", "-js_norm", dest="js_norm", type=str, default=None,
+                        help="JSON-file providing normalization parameters.")
+    parser.add_argument("--dtype", "-dtype", dest="dtype", type=str, default="float32", choices=["float32", "float16"],
+                        help="Data type of the stored samples.")
+    parser.add_argument("--samples_per_shard", "-nshard", dest="samples_per_shard", type=int, default=2048,
+                        help="Number of samples per shard file.")
+    parser.add_argument("--nworkers", "-nw", dest="nworkers", type=int, default=10,
+                        help="Number of workers to read netCDF-files.")
+
+    args = parser.parse_args()
+    main(args)
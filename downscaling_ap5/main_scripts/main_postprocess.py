@@ -9,22 +9,28 @@ Driver-script to perform inference on trained downscaling models.
 __author__ = "Michael Langguth"
 __email__ = "m.langguth@fz-juelich.de"
 __date__ = "2022-12-08"
-__update__ = "2022-12-08"
+__update__ = "2026-10-18"
 
 import os, sys, glob
+import importlib.util
 import logging
 import argparse
+from typing import List
 from timeit import default_timer as timer
 import json as js
 import numpy as np
 import xarray as xr
+import dask
 import tensorflow.keras as keras
 import matplotlib as mpl
 from handle_data_unet import *
 from handle_data_class import HandleDataClass, get_dataset_filename
 from all_normalizations import ZScore
-from statistical_evaluation import Scores
+from statistical_evaluation import Scores, get_dask_config
 from postprocess import get_model_info, run_evaluation_time, run_evaluation_spatial
+from plotting import PlotPool
+from inference_utils import predict_tiled, stream_inference
+from other_utils import to_list
 from datetime import datetime as dt
 
 # get logger
@@ -33,6 +39,83 @@ logger.setLevel(logging.INFO)
 formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s: %(message)s')
 
 
+def get_input_data(da: xr.DataArray, predictands: List, var_tar2in: str = None) -> np.ndarray:
+    """
+    Get the input data for the model as numpy-array with the variables constituting the last dimension.
+    NOTE: var_tar2in must be placed first (see StreamMonthlyNetCDF.getitems)
+    :param da: normalized data-array with variables-dimension (see HandleDataClass.reshape_ds)
+    :param predictands: list of predictand variables
+    :param var_tar2in: name of target variable to be added to the input
+    :return: input data with shape (time, ..., variables)
+    """
+    invars, _ = HandleDataClass.get_in_tar_vars(list(da["variables"].values), predictands)
+    if var_tar2in is not None:
+        invars = to_list(var_tar2in) + invars
+
+    return da.sel({"variables": invars}).transpose("time", ..., "variables").values
+
+
+def denormalize_prediction(y_pred_trans, da_tar: xr.DataArray, norm, tar_varname: str,
+                           z_branch: bool = False) -> xr.DataArray:
+    """
+    Denormalize the model output and convert it to a data-array with the coordinates of the target data.
+    :param y_pred_trans: model output (numpy-array or list of arrays for models with multiple outputs)
+    :param da_tar: normalized target data with variables-dimension (provides coordinates and dimensions)
+    :param norm: normalization object
+    :param tar_varname: name of target variable
+    :param z_branch: flag if the model has a z-branch (only the first channel is retained)
+    :return: denormalized prediction as data-array
+    """
+    # get coordinates and dimensions from target data
+    slice_dict = {"variables": 0} if z_branch else {}
+    da_tar_now = da_tar.isel(slice_dict)
+    # only squeeze the variables-dimension since other singleton dimensions (e.g. time of a remainder chunk) must persist
+    if "variables" in da_tar_now.dims and da_tar_now.sizes["variables"] == 1:
+        da_tar_now = da_tar_now.squeeze("variables", drop=True)
+    coords, dims = da_tar_now.coords, da_tar_now.dims
+    if z_branch:
+        # slice data to get first channel only
+        if isinstance(y_pred_trans, list): y_pred_trans = y_pred_trans[0]
+        y_pred_trans = y_pred_trans[..., 0]
+    # perform denormalization in-place on the numpy-array with (cached) broadcasted normalization parameters
+    if "variables" in dims:
+        varnames_pred, data_dims = list(da_tar_now["variables"].values), dims[:-1]
+    else:
+        varnames_pred, data_dims = [tar_varname], dims
+    y_pred_trans = np.asarray(y_pred_trans, dtype="float32").reshape(*da_tar_now.shape[:len(data_dims)], -1)
+    y_pred_trans = norm.denormalize_block(y_pred_trans, varnames_pred, data_dims)
+
+    return xr.DataArray(y_pred_trans.reshape(da_tar_now.shape), coords=coords, dims=dims)
+
+
+def get_output_ds(y_pred: xr.DataArray, ground_truth: xr.DataArray, tar_varname: str) -> xr.Dataset:
+    ground_truth.name, y_pred.name = f"{tar_varname}_ref", f"{tar_varname}_fcst"
+
+    return xr.Dataset(xr.Dataset.merge(y_pred.to_dataset(), ground_truth.to_dataset()))
+
+
+def check_disjoint_times(files: List, engine: str = None, time_dim: str = "time"):
+    """
+    Check if the time ranges of several files of inference data are disjoint, i.e. if the files can be concatenated
+    along the time dimension.
+    :param files: list of netCDF-files or Zarr-stores
+    :param engine: engine to open the files (see xarray.open_dataset)
+    :param time_dim: name of time dimension
+    """
+    time_ranges = []
+    for f in files:
+        with xr.open_dataset(f, engine=engine, chunks={}) as ds:
+            times = ds[time_dim].values
+            time_ranges.append((times.min(), times.max(), f))
+
+    time_ranges = sorted(time_ranges, key=lambda t_range: t_range[0])
+    for (_, tend_prev, f_prev), (tstart, _, f) in zip(time_ranges[:-1], time_ranges[1:]):
+        if tstart <= tend_prev:
+            raise ValueError(f"The time ranges of the inference data in '{f_prev}' and '{f}' overlap. " +
+                             "Only inference data of disjoint time periods (e.g. of different test years) can be " +
+                             "evaluated together.")
+
+
 def main(parser_args):
 
     t0 = timer()
@@ -45,7 +128,7 @@ def main(parser_args):
 
     # create output-directory and set name of netCDF-file to store inference data
     os.makedirs(plt_dir, exist_ok=True)
-    ncfile_out = os.path.join(plt_dir, "postprocessed_ds_test.nc")
+    ncfile_out = os.path.join(plt_dir, f"postprocessed_ds_test.{'zarr' if parser_args.lzarr else 'nc'}")
     # create logger handlers
     logfile = os.path.join(plt_dir, f"postprocessing_{parser_args.exp_name}.log")
     if os.path.isfile(logfile): os.remove(logfile)
@@ -104,79 +187,132 @@ def main(parser_args):
     tar_varname = ds_dict["predictands"][0]
     logger.info(f"Variable {tar_varname} serves as ground truth data.")
 
-    with xr.open_dataset(fdata_test) as ds_test:
-        ground_truth = ds_test[tar_varname].astype("float32", copy=False)
-        ds_test = norm.normalize(ds_test)
+    def predict(data_in: np.ndarray):
+        if parser_args.tile_size:
+            return predict_tiled(trained_model, data_in, parser_args.tile_size, parser_args.tile_overlap,
+                                 batch_size=ds_dict["batch_size"], window=parser_args.blend_window)
+        else:
+            return trained_model.predict(data_in, batch_size=ds_dict["batch_size"], verbose=0)
 
-    # prepare training and validation data
-    logger.info(f"Start preparing test dataset...")
-    t0_preproc = timer()
+    def process_chunk(ds_chunk: xr.Dataset) -> xr.Dataset:
+        ground_truth_chunk = ds_chunk[tar_varname].astype("float32", copy=False)
+        da_chunk = HandleDataClass.reshape_ds(norm.normalize(ds_chunk).astype("float32", copy=False))
+        data_chunk_in = get_input_data(da_chunk, ds_dict["predictands"], ds_dict["var_tar2in"])
+        _, da_chunk_tar = HandleDataClass.split_in_tar(da_chunk, predictands=ds_dict["predictands"])
 
-    da_test = HandleDataClass.reshape_ds(ds_test.astype("float32", copy=False))
-    tfds_test = HandleDataClass.make_tf_dataset_allmem(da_test.astype("float32", copy=True), ds_dict["batch_size"],
-                                                       ds_dict["predictands"], lshuffle=False, var_tar2in=ds_dict["var_tar2in"],
-                                                       named_targets=named_targets, lrepeat=False, drop_remainder=False)
+        y_pred_chunk = denormalize_prediction(predict(data_chunk_in), da_chunk_tar, norm, tar_varname,
+                                              hparams_dict["z_branch"])
 
-    # perform normalization
-    da_test_in, da_test_tar = HandleDataClass.split_in_tar(da_test, predictands=ds_dict["predictands"])
+        return get_output_ds(y_pred_chunk, ground_truth_chunk, tar_varname)
 
-    # start inference
-    logger.info(f"Preparation of test dataset finished after {timer() - t0_preproc:.2f}s. " +
-                 "Start inference on trained model...")
     t0_train = timer()
-    y_pred_trans = trained_model.predict(tfds_test, verbose=2)
-
-    logger.info(f"Inference on test dataset finished. Start denormalization of output data...")
-    # get coordinates and dimensions from target data
-    slice_dict = {"variables": 0} if hparams_dict["z_branch"] else {}
-    coords = da_test_tar.isel(slice_dict).squeeze().coords
-    dims = da_test_tar.isel(slice_dict).squeeze().dims
-    if hparams_dict["z_branch"]:
-        # slice data to get first channel only
-        if isinstance(y_pred_trans, list): y_pred_trans = y_pred_trans[0]
-        y_pred = xr.DataArray(y_pred_trans[..., 0].squeeze(), coords=coords, dims=dims)
+    if parser_args.chunk_size:
+        # read, predict and write the test dataset in chunks (I/O overlaps with inference)
+        logger.info(f"Start streaming inference on trained model with chunks of {parser_args.chunk_size:d} samples...")
+        stream_inference(fdata_test, ncfile_out, process_chunk, parser_args.chunk_size)
+        # open inference data lazily, so that the evaluation is performed chunk by chunk
+        chunks_eval = {"time": parser_args.eval_chunk_size}
+        ds = xr.open_zarr(ncfile_out, chunks=chunks_eval) if parser_args.lzarr else \
+            xr.open_dataset(ncfile_out, chunks=chunks_eval)
+        y_pred, ground_truth = ds[f"{tar_varname}_fcst"], ds[f"{tar_varname}_ref"]
     else:
-        # no slicing required
-        y_pred = xr.DataArray(y_pred_trans.squeeze(), coords=coords, dims=dims)
-    # perform denormalization
-    y_pred = norm.denormalize(y_pred.squeeze(), varname=tar_varname)
-
-    # write inference data to netCDf
-    logger.info(f"Write inference data to netCDF-file '{ncfile_out}'")
-    ground_truth.name, y_pred.name = f"{tar_varname}_ref", f"{tar_varname}_fcst"
-    ds = xr.Dataset(xr.Dataset.merge(y_pred.to_dataset(), ground_truth.to_dataset()))
-    ds.to_netcdf(ncfile_out)
+        with xr.open_dataset(fdata_test) as ds_test:
+            ground_truth = ds_test[tar_varname].astype("float32", copy=False)
+            ds_test = norm.normalize(ds_test)
+
+        # prepare training and validation data
+        logger.info(f"Start preparing test dataset...")
+        t0_preproc = timer()
+
+        da_test = HandleDataClass.reshape_ds(ds_test.astype("float32", copy=False))
+        if parser_args.tile_size:
+            data_test_in = get_input_data(da_test, ds_dict["predictands"], ds_dict["var_tar2in"])
+        else:
+            tfds_test = HandleDataClass.make_tf_dataset_allmem(da_test.astype("float32", copy=True),
+                                                               ds_dict["batch_size"], ds_dict["predictands"],
+                                                               lshuffle=False, var_tar2in=ds_dict["var_tar2in"],
+                                                               named_targets=named_targets, lrepeat=False,
+                                                               drop_remainder=False)
+
+        # perform normalization
+        da_test_in, da_test_tar = HandleDataClass.split_in_tar(da_test, predictands=ds_dict["predictands"])
+
+        # start inference
+        logger.info(f"Preparation of test dataset finished after {timer() - t0_preproc:.2f}s. " +
+                     "Start inference on trained model...")
+        t0_train = timer()
+        if parser_args.tile_size:
+            y_pred_trans = predict(data_test_in)
+        else:
+            y_pred_trans = trained_model.predict(tfds_test, verbose=2)
+
+        logger.info(f"Inference on test dataset finished. Start denormalization of output data...")
+        y_pred = denormalize_prediction(y_pred_trans, da_test_tar, norm, tar_varname, hparams_dict["z_branch"])
+
+        # write inference data to netCDf
+        logger.info(f"Write inference data to netCDF-file '{ncfile_out}'")
+        ds = get_output_ds(y_pred, ground_truth, tar_varname)
+        if parser_args.lzarr:
+            ds.to_zarr(ncfile_out, mode="w")
+        else:
+            ds.to_netcdf(ncfile_out)
+        y_pred, ground_truth = ds[f"{tar_varname}_fcst"], ds[f"{tar_varname}_ref"]
 
     # start evaluation
     logger.info(f"Output data on test dataset successfully processed in {timer()-t0_train:.2f}s. Start evaluation...")
 
-    # instantiate score engine for time evaluation (i.e. hourly time series of evalutaion metrics)
+    # configure local dask-scheduler for the evaluation of lazily opened data
+    dask.config.set(**get_dask_config(parser_args.dask_scheduler, parser_args.nworkers_eval))
+    if parser_args.eval_files:
+        # evaluate inference data of further runs together with the current run (opened lazily in time chunks)
+        files_eval = sorted(set([ncfile_out] + [f for pattern in parser_args.eval_files
+                                                for f in glob.glob(os.path.expandvars(pattern))]))
+        logger.info(f"Evaluate inference data from {len(files_eval):d} files: {', '.join(files_eval)}")
+        engine_eval = "zarr" if all(f.endswith(".zarr") for f in files_eval) else None
+        # the files are concatenated along the time dimension and must share the same grid
+        check_disjoint_times(files_eval, engine_eval)
+        ds = xr.open_mfdataset(files_eval, chunks={"time": parser_args.eval_chunk_size}, combine="by_coords",
+                               join="exact", engine=engine_eval)
+        y_pred, ground_truth = ds[f"{tar_varname}_fcst"], ds[f"{tar_varname}_ref"]
+
+    # start pool for rendering the plots (the workers are spawned while the evaluation metrics are computed)
+    plot_pool = PlotPool(parser_args.nworkers_plot)
+
+    # compute all evaluation metrics in a single pass over the data, i.e. domain-averaged time series for the
+    # temporal evaluation and metrics at each grid point for the spatial evaluation
     score_engine = Scores(y_pred, ground_truth, ds_dict["norm_dims"][1:])
+    metrics_time, metrics_spatial = ["rmse", "bias", "grad_amplitude"], ["rmse", "bias"]
+    t0_scores = timer()
+    ds_scores = score_engine.compute_all(metrics_time, reduce_dims={"time": ds_dict["norm_dims"][1:], "spatial": []},
+                                         chunk_size=parser_args.eval_chunk_size, scheduler=parser_args.dask_scheduler,
+                                         nworkers=parser_args.nworkers_eval)
+    scores_time = xr.Dataset({metric: ds_scores[f"{metric}_time"] for metric in metrics_time})
+    scores_spatial = xr.Dataset({metric: ds_scores[f"{metric}_spatial"] for metric in metrics_spatial})
+    logger.info(f"Evaluation metrics computed in {timer() - t0_scores:.2f}s.")
 
     logger.info("Start temporal evaluation...")
     t0_tplot = timer()
-    _ = run_evaluation_time(score_engine, "rmse", "K", plt_dir, value_range=(0., 3.), model_type=model_type)
-    _ = run_evaluation_time(score_engine, "bias", "K", plt_dir, value_range=(-1., 1.), ref_line=0.,
+    _ = run_evaluation_time(scores_time, "rmse", "K", plt_dir, plot_pool, value_range=(0., 3.), model_type=model_type)
+    _ = run_evaluation_time(scores_time, "bias", "K", plt_dir, plot_pool, value_range=(-1., 1.), ref_line=0.,
                             model_type=model_type)
-    _ = run_evaluation_time(score_engine, "grad_amplitude", "1", plt_dir, value_range=(0.7, 1.1),
+    _ = run_evaluation_time(scores_time, "grad_amplitude", "1", plt_dir, plot_pool, value_range=(0.7, 1.1),
                             ref_line=1., model_type=model_type)
 
     logger.info(f"Temporal evalutaion finished in {timer() - t0_tplot:.2f}s.")
 
-    # instantiate score engine with retained spatial dimensions
-    score_engine = Scores(y_pred, ground_truth, [])
-
     logger.info("Start spatial evaluation...")
     lvl_rmse = np.arange(0., 3.1, 0.2)
     cmap_rmse = mpl.cm.afmhot_r(np.linspace(0., 1., len(lvl_rmse)))
-    _ = run_evaluation_spatial(score_engine, "rmse", os.path.join(plt_dir, "rmse_spatial"), cmap=cmap_rmse,
-                               levels=lvl_rmse)
+    _ = run_evaluation_spatial(scores_spatial, "rmse", os.path.join(plt_dir, "rmse_spatial"), plot_pool,
+                               cmap=cmap_rmse, levels=lvl_rmse)
 
     lvl_bias = np.arange(-2., 2.1, 0.1)
     cmap_bias = mpl.cm.seismic(np.linspace(0., 1., len(lvl_bias)))
-    _ = run_evaluation_spatial(score_engine, "bias", os.path.join(plt_dir, "bias_spatial"), cmap=cmap_bias,
-                               levels=lvl_bias)
+    _ = run_evaluation_spatial(scores_spatial, "bias", os.path.join(plt_dir, "bias_spatial"), plot_pool,
+                               cmap=cmap_bias, levels=lvl_bias)
 
+    # wait for the remaining plot jobs
+    plot_pool.close()
     logger.info(f"Spatial evalutaion finished in {timer() - t0_tplot:.2f}s.")
 
     logger.info(f"Postprocessing of experiment '{parser_args.exp_name}' finished. " +
@@ -200,6 +336,40 @@ if __name__ == "__main__":
     parser.add_argument("--model_type", "-model_type", dest="model_type", default=None,
                         help="Name of model architecture. Only required if custom model architecture is not" +
                              "implemented in get_model_info-function (see postprocess.py)")
+    parser.add_argument("--tile_size", "-tile_size", dest="tile_size", type=int, nargs=2, default=None,
+                        help="Tile size (ny, nx) for tiled inference (default: inference on whole fields). " +
+                             "Must be compatible with the model, e.g. a multiple of 8 for the U-Net.")
+    parser.add_argument("--tile_overlap", "-tile_overlap", dest="tile_overlap", type=int, nargs=2, default=[16, 16],
+                        help="Overlap (ny, nx) of neighbouring tiles for tiled inference.")
+    parser.add_argument("--blend_window", "-blend_window", dest="blend_window", type=str, default="hann",
+                        choices=["hann", "linear", "uniform"],
+                        help="Window to blend the predicted tiles in the overlap regions.")
+    parser.add_argument("--chunk_size", "-chunk_size", dest="chunk_size", type=int, default=None,
+                        help="Number of samples per chunk to stream the test dataset through the model " +
+                             "(default: process the test dataset in memory at once).")
+    parser.add_argument("--nworkers_plot", "-nworkers_plot", dest="nworkers_plot", type=int,
+                        default=min(4, os.cpu_count() or 1),
+                        help="Number of worker processes to render the plots (0: serial plotting).")
+    parser.add_argument("--eval_files", "-eval_files", dest="eval_files", type=str, nargs="+", default=None,
+                        help="Inference data of further runs (e.g. postprocessed_ds_test.nc-files, wildcards " +
+                             "allowed) which are evaluated together with the current run. The files are opened " +
+                             "lazily and concatenated along the time dimension, i.e. they must cover disjoint time " +
+                             "periods (e.g. different test years) on the same grid. Runs on the same time period " +
+                             "cannot be combined.")
+    parser.add_argument("--eval_chunk_size", "-eval_chunk_size", dest="eval_chunk_size", type=int, default=720,
+                        help="Number of samples per chunk for the evaluation.")
+    parser.add_argument("--dask_scheduler", "-dask_scheduler", dest="dask_scheduler", type=str, default="threads",
+                        choices=["threads", "processes", "synchronous"],
+                        help="Local dask-scheduler to evaluate lazily opened data.")
+    parser.add_argument("--nworkers_eval", "-nworkers_eval", dest="nworkers_eval", type=int, default=None,
+                        help="Number of workers of the dask-scheduler (default: number of cores).")
+    parser.add_argument("--zarr", "-zarr", dest="lzarr", default=False, action="store_true",
+                        help="Flag to write the inference data to a Zarr-store instead of a netCDF-file " +
+                             "(requires the zarr-package).")
 
     args = parser.parse_args()
+    if (args.lzarr or any(f.rstrip("/").endswith(".zarr") for f in args.eval_files or [])) and \
+            importlib.util.find_spec("zarr") is None:
+        parser.error("Reading and writing Zarr-stores requires the zarr-package which is not installed.")
+
     main(args)
@@ -57,6 +57,8 @@ def main():
                         help="Grid description file to define domain of interest (target domain).")
     parser.add_argument("--preprocess_method", "-method", dest="method", type=str, required=True,
                         help="Preprocessing method to generate dataset for training, validation and testing.")
+    parser.add_argument("--backend", "-backend", dest="backend", type=str, default=None,
+                        help="Backend for preprocessing ('cdo' or 'xarray'). Only supported for method 'ERA5_to_IFS'.")
 
     args_dict = vars(parser.parse_args())
 
@@ -9,9 +9,11 @@ Driver-script to train downscaling models.
 __author__ = "Michael Langguth"
 __email__ = "m.langguth@fz-juelich.de"
 __date__ = "2022-10-06"
-__update__ = "2023-04-17"
+__update__ = "2026-10-18"
 
 import os
+import glob
+import shutil
 import argparse
 from datetime import datetime as dt
 print("Start with importing packages at {0}".format(dt.strftime(dt.now(), "%Y-%m-%d %H:%M:%S")))
@@ -22,9 +24,10 @@ import numpy as np
 import xarray as xr
 from tensorflow.keras.utils import plot_model
 from all_normalizations import ZScore
-from model_utils import ModelEngine, TimeHistory, handle_opt_utils, get_loss_from_history
-from handle_data_class import HandleDataClass, get_dataset_filename
-from other_utils import free_mem, print_gpu_usage, print_cpu_usage, copy_filelist
+from model_utils import (ModelEngine, TimeHistory, handle_opt_utils, get_loss_from_history, get_strategy,
+                         set_precision_policy)
+from handle_data_class import HandleDataClass, get_dataset_filename, get_dist_rank_size
+from other_utils import free_mem, print_gpu_usage, print_cpu_usage, copy_filelist, get_max_memory_usage
 from benchmark_utils import BenchmarkCSV, get_training_time_dict
 
 
@@ -58,6 +61,14 @@ def main(parser_args):
     
     named_targets = hparams_dict.get("named_targets", False)
 
+    # get distribution strategy (must be set-up before any other TF operation for multi-worker training)
+    strategy = get_strategy(parser_args.strategy)
+    nreplicas = strategy.num_replicas_in_sync
+    rank, world_size = get_dist_rank_size()
+    # set precision policy of the model and data type to keep the (normalized) training data in memory
+    set_precision_policy(hparams_dict.get("precision_policy", "float32"))
+    data_dtype = ds_dict.get("data_dtype", "float32")
+
     # get normalization object if corresponding JSON-file is parsed
     if js_norm:
         data_norm = ZScore(ds_dict["norm_dims"])
@@ -75,7 +86,9 @@ def main(parser_args):
     # Note: bs_train is introduced to allow substepping in the training loop, e.g. for WGAN where n optimization steps
     # are applied to train the critic, before the generator is trained once.
     # The validation dataset however does not perform substeeping and thus doesn't require an increased mini-batch size.
+    # batch_size is the mini-batch size per replica, i.e. the global mini-batch size scales with the number of replicas
     bs_train = ds_dict["batch_size"] * (hparams_dict["d_steps"] + 1) if "d_steps" in hparams_dict else ds_dict["batch_size"]
+    bs_global = ds_dict["batch_size"] * nreplicas
     nepochs = hparams_dict["nepochs"] * (hparams_dict["d_steps"] + 1) if "d_steps" in hparams_dict else hparams_dict["nepochs"]
 
     # start handling training and validation data
@@ -83,20 +96,62 @@ def main(parser_args):
     print("Start preparing training data...")
     t0_train = timer()
     varnames_tar = list(ds_dict["predictands"])
-    fname_or_patt_train = get_dataset_filename(datadir, dataset, "train", ds_dict.get("laugmented", False))
+    nbatches_epoch = None
+    fname_or_patt_train = get_dataset_filename(datadir, dataset, "train", ds_dict.get("laugmented", False),
+                                               date_range=ds_dict.get("train_date_range", None),
+                                               manifest_file=ds_dict.get("manifest_file", None))
 
     # if fname_or_patt_train is a filename (string without wildcard), all data will be loaded into memory
-    # if fname_or_patt_train is a filename pattern (string with wildcard), the TF-dataset will iterate over subsets of
-    # the dataset
-    if "*" in fname_or_patt_train:
-        ds_obj, tfds_train = HandleDataClass.make_tf_dataset_dyn(datadir, fname_or_patt_train, bs_train, nepochs,
+    # if fname_or_patt_train is a filename pattern (string with wildcard) or a list of files (selected by date range),
+    # the TF-dataset will iterate over subsets of the dataset
+    if ds_dict.get("sample_store", None):
+        # training data is read from a pre-compiled sample store (see main_compile_store.py)
+        store, tfds_train = HandleDataClass.make_tf_dataset_store(ds_dict["sample_store"], bs_train * nreplicas,
+                                                                  named_targets=named_targets)
+        if js_norm:
+            print(f"WARNING: Normalization parameters of the sample store are used instead of '{js_norm}'.")
+        data_norm, write_norm = store.get_norm_obj(ds_dict["norm_dims"]), True
+        nsamples, shape_in = store.nsamples, (*store.sample_shape[:-1], store.n_predictors)
+        tfds_train_size = store.nbytes
+    elif ds_dict.get("tfrecords_dir", None):
+        # training data is streamed from TFRecord-files (see IFS2TFRecords)
+        if not data_norm:
+            raise ValueError("Normalization parameters must be provided (via -js_norm) when streaming TFRecord-files.")
+        nsamples, tfds_train = HandleDataClass.make_tf_dataset_tfr(ds_dict["tfrecords_dir"], bs_train * nreplicas,
+                                                                   ds_dict["predictands"], data_norm,
+                                                                   predictors=ds_dict.get("predictors", None),
+                                                                   var_tar2in=ds_dict["var_tar2in"],
+                                                                   named_targets=named_targets,
+                                                                   compression=ds_dict.get("tfr_compression", "GZIP"))
+        shape_in = tfds_train.element_spec[0].shape[1:].as_list()
+        tfds_train_size = sum(os.path.getsize(f) for f in glob.glob(os.path.join(ds_dict["tfrecords_dir"],
+                                                                                 "*.tfrecords")))
+    elif isinstance(fname_or_patt_train, list) or "*" in fname_or_patt_train:
+        ds_obj, tfds_stream = HandleDataClass.make_tf_dataset_dyn(datadir, fname_or_patt_train, bs_train, nepochs,
                                                                  30, ds_dict["predictands"],
                                                                  predictors=ds_dict.get("predictors", None),
                                                                  var_tar2in=ds_dict["var_tar2in"],
                                                                  named_targets=named_targets,
-                                                                 norm_obj=data_norm, norm_dims=norm_dims)
+                                                                 norm_obj=data_norm, norm_dims=norm_dims,
+                                                                 read_backend=ds_dict.get("read_backend", "thread"),
+                                                                 prefetch_depth=ds_dict.get("prefetch_depth", 2),
+                                                                 max_prefetch_mem=ds_dict.get("max_prefetch_mem", None),
+                                                                 norm_cache=ds_dict.get("norm_cache", None),
+                                                                 manifest_file=ds_dict.get("manifest_file", None),
+                                                                 rank=rank, world_size=world_size,
+                                                                 seed=ds_dict.get("seed", 42), data_dtype=data_dtype)
         data_norm = ds_obj.data_norm
         nsamples, shape_in = ds_obj.nsamples, (*ds_obj.data_dim[::-1], ds_obj.n_predictors)
+        # each rank streams its own data subsets with per-replica mini-batches which are fed to its local replicas
+        tfds_train = strategy.distribute_datasets_from_function(lambda input_context: tfds_stream)
+        nreplicas_local = max(nreplicas // world_size, 1)
+        # data subsets vary in size, so that the number of mini-batches per epoch is given by the data stream
+        nbatches_epoch = ds_obj.nbatches_epoch // nreplicas_local * \
+                         (hparams_dict["d_steps"] + 1 if "d_steps" in hparams_dict else 1)
+        nbatches_drop = ds_obj.nbatches_epoch % nreplicas_local
+        if nbatches_drop > 0:
+            print(f"WARNING: {nbatches_drop:d} of {ds_obj.nbatches_epoch:d} mini-batches per epoch are not used for " +
+                  f"training since they cannot be distributed evenly over {nreplicas_local:d} local replicas.")
         tfds_train_size = ds_obj.dataset_size
     else:
         ds_train = xr.open_dataset(fname_or_patt_train)
@@ -107,14 +162,14 @@ def main(parser_args):
             data_norm = ZScore(ds_dict["norm_dims"])
 
         da_train = data_norm.normalize(da_train)
-        tfds_train = HandleDataClass.make_tf_dataset_allmem(da_train, bs_train, ds_dict["predictands"],
+        tfds_train = HandleDataClass.make_tf_dataset_allmem(da_train, bs_train * nreplicas, ds_dict["predictands"],
                                                             predictors=ds_dict.get("predictors", None),
                                                             var_tar2in=ds_dict["var_tar2in"],
-                                                            named_targets=named_targets)
+                                                            named_targets=named_targets, data_dtype=data_dtype)
         nsamples, shape_in = da_train.shape[0], tfds_train.element_spec[0].shape[1:].as_list()
         tfds_train_size = da_train.nbytes
 
-    if write_norm:
+    if write_norm and rank == 0:
         data_norm.save_norm_to_file(os.path.join(model_savedir, "norm.json"))
 
     print(f"TF training dataset preparation time: {timer() - t0_train:.2f}s.")
@@ -127,10 +182,10 @@ def main(parser_args):
         ds_val = data_norm.normalize(ds_val)
     da_val = HandleDataClass.reshape_ds(ds_val)
 
-    tfds_val = HandleDataClass.make_tf_dataset_allmem(da_val.astype("float32", copy=True), ds_dict["batch_size"],
+    tfds_val = HandleDataClass.make_tf_dataset_allmem(da_val.astype("float32", copy=True), bs_global,
                                                       ds_dict["predictands"], predictors=ds_dict.get("predictors", None),
                                                       lshuffle=True, var_tar2in=ds_dict["var_tar2in"],
-                                                      named_targets=named_targets)
+                                                      named_targets=named_targets, data_dtype=data_dtype)
     
     # clean up to save some memory
     free_mem([ds_val, da_val])
@@ -146,12 +201,13 @@ def main(parser_args):
         ttrain_load = timer() - t0_train
         print(f"Data loading time: {ttrain_load:.2f}s.")
 
-    # instantiate model
-    model = model_instance(shape_in, varnames_tar, hparams_dict, model_savedir, parser_args.exp_name)
+    # instantiate model and its optimizers within the scope of the distribution strategy
+    with strategy.scope():
+        model = model_instance(shape_in, varnames_tar, hparams_dict, model_savedir, parser_args.exp_name)
 
-    # get optional compile options and compile
-    compile_opts = handle_opt_utils(model, "get_compile_opts")
-    model.compile(**compile_opts)
+        # get optional compile options and compile
+        compile_opts = handle_opt_utils(model, "get_compile_opts")
+        model.compile(**compile_opts)
 
     # copy configuration and normalization JSON-file to model-directory (incl. renaming)
     filelist, filelist_new = [parser_args.conf_ds.name, parser_args.conf_md.name], [f"config_ds_{dataset}.json", f"config_{parser_args.model}.json"]
@@ -161,7 +217,7 @@ def main(parser_args):
 
     # train model
     time_tracker = TimeHistory()
-    steps_per_epoch = int(np.ceil(nsamples / ds_dict["batch_size"]))
+    steps_per_epoch = nbatches_epoch if nbatches_epoch else int(np.ceil(nsamples / bs_global))
 
     # get optional fit options and start training/fitting
     fit_opts = handle_opt_utils(model, "get_fit_opts")
@@ -177,15 +233,39 @@ def main(parser_args):
         ttrain_load = sum(ds_obj.reading_times) + tval_load
         print(f"Data loading time: {ttrain_load:.2f}s.")
         print(f"Average throughput: {ds_obj.ds_proc_size / 1.e+06 / training_times['Total training time']:.3f} MB/s")
+        if ds_obj.prefetch_depth > 0:
+            ds_obj.stop_loader()
+            stream_stats = ds_obj.get_stream_stats()
+            print(f"Data stream: stall time: {stream_stats['total stall time']:.2f}s, " +
+                  f"compute time: {stream_stats['total compute time']:.2f}s " +
+                  f"(stall fraction: {stream_stats['stall fraction']*100.:.1f}%)")
+            print(f"Mean reading vs. compute time per data subset: {stream_stats['mean reading time per subset']:.2f}s " +
+                  f"vs. {stream_stats['mean compute time per subset']:.2f}s")
+    step_time_stats = time_tracker.get_step_time_stats()
+    print(f"Step time (w/o first epoch): mean: {step_time_stats['mean step time'] * 1000.:.1f}ms, " +
+          f"median: {step_time_stats['median step time'] * 1000.:.1f}ms")
     benchmark_dict = {**{"data loading time": ttrain_load}, **training_times}
+    # throughput in samples (incl. the sub-batches for critic steps of the WGAN) per second over all replicas
+    nsamples_trained = steps_per_epoch * model.hparams["nepochs"] * bs_train * nreplicas
+    benchmark_dict["samples per second"] = nsamples_trained / training_times["Total training time"]
+    benchmark_dict["peak rss [gb]"] = get_max_memory_usage() / 1.e+09
+    print(f"Training throughput: {benchmark_dict['samples per second']:.1f} samples/s, " +
+          f"peak RSS: {benchmark_dict['peak rss [gb]']:.2f} GB")
     print(f"Model '{parser_args.exp_name}' training time: {training_times['Total training time']:.2f} s. " +
           f"Save model to '{model_savedir}'")
 
     # save trained model
     t0_save = timer()
 
-    os.makedirs(model_savedir, exist_ok=True)
-    model.save(filepath=model_savedir)
+    # all workers must take part in saving, but only the model of the chief (rank 0) is kept
+    model_savedir_rank = model_savedir if rank == 0 else os.path.join(model_savedir, f"tmp_rank{rank:d}")
+    os.makedirs(model_savedir_rank, exist_ok=True)
+    model.save(filepath=model_savedir_rank)
+
+    if rank > 0:
+        shutil.rmtree(model_savedir_rank, ignore_errors=True)
+        print(f"Finished job on rank {rank:d} at {dt.strftime(dt.now(), '%Y-%m-%d %H:%M:%S')}")
+        return
 
     if callable(getattr(model, "plot_model", False)):
         model.plot_model(model_savedir, show_shapes=True)
@@ -205,8 +285,8 @@ def main(parser_args):
 
     # populate benchmark dictionary
     benchmark_dict.update({"saving model time": saving_time, "total runtime": tot_run_time})
-    benchmark_dict.update({"job id": job_id, "#nodes": 1, "#cpus": len(os.sched_getaffinity(0)), "#gpus": 1,
-                           "#mpi tasks": 1, "node id": None, "max. gpu power": None, "gpu energy consumption": None})
+    benchmark_dict.update({"job id": job_id, "#nodes": world_size, "#cpus": len(os.sched_getaffinity(0)),
+                           "#gpus": nreplicas, "#mpi tasks": world_size, "node id": None, "max. gpu power": None, "gpu energy consumption": None})
     try:
         benchmark_dict["final training loss"] = get_loss_from_history(history, "loss")
     except KeyError:
@@ -228,7 +308,7 @@ def main(parser_args):
         stat_info = {"static_model_info": model_info,
                      "data_info": {"training data size": tfds_train_size, "validation data size": da_val.nbytes,
                                    "nsamples": nsamples, "shape_samples": shape_in,
-                                   "batch_size": ds_dict["batch_size"]}}
+                                   "batch_size": ds_dict["batch_size"], "global_batch_size": bs_global}}
 
         with open(js_file, "w") as jsf:
             js.dump(stat_info, jsf)
@@ -255,6 +335,9 @@ if __name__ == "__main__":
     parser.add_argument("--json_norm_file", "-js_norm", dest="js_norm", type=str, default=None,
                         help="JSON-file providing normalization parameters.")
     parser.add_argument("--job_id", "-id", dest="id", type=int, required=True, help="Job-id from Slurm.")
+    parser.add_argument("--strategy", "-strategy", dest="strategy", type=str, default="default",
+                        choices=["default", "mirrored", "multiworker"],
+                        help="Distribution strategy for data-parallel training (multiworker requires TF_CONFIG).")
 
     args = parser.parse_args()
     main(args)
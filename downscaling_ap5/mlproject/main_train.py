@@ -9,7 +9,7 @@ Driver-script to train downscaling models.
 __author__ = "Michael Langguth"
 __email__ = "m.langguth@fz-juelich.de"
 __date__ = "2022-10-06"
-__update__ = "2023-04-17"
+__update__ = "2026-10-18"
 
 import os
 import argparse
@@ -93,6 +93,7 @@ def main(parser_args):
     # if fname_or_patt_train is a filename (string without wildcard), all data will be loaded into memory
     # if fname_or_patt_train is a filename pattern (string with wildcard), the TF-dataset will iterate over subsets of
     # the dataset
+    nbatches_epoch = None
     if "*" in fname_or_patt_train:
         ds_obj, tfds_train = HandleDataClass.make_tf_dataset_dyn(datadir, fname_or_patt_train, bs_train, nepochs,
                                                                  30, ds_dict["predictands"],
@@ -102,6 +103,8 @@ def main(parser_args):
                                                                  norm_obj=data_norm, norm_dims=norm_dims)
         data_norm = ds_obj.data_norm
         nsamples, shape_in = ds_obj.nsamples, (*ds_obj.data_dim[::-1], ds_obj.n_predictors)
+        # data subsets vary in size, so that the number of mini-batches per epoch is given by the data stream
+        nbatches_epoch = ds_obj.nbatches_epoch * (hparams_dict["d_steps"] + 1 if "d_steps" in hparams_dict else 1)
         tfds_train_size = ds_obj.dataset_size
     else:
         ds_train = xr.open_dataset(fname_or_patt_train)
@@ -166,14 +169,19 @@ def main(parser_args):
 
     # train model
     time_tracker = TimeHistory()
-    steps_per_epoch = int(np.ceil(nsamples / ds_dict["batch_size"]))
+    steps_per_epoch = nbatches_epoch if nbatches_epoch else int(np.ceil(nsamples / ds_dict["batch_size"]))
 
     # get optional fit options and start training/fitting
     fit_opts = handle_opt_utils(model, "get_fit_opts")
     print(f"Start training of {parser_args.model.capitalize()}...")
-    history = model.fit(x=tfds_train, callbacks=[time_tracker, MetricsHistory()], epochs=model.hparams["nepochs"],
-                        steps_per_epoch=steps_per_epoch, validation_data=tfds_val, validation_steps=300,
-                        verbose=2, **fit_opts)
+    try:
+        history = model.fit(x=tfds_train, callbacks=[time_tracker, MetricsHistory()], epochs=model.hparams["nepochs"],
+                            steps_per_epoch=steps_per_epoch, validation_data=tfds_val, validation_steps=300,
+                            verbose=2, **fit_opts)
+    finally:
+        # stop the background loader of the data stream (also if training fails)
+        if "ds_obj" in locals() and ds_obj.prefetch_depth > 0:
+            ds_obj.stop_loader()
 
     # get some parameters from tracked training times and put to dictionary
     training_times = get_training_time_dict(time_tracker.epoch_times,
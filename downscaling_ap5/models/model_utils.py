@@ -9,10 +9,12 @@ Some auxiliary methods to create Keras models.
 __author__ = "Michael Langguth"
 __email__ = "m.langguth@fz-juelich.de"
 __date__ = "2022-05-26"
-__update__ = "2023-03-10"
+__update__ = "2023-05-27"
 
 # import modules
 from timeit import default_timer as timer
+import numpy as np
+import tensorflow as tf
 import tensorflow.keras as keras
 from unet_model import sha_unet, UNET
 from wgan_model import WGAN, critic_model
@@ -96,17 +98,81 @@ class ModelEngine(object):
         return f"Known models are: {', '.join(list(self.known_models.keys()))}"
 
 
+def get_strategy(strategy_name: str = None):
+    """
+    Get distribution strategy for data-parallel training. The models must be built and compiled within the scope of
+    the strategy (see strategy.scope()).
+    :param strategy_name: name of the strategy, i.e. 'default' (single device), 'mirrored' (all local GPUs) or
+                          'multiworker' (all GPUs on all nodes configured via TF_CONFIG)
+    :return: tf.distribute-strategy
+    """
+    known_strategies = {"default": tf.distribute.get_strategy, "mirrored": tf.distribute.MirroredStrategy,
+                        "multiworker": tf.distribute.MultiWorkerMirroredStrategy}
+
+    strategy_name = "default" if strategy_name is None else strategy_name.lower()
+    try:
+        strategy = known_strategies[strategy_name]()
+    except KeyError:
+        raise ValueError(f"Distribution strategy '{strategy_name}' is unknown. " +
+                         f"Known strategies are: {', '.join(known_strategies.keys())}")
+
+    print(f"Use {type(strategy).__name__} with {strategy.num_replicas_in_sync:d} replica(s).")
+
+    return strategy
+
+
+def set_precision_policy(policy_name: str = "float32"):
+    """
+    Set global Keras precision policy. Must be called before the models are built.
+    With 'mixed_float16' or 'mixed_bfloat16', computations are performed in half precision, whereas the variables
+    (and the output layers of the models) are kept in float32. Loss scaling is only required for 'mixed_float16'
+    (done by Keras for compiled models and by WGAN.train_step for the WGAN).
+    :param policy_name: name of the policy, i.e. 'float32', 'mixed_float16' or 'mixed_bfloat16'
+    """
+    known_policies = ["float32", "mixed_float16", "mixed_bfloat16"]
+
+    if policy_name not in known_policies:
+        raise ValueError(f"Precision policy '{policy_name}' is unknown. " +
+                         f"Known policies are: {', '.join(known_policies)}")
+
+    keras.mixed_precision.set_global_policy(policy_name)
+    print(f"Use precision policy '{policy_name}'.")
+
+
 # define class for creating timer callback
 class TimeHistory(keras.callbacks.Callback):
+    """
+    Track training times per epoch and per step (i.e. per mini-batch).
+    """
     def on_train_begin(self, logs={}):
         self.epoch_times = []
+        self.step_times = []
 
     def on_epoch_begin(self, epoch, logs={}):
         self.epoch_time_start = timer()
+        self.step_times.append([])
 
     def on_epoch_end(self, epoch, logs={}):
         self.epoch_times.append(timer() - self.epoch_time_start)
 
+    def on_train_batch_begin(self, batch, logs={}):
+        self.step_time_start = timer()
+
+    def on_train_batch_end(self, batch, logs={}):
+        self.step_times[-1].append(timer() - self.step_time_start)
+
+    def get_step_time_stats(self, nskip_epochs: int = 1) -> dict:
+        """
+        Get statistics on the step times. Epochs at the beginning can be skipped to exclude tracing and compilation.
+        :param nskip_epochs: number of epochs to skip (ignored if training ran for fewer epochs)
+        :return: dictionary with mean, median and maximum step time in seconds
+        """
+        nskip_epochs = nskip_epochs if len(self.step_times) > nskip_epochs else 0
+        step_times = [t for times_epoch in self.step_times[nskip_epochs:] for t in times_epoch]
+
+        return {"mean step time": np.mean(step_times), "median step time": np.median(step_times),
+                "max. step time": np.amax(step_times)}
+
 
 def get_loss_from_history(history: keras.callbacks.History, loss_name: str = "loss"):
 
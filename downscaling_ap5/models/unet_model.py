@@ -9,7 +9,7 @@ Methods to set-up U-net models incl. its building blocks.
 __author__ = "Michael Langguth"
 __email__ = "m.langguth@fz-juelich.de"
 __date__ = "2021-XX-XX"
-__update__ = "2023-05-06"
+__update__ = "2023-05-28"
 
 # import modules
 import os
@@ -126,6 +126,7 @@ def sha_unet(input_shape: tuple, n_predictands_dyn: int, channels_start: int = 5
     :param tar_channels: name of output/target channels (needed for associating losses during compilation)
     :param concat_out: boolean if output layers will be concatenated (disables named target channels!)
     :return:
+    NOTE: The output layers are kept in float32 when a mixed precision policy is set.
     """
     inputs = Input(input_shape)
 
@@ -142,10 +143,12 @@ def sha_unet(input_shape: tuple, n_predictands_dyn: int, channels_start: int = 5
     d2 = decoder_block(d1, s2, channels_start * 2)
     d3 = decoder_block(d2, s1, channels_start)
 
-    output_dyn = Conv2D(n_predictands_dyn, (1, 1), kernel_initializer="he_normal", name=tar_channels[0])(d3)
+    output_dyn = Conv2D(n_predictands_dyn, (1, 1), kernel_initializer="he_normal", name=tar_channels[0],
+                        dtype="float32")(d3)
     if z_branch:
         print("Use z_branch...")
-        output_static = Conv2D(1, (1, 1), kernel_initializer="he_normal", name=tar_channels[1])(d3)
+        output_static = Conv2D(1, (1, 1), kernel_initializer="he_normal", name=tar_channels[1],
+                               dtype="float32")(d3)
 
         if concat_out:
             model = Model(inputs, tf.concat([output_dyn, output_static], axis=-1), name="downscaling_unet_with_z")
@@ -315,7 +318,7 @@ class UNET(keras.Model):
         hparams_dict = {"batch_size": 32, "lr": 5.e-05, "nepochs": 70, "z_branch": True, "loss_func": "mae",
                         "loss_weights": [1.0, 1.0], "lr_decay": False, "decay_start": 5, "decay_end": 30,
                         "lr_end": 1.e-06, "l_embed": False, "ngf": 56, "optimizer": "adam", "lscheduled_train": True,
-                        "var_tar2in": "", "n_predictands": 1}
+                        "var_tar2in": "", "n_predictands": 1, "precision_policy": "float32"}
 
         return hparams_dict
 
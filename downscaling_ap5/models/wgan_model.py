@@ -5,7 +5,7 @@
 __author__ = "Michael Langguth"
 __email__ = "m.langguth@fz-juelich.de"
 __date__ = "2022-05-19"
-__update__ = "2022-11-25"
+__update__ = "2026-10-18"
 
 import os, sys
 from typing import List, Tuple, Union
@@ -57,8 +57,8 @@ def critic_model(shape, num_conv: int = 4, channels_start: int = 64, kernel: tup
     # finally perform global average pooling and finalize by fully connected layers
     x = GlobalAveragePooling2D()(x)
     x = Dense(channels_start)(x)
-    # ... and end with linear output layer
-    out = Dense(1, activation="linear")(x)
+    # ... and end with linear output layer (kept in float32 when a mixed precision policy is set)
+    out = Dense(1, activation="linear", dtype="float32")(x)
 
     critic = Model(inputs=critic_in, outputs=out)
 
@@ -110,6 +110,7 @@ class WGAN(keras.Model):
 
         # attributes to be set in compile-method
         self.c_optimizer, self.g_optimizer = None, None
+        self.critic_step_fused = None
         self.lr_scheduler = None
         self.checkpoint, self.earlystopping = None, None
 
@@ -123,6 +124,13 @@ class WGAN(keras.Model):
         super(WGAN, self).compile(**kwargs)
         # set optimizers
         self.c_optimizer, self.g_optimizer = self.hparams["d_optimizer"], self.hparams["g_optimizer"]
+        # XLA-compiled critic step (see train_critic_fused)
+        if self.hparams["lfused_critic"]:
+            if any(isinstance(layer, keras.layers.BatchNormalization) for layer in self.critic.layers):
+                print("WARNING: The critic comprises batch normalization layers which normalize over the ground " +
+                      "truth, the generated and the mixed data jointly in the fused critic step. " +
+                      "Thus, the results differ from the unfused critic step.")
+            self.critic_step_fused = tf.function(self.get_critic_grads_fused, jit_compile=True)
 
         # get learning rate schedule if desired
         if self.hparams["lr_decay"]:
@@ -184,55 +192,124 @@ class WGAN(keras.Model):
     def train_step(self, data_iter: tf.data.Dataset, embed=None) -> OrderedDict:
         """
         Training step for Wasserstein GAN
+        Each mini-batch comprises d_steps+1 sub-batches (one for each critic step and one for the generator step).
+        Under a distribution strategy, the sub-batches are sliced from the per-replica batch and the losses are
+        scaled with the global batch size (see critic_loss), so that the summed gradients of all replicas are correct.
+        With lfused_critic, the losses and gradients of the critic steps are computed by an XLA-compiled critic step
+        (see train_critic_fused).
         :param data_iter: Tensorflow Dataset providing training data
         :param embed: embedding (not implemented yet)
         :return: Ordered dictionary with several losses of generator and critic
         """
 
         predictors, predictands = data_iter
+        # batch size on this replica
+        batch_size = tf.shape(predictors)[0] // (self.hparams["d_steps"] + 1)
 
         # train the critic d_steps-times
-        for i in range(self.hparams["d_steps"]):
-            with tf.GradientTape() as tape_critic:
-                ist, ie = i * self.hparams["batch_size"], (i + 1) * self.hparams["batch_size"]
-                # critic only operates on predictand channels
-                if self.n_predictands_dyn > 1:
-                    predictands_critic = predictands[ist:ie, :, :, 0:self.n_predictands_dyn]
-                else:
-                    predictands_critic = tf.expand_dims(predictands[ist:ie, :, :, 0], axis=-1)
-                # generate (downscaled) data
-                gen_data = self.generator(predictors[ist:ie, ...], training=True)
-                # calculate critics for both, the real and the generated data
-                critic_gen = self.critic(gen_data[..., 0:self.n_predictands_dyn], training=True)
-                critic_gt = self.critic(predictands_critic, training=True)
-                # calculate the loss (incl. gradient penalty)
-                c_loss = WGAN.critic_loss(critic_gt, critic_gen)
-                gp = self.gradient_penalty(predictands_critic, gen_data[..., 0:self.n_predictands_dyn])
-
-                d_loss = c_loss + self.hparams["gp_weight"] * gp
-
-            # calculate gradients and update discrimintor
-            d_gradient = tape_critic.gradient(d_loss, self.critic.trainable_variables)
-            self.c_optimizer.apply_gradients(zip(d_gradient, self.critic.trainable_variables))
+        if self.hparams["lfused_critic"]:
+            c_loss, gp, d_loss = self.train_critic_fused(predictors, predictands, batch_size)
+        else:
+            for i in range(self.hparams["d_steps"]):
+                with tf.GradientTape() as tape_critic:
+                    ist, ie = i * batch_size, (i + 1) * batch_size
+                    # critic only operates on predictand channels
+                    if self.n_predictands_dyn > 1:
+                        predictands_critic = predictands[ist:ie, :, :, 0:self.n_predictands_dyn]
+                    else:
+                        predictands_critic = tf.expand_dims(predictands[ist:ie, :, :, 0], axis=-1)
+                    # generate (downscaled) data
+                    gen_data = self.generator(predictors[ist:ie, ...], training=True)
+                    # calculate critics for both, the real and the generated data
+                    critic_gen = self.critic(gen_data[..., 0:self.n_predictands_dyn], training=True)
+                    critic_gt = self.critic(predictands_critic, training=True)
+                    # calculate the loss (incl. gradient penalty)
+                    c_loss = WGAN.critic_loss(critic_gt, critic_gen)
+                    gp = self.gradient_penalty(predictands_critic, gen_data[..., 0:self.n_predictands_dyn])
+
+                    d_loss = c_loss + self.hparams["gp_weight"] * gp
+                    d_loss_scaled = WGAN.scale_loss(d_loss, self.c_optimizer)
+
+                # calculate gradients and update discrimintor
+                d_gradient = tape_critic.gradient(d_loss_scaled, self.critic.trainable_variables)
+                d_gradient = WGAN.unscale_gradients(d_gradient, self.c_optimizer)
+                self.c_optimizer.apply_gradients(zip(d_gradient, self.critic.trainable_variables))
 
         # train generator
         with tf.GradientTape() as tape_generator:
             # generate (downscaled) data
-            gen_data = self.generator(predictors[-self.hparams["batch_size"]:, :, :, :], training=True)
+            gen_data = self.generator(predictors[-batch_size:, :, :, :], training=True)
             # get the critic and calculate corresponding generator losses (critic and reconstruction loss)
             critic_gen = self.critic(gen_data[..., 0:self.n_predictands_dyn], training=True)
             cg_loss = WGAN.critic_gen_loss(critic_gen)
-            rloss = self.recon_loss(predictands[-self.hparams["batch_size"]:, :, :, :], gen_data)
+            rloss = self.recon_loss(predictands[-batch_size:, :, :, :], gen_data)
 
             g_loss = cg_loss + self.hparams["recon_weight"] * rloss
+            g_loss_scaled = WGAN.scale_loss(g_loss, self.g_optimizer)
 
-        g_gradient = tape_generator.gradient(g_loss, self.generator.trainable_variables)
+        g_gradient = WGAN.unscale_gradients(tape_generator.gradient(g_loss_scaled, self.generator.trainable_variables),
+                                            self.g_optimizer)
         self.g_optimizer.apply_gradients(zip(g_gradient, self.generator.trainable_variables))
 
-        return OrderedDict(
+        losses = OrderedDict(
             [("c_loss", c_loss), ("gp_loss", self.hparams["gp_weight"] * gp), ("d_loss", d_loss), ("cg_loss", cg_loss),
              ("recon_loss", rloss * self.hparams["recon_weight"]), ("g_loss", g_loss)])
 
+        return WGAN.sum_over_replicas(losses)
+
+    def train_critic_fused(self, predictors, predictands, batch_size):
+        """
+        Train the critic d_steps-times where the losses and gradients of each critic step are computed by the
+        XLA-compiled critic_step_fused (see get_critic_grads_fused).
+        NOTE: The loop over the critic steps is unrolled and the gradients are applied outside the compiled function
+              (i.e. not within a tf.while_loop), since the cross-replica merge_call of the optimizer under a
+              distribution strategy must not be placed in a control flow body.
+        :param predictors: predictors of all d_steps+1 sub-batches
+        :param predictands: predictands of all d_steps+1 sub-batches
+        :param batch_size: size of the sub-batches
+        :return: critic loss, gradient penalty and total loss of the critic of the last critic step
+        """
+        for i in range(self.hparams["d_steps"]):
+            ist, ie = i * batch_size, (i + 1) * batch_size
+            d_gradient, c_loss, gp, d_loss = self.critic_step_fused(predictors[ist:ie, ...],
+                                                                    predictands[ist:ie, ..., 0:self.n_predictands_dyn])
+            self.c_optimizer.apply_gradients(zip(d_gradient, self.critic.trainable_variables))
+
+        return c_loss, gp, d_loss
+
+    def get_critic_grads_fused(self, predictors, predictands_critic):
+        """
+        Compute losses and gradients of the critic for one critic step. In contrast to the unfused critic step, the
+        ground truth, the generated and the mixed data (for the gradient penalty) are concatenated, so that the critic
+        is evaluated in one forward pass. Note that batch normalization layers of the critic then normalize over
+        all three data parts.
+        :param predictors: predictors of the sub-batch
+        :param predictands_critic: dynamic predictands of the sub-batch
+        :return: gradients of the critic, critic loss, gradient penalty and total loss of the critic
+        """
+        with tf.GradientTape() as tape_critic:
+            gen_data = tf.stop_gradient(self.generator(predictors, training=True)[..., 0:self.n_predictands_dyn])
+            alpha = tf.random.normal([tf.shape(predictands_critic)[0], 1, 1, self.n_predictands_dyn], 0., 1.)
+            mix_data = predictands_critic + alpha * (gen_data - predictands_critic)
+
+            with tf.GradientTape() as gp_tape:
+                gp_tape.watch(mix_data)
+                critic_all = self.critic(tf.concat([predictands_critic, gen_data, mix_data], axis=0), training=True)
+                critic_gt, critic_gen, critic_mix = tf.split(critic_all, 3, axis=0)
+
+            grads_mix = gp_tape.gradient(critic_mix, mix_data)
+            norm = tf.sqrt(tf.reduce_mean(tf.square(grads_mix), axis=[1, 2, 3]))
+            gp = tf.nn.compute_average_loss((norm - 1.) ** 2)
+            c_loss = WGAN.critic_loss(critic_gt, critic_gen)
+
+            d_loss = c_loss + self.hparams["gp_weight"] * gp
+            d_loss_scaled = WGAN.scale_loss(d_loss, self.c_optimizer)
+
+        d_gradient = WGAN.unscale_gradients(tape_critic.gradient(d_loss_scaled, self.critic.trainable_variables),
+                                            self.c_optimizer)
+
+        return d_gradient, c_loss, gp, d_loss
+
     def test_step(self, val_iter: tf.data.Dataset) -> OrderedDict:
         """
         Implement step to test trained generator on validation data
@@ -244,7 +321,7 @@ class WGAN(keras.Model):
         gen_data = self.generator(predictors, training=False)
         rloss = self.recon_loss(predictands, gen_data)
 
-        return OrderedDict([("recon_loss", rloss)])
+        return WGAN.sum_over_replicas(OrderedDict([("recon_loss", rloss)]))
 
     def predict_step(self, test_iter: tf.data.Dataset) -> OrderedDict:
 
@@ -257,10 +334,10 @@ class WGAN(keras.Model):
         Calculates gradient penalty based on 'mixture' of generated and ground truth data
         :param real_data: the ground truth data
         :param gen_data: the generated/predicted data
-        :return: gradient penalty
+        :return: gradient penalty (scaled with the global batch size, see critic_loss)
         """
         # get mixture of generated and ground truth data
-        alpha = tf.random.normal([self.hparams["batch_size"], 1, 1, self.n_predictands_dyn], 0., 1.)
+        alpha = tf.random.normal([tf.shape(real_data)[0], 1, 1, self.n_predictands_dyn], 0., 1.)
         mix_data = real_data + alpha * (gen_data - real_data)
 
         with tf.GradientTape() as gp_tape:
@@ -271,18 +348,24 @@ class WGAN(keras.Model):
         grads_mix = gp_tape.gradient(critic_mix, [mix_data])[0]
         # ... and norm it
         norm = tf.sqrt(tf.reduce_mean(tf.square(grads_mix), axis=[1, 2, 3]))
-        gp = tf.reduce_mean((norm - 1.) ** 2)
+        gp = tf.nn.compute_average_loss((norm - 1.) ** 2)
 
         return gp
 
     def recon_loss(self, real_data, gen_data):
+        """
+        Calculates the reconstruction loss (sum of MAE over all output heads)
+        :param real_data: the ground truth data
+        :param gen_data: the generated/predicted data
+        :return: reconstruction loss (scaled with the global batch size, see critic_loss)
+        """
         # initialize reconstruction loss
         rloss = 0.
         # get MAE for all output heads
         for i in range(self.hparams["n_predictands"]):
-            rloss += tf.reduce_mean(tf.abs(tf.squeeze(gen_data[..., i]) - real_data[..., i]))
+            rloss += tf.reduce_mean(tf.abs(gen_data[..., i] - real_data[..., i]), axis=[1, 2])
 
-        return rloss
+        return tf.nn.compute_average_loss(rloss)
 
     def plot_model(self, save_dir, **kwargs):
         """
@@ -365,6 +448,11 @@ class WGAN(keras.Model):
         else:
             raise ValueError("'{0}' is not a valid optimizer. Either choose Adam or RMSprop-optimizer")
 
+        # loss scaling is required to avoid underflow of the gradients in float16 (but not in bfloat16)
+        if hparams_dict["precision_policy"] == "mixed_float16":
+            for opt_key in ["d_optimizer", "g_optimizer"]:
+                hparams_dict[opt_key] = keras.mixed_precision.LossScaleOptimizer(hparams_dict[opt_key])
+
         return hparams_dict
 
     @staticmethod
@@ -375,7 +463,8 @@ class WGAN(keras.Model):
         hparams_dict = {"batch_size": 32, "lr_gen": 1.e-05, "lr_critic": 1.e-06, "nepochs": 50, "z_branch": False,
                         "lr_decay": False, "decay_start": 5, "decay_end": 10, "lr_gen_end": 1.e-06, "l_embed": False,
                         "ngf": 56, "d_steps": 5, "recon_weight": 1000., "gp_weight": 10., "optimizer": "adam", 
-                        "lscheduled_train": True, "var_tar2in": "", "n_predictands": 2}
+                        "lscheduled_train": True, "var_tar2in": "", "n_predictands": 2, "lfused_critic": False,
+                        "precision_policy": "float32"}
 
         return hparams_dict
 
@@ -384,20 +473,65 @@ class WGAN(keras.Model):
         """
         The critic is optimized to maximize the difference between the generated and the real data max(real - gen).
         This is equivalent to minimizing the negative of this difference, i.e. min(gen - real) = max(real - gen)
+        The loss is averaged over the global batch (i.e. summed over the replica's samples and divided by the batch
+        size times the number of replicas), so that summing the gradients over all replicas yields the gradient of the
+        mean loss. Without a distribution strategy, this is identical to the mean over the batch.
         :param critic_real: critic on the real data
         :param critic_gen: critic on the generated data
         :return c_loss: loss to optize the critic
         """
-        c_loss = tf.reduce_mean(critic_gen - critic_real)
+        c_loss = tf.nn.compute_average_loss(tf.reshape(critic_gen - critic_real, [-1]))
 
         return c_loss
 
     @staticmethod
     def critic_gen_loss(critic_gen):
-        cg_loss = -tf.reduce_mean(critic_gen)
+        cg_loss = -tf.nn.compute_average_loss(tf.reshape(critic_gen, [-1]))
 
         return cg_loss
 
+    @staticmethod
+    def scale_loss(loss, optimizer):
+        """
+        Scale loss for mixed precision training if the optimizer is a LossScaleOptimizer (must be called within the
+        gradient tape).
+        :param loss: the loss
+        :param optimizer: the optimizer which is used to apply the gradients
+        :return: (scaled) loss
+        """
+        if isinstance(optimizer, keras.mixed_precision.LossScaleOptimizer):
+            return optimizer.get_scaled_loss(loss)
+
+        return loss
+
+    @staticmethod
+    def unscale_gradients(gradients, optimizer):
+        """
+        Unscale gradients of a scaled loss (see scale_loss).
+        :param gradients: the gradients
+        :param optimizer: the optimizer which is used to apply the gradients
+        :return: (unscaled) gradients
+        """
+        if isinstance(optimizer, keras.mixed_precision.LossScaleOptimizer):
+            return optimizer.get_unscaled_gradients(gradients)
+
+        return gradients
+
+    @staticmethod
+    def sum_over_replicas(losses: OrderedDict) -> OrderedDict:
+        """
+        Sum losses over all replicas to report the loss of the global batch (Keras only reports the values of the
+        first replica). Without a distribution strategy, the losses are returned unchanged.
+        :param losses: dictionary of losses which are scaled with the global batch size
+        :return: dictionary of losses of the global batch
+        """
+        replica_ctx = tf.distribute.get_replica_context()
+        if replica_ctx is None or replica_ctx.num_replicas_in_sync == 1:
+            return losses
+
+        return OrderedDict([(key, replica_ctx.all_reduce(tf.distribute.ReduceOp.SUM, loss))
+                            for key, loss in losses.items()])
+
 
 class LearningRateSchedulerWGAN(LearningRateScheduler):
 
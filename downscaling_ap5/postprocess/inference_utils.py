@@ -0,0 +1,280 @@
+# SPDX-FileCopyrightText: 2023 Earth System Data Exploration (ESDE), Jülich Supercomputing Center (JSC)
+#
+# SPDX-License-Identifier: MIT
+
+"""
+Auxiliary methods for inference on large domains and long periods.
+For large domains, the (normalized) input data is cut into overlapping tiles which are batched through the model.
+The predicted tiles are stitched together by weighted blending in the overlap regions, so that the memory required
+for inference does not depend on the domain size.
+For long periods, the data is streamed in time chunks which are read, processed and appended to the output file
+one after another (see stream_inference).
+"""
+
+__author__ = "agent"
+__email__ = "agent@local"
+__date__ = "2026-10-18"
+__update__ = "2026-10-18"
+
+import os
+import shutil
+import logging
+from typing import List, Tuple, Callable
+from timeit import default_timer as timer
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import xarray as xr
+import netCDF4 as nc
+
+# auxiliary variable for logger
+logger_module_name = f"main_postprocess.{__name__}"
+module_logger = logging.getLogger(logger_module_name)
+
+known_windows = ["hann", "linear", "uniform"]
+
+
+def get_tile_starts(n: int, tile: int, overlap: int) -> List:
+    """
+    Get start indices of overlapping tiles along one dimension. The last tile is aligned with the end of the domain,
+    i.e. its overlap with the previous tile may be larger than the parsed overlap.
+    :param n: size of the domain
+    :param tile: size of the tiles
+    :param overlap: (minimum) overlap of neighbouring tiles
+    :return: list of start indices
+    """
+    if tile > n:
+        raise ValueError(f"Tile size {tile:d} exceeds domain size {n:d}.")
+    if not 0 <= overlap < tile:
+        raise ValueError(f"Overlap must be non-negative and smaller than the tile size, but is {overlap:d}.")
+
+    starts = list(range(0, n - tile + 1, tile - overlap))
+    if starts[-1] + tile < n:
+        starts.append(n - tile)
+
+    return starts
+
+
+def get_blend_weights(tile_shape: Tuple, overlap: Tuple, window: str = "hann") -> np.ndarray:
+    """
+    Get the weights to blend the predicted tiles. The weights ramp up from the tile edges over the overlap width and
+    are one in the tile center. The weights are strictly positive, so that the normalization by the sum of weights
+    also works at the domain edges (where only one tile contributes).
+    :param tile_shape: shape of the tiles (ny, nx)
+    :param overlap: overlap of the tiles (overlap_y, overlap_x)
+    :param window: type of window for the ramps ('hann', 'linear' or 'uniform', i.e. no ramps)
+    :return: 2D-array of weights with shape tile_shape
+    """
+    if window not in known_windows:
+        raise ValueError(f"Unknown blending window '{window}'. Choose one of {', '.join(known_windows)}.")
+
+    weights_1d = []
+    for n, nover in zip(tile_shape, overlap):
+        w = np.ones(n, dtype="float32")
+        if window != "uniform" and nover > 0:
+            ramp = np.arange(1, nover + 1, dtype="float32") / (nover + 1)
+            if window == "hann":
+                ramp = 0.5 * (1. - np.cos(np.pi * ramp))
+            w[:nover], w[n - nover:] = np.minimum(w[:nover], ramp), np.minimum(w[n - nover:], ramp[::-1])
+        weights_1d.append(w)
+
+    return np.outer(*weights_1d)
+
+
+def predict_tiled(model, data_in: np.ndarray, tile_shape: Tuple, overlap: Tuple, batch_size: int = 32,
+                  window: str = "hann") -> np.ndarray:
+    """
+    Predict with a (fully convolutional) model on a domain of arbitrary size by tiled inference. The tiles of all
+    samples are batched through the model and accumulated in the output array with the blending weights
+    (see get_blend_weights). Apart from the input and output array, the memory footprint only depends on the tile
+    shape and the batch size.
+    NOTE: The tile shape must be compatible with the model (e.g. a multiple of 8 for the U-Net with three pooling
+          layers). Multiple outputs of the model (e.g. for the z-branch) are concatenated along the last axis.
+    :param model: Keras model (input and output must have the same spatial shape)
+    :param data_in: normalized input data with shape (samples, ny, nx, channels)
+    :param tile_shape: shape of the tiles (ny_tile, nx_tile)
+    :param overlap: overlap of neighbouring tiles (overlap_y, overlap_x)
+    :param batch_size: number of tiles per mini-batch
+    :param window: type of blending window (see get_blend_weights)
+    :return: predicted data with shape (samples, ny, nx, output channels)
+    """
+    func_logger = logging.getLogger(f"{logger_module_name}.{predict_tiled.__name__}")
+
+    nsamples, ny, nx = data_in.shape[0:3]
+    ty, tx = tile_shape
+    starts_y, starts_x = get_tile_starts(ny, ty, overlap[0]), get_tile_starts(nx, tx, overlap[1])
+    tiles = [(it, y0, x0) for it in range(nsamples) for y0 in starts_y for x0 in starts_x]
+
+    weights = get_blend_weights(tile_shape, overlap, window)
+    weights_sum = np.zeros((ny, nx), dtype="float32")
+    for y0 in starts_y:
+        for x0 in starts_x:
+            weights_sum[y0:y0 + ty, x0:x0 + tx] += weights
+
+    func_logger.info(f"Predict {len(tiles):d} tiles of shape {tile_shape} ({len(starts_y):d}x{len(starts_x):d} " +
+                     f"tiles per sample)...")
+    t0 = timer()
+    data_out = None
+    batch = np.empty((batch_size, ty, tx, data_in.shape[-1]), dtype="float32")
+    for ist in range(0, len(tiles), batch_size):
+        tiles_now = tiles[ist:ist + batch_size]
+        for i, (it, y0, x0) in enumerate(tiles_now):
+            batch[i] = data_in[it, y0:y0 + ty, x0:x0 + tx]
+
+        pred = model.predict_on_batch(batch[:len(tiles_now)])
+        if isinstance(pred, (list, tuple)):
+            pred = np.concatenate([np.asarray(p).reshape(*p.shape[0:3], -1) for p in pred], axis=-1)
+        pred = np.asarray(pred, dtype="float32").reshape(len(tiles_now), ty, tx, -1)
+
+        if data_out is None:
+            data_out = np.zeros((nsamples, ny, nx, pred.shape[-1]), dtype="float32")
+
+        for i, (it, y0, x0) in enumerate(tiles_now):
+            data_out[it, y0:y0 + ty, x0:x0 + tx] += weights[..., None] * pred[i]
+
+    data_out /= weights_sum[None, ..., None]
+    func_logger.info(f"Tiled inference finished in {timer() - t0:.2f}s.")
+
+    return data_out
+
+
+class ChunkedWriter(object):
+    """
+    Write a dataset chunk by chunk to a netCDF-file (or a Zarr-store if the file name ends with '.zarr') with an
+    unlimited append dimension. Variables without the append dimension (e.g. spatial coordinates) are written with the
+    first chunk only.
+    """
+    time_units = "seconds since 1970-01-01 00:00:00"
+
+    def __init__(self, fname: str, append_dim: str = "time"):
+        """
+        :param fname: path to netCDF-file or Zarr-store (existing files are replaced)
+        :param append_dim: name of the (unlimited) dimension along which the chunks are appended
+        """
+        self.fname = fname
+        self.append_dim = append_dim
+        self.lzarr = fname.endswith(".zarr")
+        self.nc_file = None
+        self.nwritten = 0
+
+        if os.path.isdir(self.fname):
+            shutil.rmtree(self.fname)
+        elif os.path.isfile(self.fname):
+            os.remove(self.fname)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, ds: xr.Dataset):
+        """
+        Append a chunk of data.
+        :param ds: dataset of the chunk (the data variables must comprise the append dimension)
+        """
+        if self.lzarr:
+            if self.nwritten == 0:
+                ds.to_zarr(self.fname, mode="w")
+            else:
+                ds.to_zarr(self.fname, append_dim=self.append_dim)
+        else:
+            if self.nc_file is None:
+                self.nc_file = self.create_netcdf(ds)
+            istart, iend = self.nwritten, self.nwritten + ds.dims[self.append_dim]
+            for var in ds.variables:
+                if self.append_dim in ds[var].dims:
+                    ind = tuple(slice(istart, iend) if dim == self.append_dim else slice(None)
+                                for dim in ds[var].dims)
+                    self.nc_file[var][ind] = self.encode(ds[var].values)
+            self.nc_file.sync()
+
+        self.nwritten += ds.dims[self.append_dim]
+
+    def create_netcdf(self, ds: xr.Dataset):
+        """
+        Create netCDF-file with the dimensions and variables of the dataset and write the variables without the
+        append dimension.
+        :param ds: dataset of the first chunk
+        :return: the netCDF4-dataset object (opened in write mode)
+        """
+        nc_file = nc.Dataset(self.fname, "w", format="NETCDF4")
+        for dim, size in ds.dims.items():
+            nc_file.createDimension(dim, None if dim == self.append_dim else size)
+
+        for var in ds.variables:
+            da = ds[var]
+            dtype = "f8" if np.issubdtype(da.dtype, np.datetime64) else da.dtype
+            nc_var = nc_file.createVariable(var, dtype, da.dims)
+            nc_var.setncatts({key: val for key, val in da.attrs.items() if key != "_FillValue"})
+            if np.issubdtype(da.dtype, np.datetime64):
+                nc_var.setncatts({"units": ChunkedWriter.time_units, "calendar": "standard"})
+            if self.append_dim not in da.dims:
+                nc_var[...] = self.encode(da.values)
+
+        return nc_file
+
+    @staticmethod
+    def encode(data: np.ndarray):
+        if np.issubdtype(data.dtype, np.datetime64):
+            return (data - np.datetime64("1970-01-01T00:00:00")) / np.timedelta64(1, "s")
+
+        return data
+
+    def close(self):
+        if self.nc_file is not None:
+            self.nc_file.close()
+            self.nc_file = None
+
+
+def read_time_chunk(fname: str, istart: int, iend: int, sample_dim: str = "time") -> xr.Dataset:
+    """
+    Read a chunk of samples from a netCDF-file into memory.
+    :param fname: path to netCDF-file
+    :param istart: index of first sample
+    :param iend: index of last sample (exclusive)
+    :param sample_dim: name of sample dimension
+    :return: the loaded dataset of the chunk
+    """
+    with xr.open_dataset(fname) as ds:
+        return ds.isel({sample_dim: slice(istart, iend)}).load()
+
+
+def stream_inference(fname_in: str, fname_out: str, process_chunk: Callable, chunk_size: int,
+                     sample_dim: str = "time"):
+    """
+    Perform inference chunk by chunk along the sample dimension. Reading the next chunk and writing the previous chunk
+    are done by a background thread while the current chunk is processed, i.e. I/O overlaps with inference.
+    Both I/O-operations are run by the same thread, since the underlying HDF5-library is not necessarily thread-safe.
+    The memory footprint is thus limited to about three chunks.
+    :param fname_in: path to netCDF-file with input data
+    :param fname_out: path to output netCDF-file or Zarr-store (see ChunkedWriter)
+    :param process_chunk: callable processing a chunk, i.e. the dataset read from fname_in, and returning the
+                          dataset to be written
+    :param chunk_size: number of samples per chunk
+    :param sample_dim: name of sample dimension
+    """
+    func_logger = logging.getLogger(f"{logger_module_name}.{stream_inference.__name__}")
+
+    with xr.open_dataset(fname_in) as ds:
+        nsamples = ds.dims[sample_dim]
+    chunks = [(istart, min(istart + chunk_size, nsamples)) for istart in range(0, nsamples, chunk_size)]
+    func_logger.info(f"Stream {nsamples:d} samples in {len(chunks):d} chunks from '{fname_in}' to '{fname_out}'.")
+
+    t0 = timer()
+    with ThreadPoolExecutor(max_workers=1) as io_pool, ChunkedWriter(fname_out, sample_dim) as writer:
+        future_read, future_write = io_pool.submit(read_time_chunk, fname_in, *chunks[0], sample_dim), None
+        for ichunk in range(len(chunks)):
+            ds_chunk = future_read.result()
+            if ichunk + 1 < len(chunks):
+                future_read = io_pool.submit(read_time_chunk, fname_in, *chunks[ichunk + 1], sample_dim)
+
+            ds_out = process_chunk(ds_chunk)
+
+            if future_write is not None:
+                future_write.result()
+            future_write = io_pool.submit(writer.write, ds_out)
+            func_logger.info(f"Chunk {ichunk + 1:d}/{len(chunks):d} processed after {timer() - t0:.2f}s.")
+
+        future_write.result()
+
+    func_logger.info(f"Streaming inference finished in {timer() - t0:.2f}s.")
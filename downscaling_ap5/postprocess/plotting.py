@@ -9,11 +9,13 @@ Methods for creating plots.
 __author__ = "Michael Langguth"
 __email__ = "m.langguth@fz-juelich.de"
 __date__ = "2022-01-20"
-__update__ = "2022-12-08"
+__update__ = "2026-10-18"
 
 # for processing data
-import os
+import os, sys
 import logging
+import multiprocessing
+from contextlib import contextmanager
 import numpy as np
 import xarray as xr
 import pandas as pd
@@ -28,6 +30,9 @@ from other_utils import provide_default
 # auxiliary variable for logger
 module_name = os.path.basename(__file__).rstrip(".py")
 
+# figure templates for map plots of the current process (see get_map_template)
+map_templates = {}
+
 
 # auxiliary function for colormap
 def get_colormap_temp(levels=None):
@@ -122,6 +127,78 @@ def create_mapplot(data1, data2, plt_fname, opt_plot={}):
     plt.close(fig)
 
     
+class MapTemplate(object):
+    """
+    Figure template for map plots of scores. The figure with axes, coast- and borderlines and colorbar is created once,
+    so that only the data of the pcolormesh-plot and the title have to be replaced for each plot.
+    """
+
+    def __init__(self, lat, lon, levels, cmap, projection, fs: int = 16):
+        """
+        :param lat: latitude (or rotated latitude) coordinate of the data
+        :param lon: longitude (or rotated longitude) coordinate of the data
+        :param levels: level boundaries
+        :param cmap: colors of the colormap
+        :param projection: projection of the data
+        :param fs: font size
+        """
+        self.fs = fs
+        lvl = np.asarray(levels)
+        # construct array for edges of grid points
+        dy, dx = np.round((lat[1] - lat[0]), 3), np.round((lon[1] - lon[0]), 3)
+        lat_e, lon_e = np.arange(lat[0]-dy/2, lat[-1]+dy, dy), np.arange(lon[0]-dx/2, lon[-1]+dx, dx)
+
+        # create colormap and corresponding norm
+        cmap_obj = mpl.colors.ListedColormap(cmap, name="temp" + "_map")
+        norm = mpl.colors.BoundaryNorm(lvl, cmap_obj.N)
+        # create plot objects
+        self.fig, self.ax = plt.subplots(1, 1, figsize=(12, 8), subplot_kw={"projection": ccrs.PlateCarree()})
+
+        # perform plotting with dummy data
+        self.mesh = self.ax.pcolormesh(lon_e, lat_e, np.full((len(lat), len(lon)), np.nan), cmap=cmap_obj, norm=norm,
+                                       transform=projection)
+
+        self.ax = decorate_plot(self.ax)
+
+        # add colorbar
+        cax = self.fig.add_axes([0.92, 0.15, 0.02, 0.7])
+        cbar = self.fig.colorbar(self.mesh, cax=cax, orientation="vertical", ticks=lvl[1::2])
+        cbar.ax.tick_params(labelsize=fs-2)
+
+    def render(self, data, title: str, plt_fname: str):
+        """
+        Plot data and save figure to file.
+        :param data: 2D-data to plot
+        :param title: title of the plot
+        :param plt_fname: name of the plot-file
+        """
+        self.mesh.set_array(np.ma.masked_invalid(np.squeeze(data)))
+        self.ax.set_title(title, size=self.fs)
+        self.fig.savefig(plt_fname, bbox_inches="tight")
+
+    def close(self):
+        plt.close(self.fig)
+
+
+def get_map_template(lat, lon, levels, cmap, projection, fs: int = 16) -> MapTemplate:
+    """
+    Get figure template for map plots. The templates are cached for the current process.
+    :return: MapTemplate-instance (see arguments of MapTemplate)
+    """
+    key = (np.asarray(lat).tobytes(), np.asarray(lon).tobytes(), np.asarray(levels).tobytes(),
+           np.asarray(cmap).tobytes(), projection.proj4_init, fs)
+    if key not in map_templates:
+        map_templates[key] = MapTemplate(lat, lon, levels, cmap, projection, fs)
+
+    return map_templates[key]
+
+
+def close_map_templates():
+    for template in map_templates.values():
+        template.close()
+    map_templates.clear()
+
+
 def create_map_score(score, plt_fname, **kwargs):
 
     func_logger = logging.getLogger(f"postprocess.{module_name}.{create_map_score.__name__}")
@@ -143,35 +220,99 @@ def create_map_score(score, plt_fname, **kwargs):
     except Exception as err:
         print("Failed to retrieve coordinates from score-data")
         raise err
-    # construct array for edges of grid points
-    dy, dx = np.round((lat[1] - lat[0]), 3), np.round((lon[1] - lon[0]), 3)
-    lat_e, lon_e = np.arange(lat[0]-dy/2, lat[-1]+dy, dy), np.arange(lon[0]-dx/2, lon[-1]+dx, dx)
 
-    # get colormap
-    # create colormap and corresponding norm
-    cmap_obj = mpl.colors.ListedColormap(cmap, name="temp" + "_map")
-    norm = mpl.colors.BoundaryNorm(lvl, cmap_obj.N)
-    # create plot objects
-    fig, ax = plt.subplots(1, 1, figsize=(12, 8), subplot_kw={"projection": ccrs.PlateCarree()})
+    # get (cached) figure template and perform plotting
+    template = get_map_template(lat, lon, lvl, cmap, projection, fs)
 
-    # perform plotting
-    plt1 = ax.pcolormesh(lon_e, lat_e, np.squeeze(score.values), cmap=cmap_obj, norm=norm, 
-                         transform=projection)
+    # save plot
+    plt_fname = plt_fname + ".png" if not plt_fname.endswith(".png") else plt_fname
+    func_logger.info(f"Save plot in file '{plt_fname}'")
+    template.render(score.transpose(*score_dims).values, title, plt_fname)
 
-    ax = decorate_plot(ax)
 
-    ax.set_title(title, size=fs)
+def init_plot_worker():
+    # non-interactive backend for the workers of the PlotPool
+    mpl.use("Agg")
 
-    # add colorbar
-    cax = fig.add_axes([0.92, 0.15, 0.02, 0.7])
-    cbar = fig.colorbar(plt1, cax=cax, orientation="vertical", ticks=lvl[1::2])
-    cbar.ax.tick_params(labelsize=fs-2)
 
-    # save plot and close figure
-    plt_fname = plt_fname + ".png" if not plt_fname.endswith(".png") else plt_fname
-    func_logger.info(f"Save plot in file '{plt_fname}'")
-    fig.savefig(plt_fname, bbox_inches="tight")
-    plt.close(fig)
+@contextmanager
+def hide_main_module():
+    """
+    Hide the main module from multiprocessing while starting processes, so that the child processes do not re-import
+    the main script (and thus all its imports, e.g. TensorFlow). Only usable if the child processes do not require
+    objects defined in the main script.
+    """
+    main_module = sys.modules["__main__"]
+    main_file, main_spec = main_module.__dict__.pop("__file__", None), getattr(main_module, "__spec__", None)
+    main_module.__spec__ = None
+    try:
+        yield
+    finally:
+        main_module.__spec__ = main_spec
+        if main_file is not None:
+            main_module.__file__ = main_file
+
+
+class PlotPool(object):
+    """
+    Pool of processes to render plots in parallel. Each worker caches its figure templates for map plots
+    (see get_map_template), so that the figure is set up only once per worker and plot type.
+    Since the plot jobs are submitted asynchronously, plotting overlaps with the computations of the main process.
+    With nworkers=0, the plots are rendered immediately in the main process.
+    NOTE: The workers are forked from a fork server (not from the main process) to avoid inheriting the state of
+          TensorFlow's threads. The fork server only preloads this module and the main script is not re-imported
+          by the workers, i.e. the workers start without importing TensorFlow.
+    """
+
+    def __init__(self, nworkers: int = 0):
+        """
+        :param nworkers: number of worker processes
+        """
+        self.nworkers = nworkers
+        self.pool = None
+        if nworkers > 0:
+            if "forkserver" in multiprocessing.get_all_start_methods():
+                ctx = multiprocessing.get_context("forkserver")
+                ctx.set_forkserver_preload([module_name])
+            else:
+                ctx = multiprocessing.get_context("spawn")
+            with hide_main_module():
+                self.pool = ctx.Pool(nworkers, initializer=init_plot_worker)
+        self.jobs = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def submit(self, plot_func, *args, **kwargs):
+        """
+        Submit plot job.
+        :param plot_func: plotting function (must be defined at module level to be picklable)
+        :param args: positional arguments of plot_func
+        :param kwargs: keyword arguments of plot_func
+        """
+        if self.pool is None:
+            plot_func(*args, **kwargs)
+        else:
+            self.jobs.append(self.pool.apply_async(plot_func, args, kwargs))
+
+    def wait(self):
+        """
+        Wait until all submitted plot jobs are finished (errors of the workers are re-raised).
+        """
+        for job in self.jobs:
+            job.get()
+        self.jobs = []
+
+    def close(self):
+        if self.pool is not None:
+            self.wait()
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        close_map_templates()
 
 
 def create_line_plot(data: xr.DataArray, data_std: xr.DataArray, model_name: str, metric: dict,
@@ -9,18 +9,23 @@ Auxiliary methods for postprocessing.
 __author__ = "Michael Langguth"
 __email__ = "m.langguth@fz-juelich.de"
 __date__ = "2022-12-08"
-__update__ = "2022-12-08"
+__update__ = "2026-10-18"
 
 import os
 import logging
+from timeit import default_timer as timer
+import numpy as np
 import xarray as xr
 from cartopy import crs
-from plotting import create_line_plot, create_map_score
+from plotting import create_line_plot, create_map_score, PlotPool
 
 # auxiliary variable for logger
 logger_module_name = f"main_postprocess.{__name__}"
 module_logger = logging.getLogger(logger_module_name)
 
+# cache for the (hour, season)-group indices of the time coordinate (shared by temporal and spatial evaluation)
+hour_season_cache = {}
+
 
 def get_model_info(model_base, output_base: str, exp_name: str, bool_last: bool = False, model_type: str = None):
 
@@ -53,90 +58,181 @@ def get_model_info(model_base, output_base: str, exp_name: str, bool_last: bool
     return model_dir, plt_dir, norm_dir, model_type
 
 
-def run_evaluation_time(score_engine, score_name: str, score_unit: str, plot_dir: str, **plt_kwargs):
+def get_hour_season_groups(times: xr.DataArray):
+    """
+    Get the (hour, season)-groups of a time coordinate as one-hot encoded matrix. The result is cached, so that it can
+    be reused for all evaluation metrics on the same time coordinate.
+    :param times: time coordinate
+    :return: hours and seasons (ordered as in xarray's groupby) and one-hot matrix of shape (nhours*nseasons, ntimes)
+    """
+    key = times.values.tobytes()
+    if key not in hour_season_cache:
+        hours, seasons = times.dt.hour.values, times.dt.season.values
+        hours_uni, ind_hour = np.unique(hours, return_inverse=True)
+        seasons_uni, ind_season = np.unique(seasons, return_inverse=True)
+
+        onehot = np.zeros((len(hours_uni) * len(seasons_uni), len(hours)))
+        onehot[ind_hour * len(seasons_uni) + ind_season, np.arange(len(hours))] = 1.
+        hour_season_cache[key] = (hours_uni, seasons_uni, onehot)
+
+    return hour_season_cache[key]
+
+
+def get_hour_season_stats(score_all: xr.DataArray, sample_dim: str = "time", chunk_size: int = 1000) -> xr.Dataset:
+    """
+    Get mean and standard deviation of a metric for each daytime (hour) and for each combination of daytime and
+    season. All groups are reduced at once by multiplying the one-hot encoded groups (see get_hour_season_groups) with
+    the data. NaNs are ignored as in xarray's mean and std.
+    The data is read (or computed if it is lazily opened, e.g. with dask) chunk by chunk, so that the memory footprint
+    is bounded for large datasets.
+    :param score_all: metric with sample dimension (and optionally further dimensions, e.g. for maps)
+    :param sample_dim: name of sample dimension with time coordinate
+    :param chunk_size: number of samples which are processed at once (limits the memory footprint)
+    :return: dataset with 'mean' and 'std' along (hour, season), 'hourly_mean' and 'hourly_std' along hour and
+             the overall mean 'total_mean'
+    """
+    func_logger = logging.getLogger(f"{logger_module_name}.{get_hour_season_stats.__name__}")
+
+    hours, seasons, onehot = get_hour_season_groups(score_all[sample_dim])
+
+    score_all = score_all.transpose(sample_dim, ...)
+    dims_other = list(score_all.dims[1:])
+    nsamples, npoints = score_all.shape[0], int(np.prod(score_all.shape[1:]))
+
+    # accumulate number of valid values, sum and sum of squares for each group
+    sums = [np.zeros((onehot.shape[0], npoints)) for _ in range(3)]
+    nchunks, t0 = int(np.ceil(nsamples / chunk_size)), timer()
+    for ichunk, istart in enumerate(range(0, nsamples, chunk_size)):
+        sl = slice(istart, istart + chunk_size)
+        data = score_all.isel({sample_dim: sl}).values.reshape(-1, npoints).astype("float64")
+        valid = np.isfinite(data)
+        data[~valid] = 0.
+        for i, arr in enumerate((valid.astype("float64"), data, np.square(data))):
+            sums[i] += onehot[:, sl] @ arr
+        if nchunks > 1:
+            func_logger.debug(f"Chunk {ichunk + 1:d}/{nchunks:d} processed " +
+                              f"({(istart + data.shape[0]) / (timer() - t0):.1f} samples/s).")
+
+    sums = [arr.reshape(len(hours), len(seasons), *score_all.shape[1:]) for arr in sums]
+    sums_hourly = [arr.sum(axis=1) for arr in sums]
+    sums_total = [arr.sum(axis=0) for arr in sums_hourly]
+
+    def get_mean_std(n, s1, s2):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = s1 / n
+            std = np.sqrt(np.maximum(s2 / n - np.square(mean), 0.))
+        return mean, std
+
+    mean, std = get_mean_std(*sums)
+    hourly_mean, hourly_std = get_mean_std(*sums_hourly)
+    total_mean, _ = get_mean_std(*sums_total)
+
+    coords = {"hour": hours, "season": seasons,
+              **{dim: score_all[dim] for dim in dims_other if dim in score_all.coords}}
+    dims_hs, dims_h = ["hour", "season"] + dims_other, ["hour"] + dims_other
+
+    return xr.Dataset({"mean": (dims_hs, mean), "std": (dims_hs, std),
+                       "hourly_mean": (dims_h, hourly_mean), "hourly_std": (dims_h, hourly_std),
+                       "total_mean": (dims_other, total_mean)}, coords=coords)
+
+
+def run_evaluation_time(score_engine, score_name: str, score_unit: str, plot_dir: str, plot_pool: PlotPool = None,
+                        **plt_kwargs):
     """
     Create line plots of desired evaluation metric. Evaluation metric must have a time-dimension
-    :param score_engine: Score engine object to comput evaluation metric
+    :param score_engine: Score engine object to comput evaluation metric or dataset with precomputed metrics
+                         (see Scores.compute_all)
     :param score_name: Name of evaluation metric (must be implemented into score_engine)
     :param score_unit: Unit of evaluation metric
     :param plot_dir: Directory to save plot files
+    :param plot_pool: pool to render the plots asynchronously (default: serial plotting)
     """
     # get local logger
     func_logger = logging.getLogger(f"{logger_module_name}.{run_evaluation_time.__name__}")
 
     os.makedirs(plot_dir, exist_ok=True)
+    # a pool created here for serial plotting is closed at the end
+    lclose_pool = plot_pool is None
+    plot_pool = PlotPool(0) if lclose_pool else plot_pool
     model_type = plt_kwargs.get("model_type", "wgan")
 
     func_logger.info(f"Start evaluation in terms of {score_name}")
-    score_all = score_engine(score_name)
+    score_all = score_engine[score_name] if isinstance(score_engine, xr.Dataset) else score_engine(score_name)
 
     func_logger.info(f"Globally averaged {score_name}: {score_all.mean().values:.4f} {score_unit}, " +
                      f"standard deviation: {score_all.std().values:.4f}")
 
-    score_hourly_all = score_all.groupby("time.hour")
-    score_hourly_mean, score_hourly_std = score_hourly_all.mean(), score_hourly_all.std()
-    for hh in range(24):
-        func_logger.debug(f"Evaluation for {hh:02d} UTC")
-        if hh == 0:
-            tmp = score_all.isel({"time": score_all.time.dt.hour == hh}).groupby("time.season")
-            score_hourly_mean_sea, score_hourly_std_sea = tmp.mean().copy(), tmp.std().copy()
-        else:
-            tmp = score_all.isel({"time": score_all.time.dt.hour == hh}).groupby("time.season")
-            score_hourly_mean_sea, score_hourly_std_sea = xr.concat([score_hourly_mean_sea, tmp.mean()], dim="hour"), \
-                                                          xr.concat([score_hourly_std_sea, tmp.std()], dim="hour")
+    stats = get_hour_season_stats(score_all)
+    score_hourly_mean, score_hourly_std = stats["hourly_mean"], stats["hourly_std"]
+    score_hourly_mean_sea, score_hourly_std_sea = stats["mean"], stats["std"]
 
     # create plots
-    create_line_plot(score_hourly_mean, score_hourly_std, model_type.upper(),
+    plot_pool.submit(create_line_plot, score_hourly_mean, score_hourly_std, model_type.upper(),
                      {score_name.upper(): score_unit},
                      os.path.join(plot_dir, f"downscaling_{model_type}_{score_name.lower()}.png"), **plt_kwargs)
 
     for sea in score_hourly_mean_sea["season"]:
         func_logger.debug(f"Evaluation for season '{sea}'...")
-        create_line_plot(score_hourly_mean_sea.sel({"season": sea}),
+        plot_pool.submit(create_line_plot, score_hourly_mean_sea.sel({"season": sea}),
                          score_hourly_std_sea.sel({"season": sea}),
                          model_type.upper(), {score_name.upper(): score_unit},
                          os.path.join(plot_dir, f"downscaling_{model_type}_{score_name.lower()}_{sea.values}.png"),
                          **plt_kwargs)
+
+    if lclose_pool: plot_pool.close()
+
     return True
 
 
-def run_evaluation_spatial(score_engine, score_name: str, plot_dir: str, **plt_kwargs):
+def run_evaluation_spatial(score_engine, score_name: str, plot_dir: str, plot_pool: PlotPool = None, **plt_kwargs):
     """
     Create map plots of desired evaluation metric. Evaluation metric must be given in rotated coordinates.
     To-Do: Add flexibility regarding underlying coordinate data (i.e. projection).
-    :param score_engine: Score engine object to comput evaluation metric
+    :param score_engine: Score engine object to comput evaluation metric or dataset with precomputed metrics
+                         (see Scores.compute_all)
     :param score_name: Name of evaluation metric (must be implemented into score_engine)
     :param plot_dir: Directory to save plot files
+    :param plot_pool: pool to render the plots asynchronously (default: serial plotting)
+    NOTE: The metric may be lazily opened (e.g. dask-backed). It is then computed chunk by chunk
+          (see get_hour_season_stats).
     """
     # get local logger
     func_logger = logging.getLogger(f"{logger_module_name}.{run_evaluation_spatial.__name__}")
 
     os.makedirs(plot_dir, exist_ok=True)
+    # a pool created here for serial plotting is closed at the end
+    lclose_pool = plot_pool is None
+    plot_pool = PlotPool(0) if lclose_pool else plot_pool
 
     model_type = plt_kwargs.get("model_type", "wgan")
-    score_all = score_engine(score_name)
+    score_all = score_engine[score_name] if isinstance(score_engine, xr.Dataset) else score_engine(score_name)
     cosmo_prj = crs.RotatedPole(pole_longitude=-162.0, pole_latitude=39.25)
 
-    score_mean = score_all.mean(dim="time")
+    # the statistics are computed in one pass over the (possibly lazily opened) data
+    stats = get_hour_season_stats(score_all)
+
+    score_mean = stats["total_mean"]
     fname = os.path.join(plot_dir, f"downscaling_{model_type}_{score_name.lower()}_avg_map.png")
-    create_map_score(score_mean, fname, score_dims=["rlat", "rlon"],
+    plot_pool.submit(create_map_score, score_mean, fname, score_dims=["rlat", "rlon"],
                      title=f"{score_name.upper()} (avg.)", projection=cosmo_prj, **plt_kwargs)
 
-    score_hourly_mean = score_all.groupby("time.hour").mean(dim=["time"])
+    score_hourly_mean = stats["hourly_mean"]
     for hh in range(24):
         func_logger.debug(f"Evaluation for {hh:02d} UTC")
         fname = os.path.join(plot_dir, f"downscaling_{model_type}_{score_name.lower()}_{hh:02d}_map.png")
-        create_map_score(score_hourly_mean.sel({"hour": hh}), fname,
+        plot_pool.submit(create_map_score, score_hourly_mean.sel({"hour": hh}), fname,
                          score_dims=["rlat", "rlon"], title=f"{score_name.upper()} {hh:02d} UTC",
                          projection=cosmo_prj, **plt_kwargs)
 
     for hh in range(24):
-        score_now = score_all.isel({"time": score_all.time.dt.hour == hh}).groupby("time.season").mean(dim="time")
+        score_now = stats["mean"].sel({"hour": hh})
         for sea in score_now["season"]:
             func_logger.debug(f"Evaluation for season '{str(sea)}' at {hh:02d} UTC")
             fname = os.path.join(plot_dir,
                                  f"downscaling_{model_type}_{score_name.lower()}_{sea.values}_{hh:02d}_map.png")
-            create_map_score(score_now.sel({"season": sea}), fname, score_dims=["rlat", "rlon"],
+            plot_pool.submit(create_map_score, score_now.sel({"season": sea}), fname, score_dims=["rlat", "rlon"],
                              title=f"{score_name} {sea.values} {hh:02d} UTC", projection=cosmo_prj, **plt_kwargs)
 
+    if lclose_pool: plot_pool.close()
+
     return True
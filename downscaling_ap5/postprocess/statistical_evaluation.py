@@ -9,12 +9,16 @@ Collection of auxiliary functions for statistical evaluation and class for Score
 __email__ = "m.langguth@fz-juelich.de"
 __author__ = "Michael Langguth"
 __date__ = "2022-09-11"
+__update__ = "2026-10-18"
 
 import numpy as np
 import xarray as xr
 from typing import Union, List
 import datetime
 import pandas as pd
+import dask
+from timeit import default_timer as timer
+from concurrent.futures import ThreadPoolExecutor
 try:
     from tqdm import tqdm
     l_tqdm = True
@@ -25,15 +29,44 @@ from other_utils import provide_default, check_str_in_list
 # basic data types
 da_or_ds = Union[xr.DataArray, xr.Dataset]
 
+# cache for the metric terms of geographical grids (see Scores.get_geo_metric_terms)
+geo_metric_terms_cache = {}
+
+known_schedulers = ["threads", "processes", "synchronous"]
+
+
+def get_dask_config(scheduler: str = "threads", nworkers: int = None):
+    """
+    Get configuration of the local dask-scheduler to compute (lazily opened) data chunk by chunk.
+    Usage: with dask.config.set(**get_dask_config("threads", 4)): ...
+    :param scheduler: type of local scheduler ('threads', 'processes' or 'synchronous')
+    :param nworkers: number of workers (default: number of cores)
+    :return: dictionary to configure dask
+    """
+    if scheduler not in known_schedulers:
+        raise ValueError(f"Unknown scheduler '{scheduler}'. Choose one of {', '.join(known_schedulers)}.")
+
+    config = {"scheduler": scheduler}
+    if nworkers is not None:
+        config["num_workers"] = nworkers
+
+    return config
+
 
 def calculate_cond_quantiles(data_fcst: xr.DataArray, data_ref: xr.DataArray, factorization="calibration_refinement",
-                             quantiles=(0.05, 0.5, 0.95)):
+                             quantiles=(0.05, 0.5, 0.95), chunk_size: int = None, sketch_resolution: float = 0.01):
     """
-    Calculate conditional quantiles of forecast and observation/reference data with selected factorization
+    Calculate conditional quantiles of forecast and observation/reference data with selected factorization.
+    The conditioning data is digitized into 1-unit bins and the target data is sorted by bin once, so that all quantiles
+    of all bins are obtained in a single pass. If chunk_size is parsed, the data is streamed in chunks along the first
+    dimension and the quantiles are estimated from a mergeable histogram sketch (see CondHistogramSketch), which
+    allows processing data that does not fit into memory.
     :param data_fcst: forecast data array
     :param data_ref: observational/reference data array
     :param factorization: factorization: "likelihood-base_rate" p(m|o) or "calibration_refinement" p(o|m)-> default
     :param quantiles: conditional quantiles
+    :param chunk_size: number of samples along the first dimension per chunk (default: exact calculation in memory)
+    :param sketch_resolution: resolution of the histogram sketch (upper bound of the error of the estimated quantiles)
     :return quantile_panel: conditional quantiles of p(m|o) or p(o|m)
     """
     method = calculate_cond_quantiles.__name__
@@ -69,15 +102,29 @@ def calculate_cond_quantiles(data_fcst: xr.DataArray, data_ref: xr.DataArray, fa
     data_tar_longname = provide_default(data_tar.attrs, "longname", "target_variable")
     data_tar_unit = provide_default(data_cond.attrs, "unit", "unknown")
 
+    # get data ranges (streamed over chunks if desired)
+    if chunk_size is None:
+        chunk_slices = None
+        cond_min, cond_max = np.min(data_cond).values, np.max(data_cond).values
+        tar_min, tar_max = np.min(data_tar).values, np.max(data_tar).values
+    else:
+        sample_dim = data_cond.dims[0]
+        chunk_slices = [{sample_dim: slice(i, i + chunk_size)}
+                        for i in range(0, data_cond.sizes[sample_dim], chunk_size)]
+        ranges = np.array([[np.nanmin(data_cond.isel(sl).values), np.nanmax(data_cond.isel(sl).values),
+                            np.nanmin(data_tar.isel(sl).values), np.nanmax(data_tar.isel(sl).values)]
+                           for sl in chunk_slices])
+        cond_min, cond_max = np.nanmin(ranges[:, 0]), np.nanmax(ranges[:, 1])
+        tar_min, tar_max = np.nanmin(ranges[:, 2]), np.nanmax(ranges[:, 3])
+
     # get bins for conditioning
-    data_cond_min, data_cond_max = np.floor(np.min(data_cond)), np.ceil(np.max(data_cond))
+    data_cond_min, data_cond_max = np.floor(cond_min), np.ceil(cond_max)
     bins = list(np.arange(int(data_cond_min), int(data_cond_max) + 1))
-    bins_c = 0.5 * (np.asarray(bins[0:-1]) + np.asarray(bins[1:]))
     nbins = len(bins) - 1
 
     # get all possible bins from target and conditioning variable
-    data_all_min, data_all_max = np.minimum(data_cond_min, np.floor(np.min(data_tar))),\
-                                 np.maximum(data_cond_max, np.ceil(np.max(data_tar)))
+    data_all_min, data_all_max = np.minimum(data_cond_min, np.floor(tar_min)),\
+                                 np.maximum(data_cond_max, np.ceil(tar_max))
     bins_all = list(np.arange(int(data_all_min), int(data_all_max) + 1))
     bins_c_all = 0.5 * (np.asarray(bins_all[0:-1]) + np.asarray(bins_all[1:]))
     # initialize quantile data array
@@ -88,25 +135,173 @@ def calculate_cond_quantiles(data_fcst: xr.DataArray, data_ref: xr.DataArray, fa
                                          "tar_var_name": data_tar_longname, "tar_var_unit": data_tar_unit})
     
     print("%{0}: Start caclulating conditional quantiles for all {1:d} bins.".format(method, nbins))
+    if chunk_slices is None:
+        cond_quantiles = get_cond_quantiles_sorted(data_cond.values, data_tar.values, bins[0], nbins, quantiles)
+    else:
+        sketch = CondHistogramSketch(bins[0], nbins, (data_all_min, data_all_max), sketch_resolution)
+        for sl in chunk_slices:
+            sketch.update(data_cond.isel(sl).values, data_tar.isel(sl).values)
+        cond_quantiles = sketch.get_quantiles(quantiles)
+
     # fill the quantile data array
-    for i in np.arange(nbins):
-        # conditioning of ground truth based on forecast
-        data_cropped = data_tar.where(np.logical_and(data_cond >= bins[i], data_cond < bins[i + 1]))
-        # quantile-calculation
-        quantile_panel.loc[dict(bin_center=bins_c[i])] = data_cropped.quantile(quantiles)
+    ind_s = bins_all.index(bins[0])
+    quantile_panel[ind_s: ind_s + nbins] = cond_quantiles
 
     return quantile_panel, data_cond
 
 
+def get_cond_bin_index(data_cond: np.ndarray, bin_start: int, nbins: int):
+    """
+    Get index of 1-unit bins [bin_start + i, bin_start + i + 1) for the conditioning data.
+    :param data_cond: conditioning data
+    :param bin_start: lower edge of first bin
+    :param nbins: number of bins
+    :return: bin index (flattened) and mask of data within the bins
+    """
+    with np.errstate(invalid="ignore"):
+        ibin = np.floor(np.ravel(data_cond)) - bin_start
+        mask = (ibin >= 0) & (ibin < nbins)
+
+    return np.where(mask, ibin, 0).astype(np.int64), mask
+
+
+def get_cond_quantiles_sorted(data_cond: np.ndarray, data_tar: np.ndarray, bin_start: int, nbins: int, quantiles):
+    """
+    Calculate the quantiles of the target data for all bins of the conditioning data at once. The target data is
+    sorted by bin and value and the quantiles are obtained by linear interpolation as in numpy's quantile-function.
+    :param data_cond: conditioning data
+    :param data_tar: target data
+    :param bin_start: lower edge of first bin (bins have a width of one unit, see get_cond_bin_index)
+    :param nbins: number of bins
+    :param quantiles: quantiles to calculate
+    :return: array of quantiles with shape (nbins, nquantiles), NaN for empty bins
+    """
+    ibin, mask = get_cond_bin_index(data_cond, bin_start, nbins)
+    data_tar = np.ravel(data_tar)
+    mask &= ~np.isnan(data_tar)
+    ibin, data_tar = ibin[mask], data_tar[mask]
+
+    # sort target data by bin and value
+    data_sorted = data_tar[np.lexsort((data_tar, ibin))]
+    counts = np.bincount(ibin, minlength=nbins)
+    starts = np.cumsum(counts) - counts
+
+    # linear interpolation between the closest ranks (see numpy's quantile-function)
+    q = np.asarray(quantiles, dtype=np.float64)
+    virtual_ind = (counts[:, None] - 1) * q[None, :]
+    ind_lo = np.floor(virtual_ind).astype(np.int64)
+    ind_hi = np.minimum(ind_lo + 1, counts[:, None] - 1)
+    gamma = virtual_ind - ind_lo
+
+    lempty = counts == 0
+    offset = np.where(lempty, 0, starts)[:, None]
+    data_lo = data_sorted[np.where(lempty[:, None], 0, offset + ind_lo)] if data_sorted.size > 0 else \
+        np.full(virtual_ind.shape, np.nan)
+    data_hi = data_sorted[np.where(lempty[:, None], 0, offset + ind_hi)] if data_sorted.size > 0 else \
+        np.full(virtual_ind.shape, np.nan)
+    diff = data_hi - data_lo
+    cond_quantiles = np.where(gamma >= 0.5, data_hi - diff * (1. - gamma), data_lo + diff * gamma)
+    cond_quantiles[lempty] = np.nan
+
+    return cond_quantiles
+
+
+class CondHistogramSketch(object):
+    """
+    Mergeable sketch to estimate conditional quantiles. For each 1-unit bin of the conditioning data, the target data is
+    counted in a fine histogram with fixed resolution. Sketches of different data chunks (or processes) can be merged
+    by adding the counts. The quantiles are estimated with the same convention as numpy's (linear) quantile, i.e. by
+    interpolating between the order statistics at rank (n-1)*q. Each order statistic is located in the histogram cell
+    containing it, so the error of the estimated quantiles is bounded by the resolution, also for sparsely populated
+    bins.
+    """
+
+    def __init__(self, bin_start: int, nbins: int, tar_range, resolution: float = 0.01):
+        """
+        :param bin_start: lower edge of first bin of conditioning data
+        :param nbins: number of bins of conditioning data
+        :param tar_range: range (min, max) of target data
+        :param resolution: bin width of the histograms for the target data
+        """
+        self.bin_start, self.nbins = bin_start, nbins
+        self.tar_min, self.resolution = float(tar_range[0]), resolution
+        self.ntar = max(int(np.ceil((tar_range[1] - tar_range[0]) / resolution)), 1)
+        self.counts = np.zeros((nbins, self.ntar), dtype=np.int64)
+
+    def update(self, data_cond: np.ndarray, data_tar: np.ndarray):
+        """
+        Add data to the sketch.
+        :param data_cond: conditioning data
+        :param data_tar: target data (same shape as data_cond)
+        """
+        ibin, mask = get_cond_bin_index(data_cond, self.bin_start, self.nbins)
+        data_tar = np.ravel(data_tar)
+        mask &= ~np.isnan(data_tar)
+        itar = np.clip(np.floor((data_tar[mask] - self.tar_min) / self.resolution), 0, self.ntar - 1).astype(np.int64)
+
+        self.counts += np.bincount(ibin[mask] * self.ntar + itar, minlength=self.counts.size).reshape(self.counts.shape)
+
+    def merge(self, other):
+        """
+        Merge with another sketch.
+        :param other: sketch with the same bins and resolution
+        """
+        if not (self.bin_start, self.nbins, self.tar_min, self.resolution, self.ntar) == \
+               (other.bin_start, other.nbins, other.tar_min, other.resolution, other.ntar):
+            raise ValueError("Sketches with different bins or resolution cannot be merged.")
+
+        self.counts += other.counts
+
+        return self
+
+    def get_quantiles(self, quantiles):
+        """
+        Estimate the conditional quantiles.
+        :param quantiles: quantiles to estimate
+        :return: array of quantiles with shape (nbins, nquantiles), NaN for empty bins
+        """
+        cdf = np.cumsum(self.counts, axis=1)
+        ntot = cdf[:, -1]
+        cond_quantiles = np.full((self.nbins, len(quantiles)), np.nan)
+        for ibin in np.nonzero(ntot)[0]:
+            rank = (ntot[ibin] - 1) * np.asarray(quantiles)
+            rank_lo = np.floor(rank).astype(np.int64)
+            rank_hi = np.minimum(rank_lo + 1, ntot[ibin] - 1)
+            val_lo, val_hi = self.get_order_stats(ibin, cdf[ibin], rank_lo), self.get_order_stats(ibin, cdf[ibin],
+                                                                                                   rank_hi)
+            cond_quantiles[ibin] = val_lo + (rank - rank_lo) * (val_hi - val_lo)
+
+        return cond_quantiles
+
+    def get_order_stats(self, ibin: int, cdf: np.ndarray, ranks: np.ndarray):
+        """
+        Estimate order statistics of a bin. The samples within a histogram cell are assumed to be evenly spread.
+        :param ibin: index of the bin of the conditioning data
+        :param cdf: cumulative histogram of the bin
+        :param ranks: (0-based) ranks of the order statistics
+        :return: estimated order statistics
+        """
+        itar = np.searchsorted(cdf, ranks, side="right")
+        counts = self.counts[ibin, itar]
+        rank_cell = ranks - (cdf[itar] - counts)
+
+        return self.tar_min + self.resolution * (itar + (rank_cell + 0.5) / counts)
+
+
 def perform_block_bootstrap_metric(metric: da_or_ds, dim_name: str, block_length: int, nboots_block: int = 1000,
-                                   seed: int = 42):
+                                   seed: int = 42, chunk_size: int = 100, nworkers: int = 1):
     """
-    Performs block bootstrapping on metric along given dimension (e.g. along time dimension)
+    Performs block bootstrapping on metric along given dimension (e.g. along time dimension).
+    The block means are stored in a (nblocks x ...)-array. The resampled means are obtained by multiplying a
+    (nboots x nblocks)-matrix counting how often each block is drawn with the block means, which is done in chunks
+    along the bootstrap axis to limit the memory footprint.
     :param metric: DataArray or dataset of metric that should be bootstrapped
     :param dim_name: name of the dimension on which division into blocks is applied
     :param block_length: length of block (index-based)
     :param nboots_block: number of bootstrapping steps to be performed
     :param seed: seed for random block sampling (to be held constant for reproducability)
+    :param chunk_size: number of bootstrapping steps that are processed at once
+    :param nworkers: number of threads to process the chunks in parallel
     :return: bootstrapped version of metric(-s)
     """
 
@@ -127,38 +322,73 @@ def perform_block_bootstrap_metric(metric: da_or_ds, dim_name: str, block_length
         raise ValueError("%{0}: Less than 10 blocks are present with given block length {1:d}."
                          .format(method, block_length) + " Too less for bootstrapping.")
 
-    # precompute metrics of block
-    for iblock in np.arange(nblocks):
-        ind_s, ind_e = iblock * block_length, (iblock + 1) * block_length
-        metric_block_aux = metric.isel({dim_name: slice(ind_s, ind_e)}).mean(dim=dim_name)
-        if iblock == 0:
-            metric_val_block = metric_block_aux.expand_dims(dim={"iblock": 1}, axis=0).copy(deep=True)
-        else:
-            metric_val_block = xr.concat([metric_val_block, metric_block_aux.expand_dims(dim={"iblock": 1}, axis=0)],
-                                         dim="iblock")
-
-    metric_val_block["iblock"] = np.arange(nblocks)
-
-    # get random blocks
+    # get random blocks and count how often each block is drawn
     np.random.seed(seed)
     iblocks_boot = np.sort(np.random.randint(nblocks, size=(nboots_block, nblocks)))
+    counts_boot = np.zeros((nboots_block, nblocks))
+    np.add.at(counts_boot, (np.arange(nboots_block)[:, None], iblocks_boot), 1.)
 
     print("%{0}: Start block bootstrapping...".format(method))
-    iterator_b = np.arange(nboots_block)
-    if l_tqdm:
-        iterator_b = tqdm(iterator_b)
-    for iboot_b in iterator_b:
-        metric_boot_aux = metric_val_block.isel(iblock=iblocks_boot[iboot_b, :]).mean(dim="iblock")
-        if iboot_b == 0:
-            metric_boot = metric_boot_aux.expand_dims(dim={"iboot": 1}, axis=0).copy(deep=True)
-        else:
-            metric_boot = xr.concat([metric_boot, metric_boot_aux.expand_dims(dim={"iboot": 1}, axis=0)], dim="iboot")
-
-    # set iboot-coordinate
-    metric_boot["iboot"] = np.arange(nboots_block)
-    if isinstance(metric_boot, xr.Dataset):
+    if isinstance(metric, xr.Dataset):
+        metric_boot = xr.Dataset({var: block_bootstrap_da(metric[var], dim_name, block_length, nblocks, counts_boot,
+                                                          chunk_size, nworkers)
+                                  for var in metric.data_vars})
         new_varnames = ["{0}_bootstrapped".format(var) for var in metric.data_vars]
         metric_boot = metric_boot.rename(dict(zip(metric.data_vars, new_varnames)))
+    else:
+        metric_boot = block_bootstrap_da(metric, dim_name, block_length, nblocks, counts_boot, chunk_size, nworkers)
+
+    return metric_boot
+
+
+def block_bootstrap_da(da: xr.DataArray, dim_name: str, block_length: int, nblocks: int, counts_boot: np.ndarray,
+                       chunk_size: int = 100, nworkers: int = 1) -> xr.DataArray:
+    """
+    Auxiliary function of perform_block_bootstrap_metric to bootstrap a DataArray. NaNs are ignored as in xarray's
+    mean.
+    :param da: DataArray of metric (sorted along dim_name)
+    :param dim_name: name of the dimension on which division into blocks is applied
+    :param block_length: length of block (index-based)
+    :param nblocks: number of blocks
+    :param counts_boot: (nboots x nblocks)-matrix counting how often each block is drawn per bootstrapping step
+    :param chunk_size: number of bootstrapping steps that are processed at once
+    :param nworkers: number of threads to process the chunks in parallel
+    :return: bootstrapped DataArray with iboot-dimension
+    """
+    nboots = counts_boot.shape[0]
+    if dim_name not in da.dims:
+        return da.expand_dims(dim={"iboot": np.arange(nboots)}, axis=0)
+
+    da_template = da.isel({dim_name: 0}, drop=True)
+
+    # precompute metrics of blocks
+    data = da.transpose(dim_name, ...).values[:nblocks * block_length].astype("float64")
+    data = data.reshape(nblocks, block_length, -1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        valid = np.isfinite(data)
+        metric_val_block = np.where(valid, data, 0.).sum(axis=1) / valid.sum(axis=1)
+    valid_block = np.isfinite(metric_val_block)
+    metric_val_block[~valid_block] = 0.
+    valid_block = valid_block.astype("float64")
+
+    def boot_chunk(istart: int):
+        counts = counts_boot[istart: istart + chunk_size]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return istart, (counts @ metric_val_block) / (counts @ valid_block)
+
+    metric_boot = np.empty((nboots, metric_val_block.shape[-1]))
+    iterator_b = range(0, nboots, chunk_size)
+    with ThreadPoolExecutor(max_workers=nworkers) as executor:
+        results = executor.map(boot_chunk, iterator_b)
+        if l_tqdm:
+            results = tqdm(results, total=len(iterator_b))
+        for istart, metric_boot_chunk in results:
+            metric_boot[istart: istart + chunk_size] = metric_boot_chunk
+
+    metric_boot = xr.DataArray(metric_boot.reshape(nboots, *da_template.shape), dims=["iboot"] + list(da_template.dims),
+                               coords=da_template.coords, name=da.name)
+    # set iboot-coordinate
+    metric_boot["iboot"] = np.arange(nboots)
 
     return metric_boot
 
@@ -170,7 +400,7 @@ class Scores:
 
     def __init__(self, data_fcst: xr.DataArray, data_ref: xr.DataArray, dims: List[str]):
         """
-        :param data_fcst: forecast data to evaluate
+        :param data_fcst: forecast data to evaluate (may be lazily opened, e.g. time-chunked with xr.open_mfdataset)
         :param data_ref: reference or ground truth data
         """
         self.metrics_dict = {"mse": self.calc_mse, "rmse": self.calc_rmse, "bias": self.calc_bias,
@@ -289,8 +519,8 @@ class Scores:
         order = kwargs.get("order", 1)
         avg_dims = kwargs.get("non_spatial_avg_dims", None)
 
-        fcst_grad = self.calc_geo_spatial_diff(self.data_fcst, order=order)
-        ref_grd = self.calc_geo_spatial_diff(self.data_ref, order=order)
+        # differential operator is applied to forecast and reference data in one pass
+        fcst_grad, ref_grd = self.calc_geo_spatial_diff(self.data_fcst, self.data_ref, order=order)
 
         ratio_spat_variability = (fcst_grad / ref_grd)
         if avg_dims is not None:
@@ -298,22 +528,183 @@ class Scores:
 
         return ratio_spat_variability
 
+    def compute_all(self, metrics: List[str] = None, reduce_dims: Union[List[str], dict] = None,
+                    chunk_size: int = 720, sample_dim: str = "time", scheduler: str = "threads", nworkers: int = None,
+                    **kwargs) -> xr.Dataset:
+        """
+        Calculate several metrics in a single pass over the data. The data is streamed in chunks along the sample
+        dimension, the difference (and the gradient amplitudes) of each chunk are computed once and the required sums
+        are accumulated for all metrics and reductions. Thus, the memory footprint is limited to a few data chunks if
+        the sample dimension is reduced (e.g. for maps of the time-averaged metrics).
+        Lazily opened (dask-backed) data, e.g. from xr.open_mfdataset, is computed chunk by chunk with the local
+        dask-scheduler. For such data, metrics without any reduction are returned lazily (i.e. they are computed
+        chunk-wise by the subsequent evaluation).
+        :param metrics: list of metrics (see metrics_dict, default: all metrics)
+        :param reduce_dims: dimensions to average over (default: avg_dims). A dictionary of dimension lists may be
+                            parsed to get several reductions at once, e.g. {"domain": ["rlat", "rlon"],
+                            "map": ["time"]}. The variables of the returned dataset are then named
+                            '<metric>_<reduction>'.
+        :param chunk_size: number of samples per chunk
+        :param sample_dim: name of sample dimension along which the data is chunked
+        :param scheduler: local dask-scheduler for lazily opened data (see get_dask_config)
+        :param nworkers: number of workers of the dask-scheduler
+        :param kwargs: known keyword arguments 'pixel_max' (see calc_psnr) and 'order' (see calc_spatial_variability)
+        :return: dataset with the metrics (NOTE: grad_amplitude is always averaged over the spatial dimensions,
+                 cf. calc_spatial_variability)
+        """
+        metrics = list(self.metrics_dict.keys()) if metrics is None else metrics
+        _ = check_str_in_list(list(self.metrics_dict.keys()), metrics)
+        reduce_dims = self.avg_dims if reduce_dims is None else reduce_dims
+        reductions = reduce_dims if isinstance(reduce_dims, dict) else {"": reduce_dims}
+
+        method = Scores.compute_all.__name__
+
+        # metrics without reduction on lazily opened data are kept lazy
+        llazy = self.data_fcst.chunks is not None or self.data_ref.chunks is not None
+        reductions_lazy = {red: dims for red, dims in reductions.items() if llazy and not dims}
+        reductions = {red: dims for red, dims in reductions.items() if red not in reductions_lazy}
+
+        # accumulators for each reduction: partial sums are either added (if the sample dimension is reduced) or
+        # collected for concatenation along the sample dimension
+        acc = {red: {} for red in reductions}
+        nsamples = self.data_fcst.sizes[sample_dim]
+        nchunks = int(np.ceil(nsamples / chunk_size)) if reductions else 0
+        t0 = timer()
+        with dask.config.set(**get_dask_config(scheduler, nworkers)):
+            for ichunk in range(nchunks):
+                t0_chunk = timer()
+                slice_dict = {sample_dim: slice(ichunk * chunk_size, (ichunk + 1) * chunk_size)}
+                fcst, ref = self.data_fcst.isel(slice_dict), self.data_ref.isel(slice_dict)
+                fcst, ref = dask.compute(fcst, ref) if llazy else (fcst.load(), ref.load())
+
+                sums = self._get_partial_sums(fcst, ref, metrics, **kwargs)
+                for red, dims in reductions.items():
+                    for key, da in sums.items():
+                        sum_dims = [dim for dim in dims if dim in da.dims]
+                        da_sum = da.sum(dim=sum_dims) if sum_dims else da
+                        if sample_dim in dims:
+                            acc[red][key] = acc[red][key] + da_sum if key in acc[red] else da_sum
+                        else:
+                            acc[red].setdefault(key, []).append(da_sum)
+
+                dt_chunk = timer() - t0_chunk
+                print("%{0}: Chunk {1:d}/{2:d} processed in {3:.2f}s ({4:.1f} samples/s, {5:.1f} MB/s)."
+                      .format(method, ichunk + 1, nchunks, dt_chunk, fcst.sizes[sample_dim] / dt_chunk,
+                              (fcst.nbytes + ref.nbytes) / dt_chunk / 1.e+06))
+
+        if nchunks > 0:
+            dt = timer() - t0
+            print("%{0}: {1:d} samples processed in {2:.2f}s ({3:.1f} samples/s).".format(method, nsamples, dt,
+                                                                                         nsamples / dt))
+
+        ds_scores = xr.Dataset()
+        for red, dims in reductions.items():
+            sums = {key: val if sample_dim in dims else xr.concat(val, dim=sample_dim) for key, val in acc[red].items()}
+            for metric in metrics:
+                varname = f"{metric}_{red}" if red else metric
+                ds_scores[varname] = self._finalize_metric(metric, sums, **kwargs)
+
+        if reductions_lazy:
+            sums = self._get_partial_sums(self.data_fcst, self.data_ref, metrics, **kwargs)
+            for red in reductions_lazy:
+                for metric in metrics:
+                    varname = f"{metric}_{red}" if red else metric
+                    ds_scores[varname] = self._finalize_metric(metric, sums, **kwargs)
+
+        return ds_scores
+
+    def _get_partial_sums(self, fcst: xr.DataArray, ref: xr.DataArray, metrics: List[str], **kwargs) -> dict:
+        """
+        Get the (non-reduced) terms of compute_all which are required for the metrics.
+        """
+        lgrad, lbias = "grad_amplitude" in metrics, "bias" in metrics
+        lsquare = any(metric in metrics for metric in ["mse", "rmse", "psnr"])
+
+        sums = {}
+        if lbias or lsquare:
+            diff = fcst - ref
+            sums["ndiff"] = diff.notnull()
+            if lbias: sums["diff"] = diff
+            if lsquare: sums["diff2"] = np.square(diff)
+        if lgrad:
+            fcst_grad, ref_grad = self.calc_geo_spatial_diff(fcst, ref, order=kwargs.get("order", 1))
+            ratio = fcst_grad / ref_grad
+            sums.update({"ratio": ratio, "nratio": ratio.notnull()})
+
+        return sums
+
     @staticmethod
-    def calc_geo_spatial_diff(scalar_field: xr.DataArray, order: int = 1, r_e: float = 6371.e3, dom_avg: bool = True):
+    def _finalize_metric(metric: str, sums: dict, **kwargs) -> xr.DataArray:
+        """
+        Get metric from the accumulated sums of compute_all.
+        """
+        if metric == "grad_amplitude":
+            return sums["ratio"] / sums["nratio"]
+        elif metric == "bias":
+            return sums["diff"] / sums["ndiff"]
+
+        mse = sums["diff2"] / sums["ndiff"]
+        if metric == "mse":
+            return mse
+        elif metric == "rmse":
+            return np.sqrt(mse)
+        elif metric == "psnr":
+            return xr.where(mse > 0., 20. * np.log10(kwargs.get("pixel_max", 1.) / np.sqrt(mse)), 100.)
+        else:
+            raise ValueError(f"{metric} is not an implemented score.")
+
+    @staticmethod
+    def calc_geo_spatial_diff(scalar_field: xr.DataArray, *further_fields: xr.DataArray, order: int = 1,
+                              r_e: float = 6371.e3, dom_avg: bool = True, chunk_size: int = 256):
         """
         Calculates the amplitude of the gradient (order=1) or the Laplacian (order=2) of a scalar field given on a regular,
         geographical grid (i.e. dlambda = const. and dphi=const.)
+        The finite differences are computed with a stencil on the raw arrays (see spatial_diff_stencil) in chunks over
+        the non-spatial dimensions. Dask-arrays are supported if the spatial dimensions are not chunked.
         :param scalar_field: scalar field as data array with latitude and longitude as coordinates
+        :param further_fields: further scalar fields on the same grid which are processed in the same pass
+                               (e.g. forecast and reference data)
         :param order: order of spatial differential operator
         :param r_e: radius of the sphere
-        :return: the amplitude of the gradient/laplacian at each grid point or over the whole domain (see avg_dom)
+        :param dom_avg: flag if the amplitude is averaged over the domain
+        :param chunk_size: number of 2D-fields that are processed at once
+        :return: the amplitude of the gradient/laplacian at each grid point or over the whole domain (see avg_dom),
+                 a tuple of amplitudes if further_fields are parsed
         """
         method = Scores.calc_geo_spatial_diff.__name__
         # sanity checks
-        assert isinstance(scalar_field, xr.DataArray), f"Scalar_field of {method} must be a xarray DataArray."
+        fields = [scalar_field] + list(further_fields)
+        assert all(isinstance(field, xr.DataArray) for field in fields), \
+            f"Scalar_field of {method} must be a xarray DataArray."
         assert order in [1, 2], f"Order for {method} must be either 1 or 2."
 
-        dims = list(scalar_field.dims)
+        lat_name, lon_name = Scores.get_spatial_dims(list(scalar_field.dims))
+        terms = Scores.get_geo_metric_terms(scalar_field[lat_name].values, scalar_field[lon_name].values, r_e)
+
+        spatial_dims = [lat_name, lon_name]
+        out_dims = [] if dom_avg else spatial_dims
+        var_diff_amplitude = xr.apply_ufunc(Scores.spatial_diff_stencil, *fields,
+                                            input_core_dims=[spatial_dims] * len(fields),
+                                            output_core_dims=[out_dims] * len(fields),
+                                            kwargs={"terms": terms, "order": order, "dom_avg": dom_avg,
+                                                    "chunk_size": chunk_size},
+                                            dask="parallelized", output_dtypes=[np.float64] * len(fields))
+
+        if len(fields) == 1:
+            var_diff_amplitude = (var_diff_amplitude, )
+        # ensure that dimension ordering is not changed
+        var_diff_amplitude = tuple(amp.transpose(*[dim for dim in field.dims if dim in amp.dims])
+                                   for amp, field in zip(var_diff_amplitude, fields))
+
+        return var_diff_amplitude[0] if len(fields) == 1 else var_diff_amplitude
+
+    @staticmethod
+    def get_spatial_dims(dims: List[str]):
+        """
+        Get names of latitude and longitude dimension.
+        :param dims: dimensions of data
+        :return: name of latitude and longitude dimension
+        """
         lat_dims = ["rlat", "lat", "latitude"]
         lon_dims = ["rlon", "lon", "longitude"]
 
@@ -330,20 +721,69 @@ class Scores:
                 raise ValueError("Could not find one of the following coordinates in the passed dictionary: {0}"
                                  .format(",".join(coord_names_expected)))
 
-        lat_ind, lat_name = check_for_coords(dims, lat_dims)
-        lon_ind, lon_name = check_for_coords(dims, lon_dims)
+        _, lat_name = check_for_coords(dims, lat_dims)
+        _, lon_name = check_for_coords(dims, lon_dims)
 
-        lat, lon = np.deg2rad(scalar_field[lat_name]), np.deg2rad(scalar_field[lon_name])
-        dphi, dlambda = lat[1].values - lat[0].values, lon[1].values - lon[0].values
+        return lat_name, lon_name
 
-        if order == 1:
-            dvar_dlambda = 1. / (r_e * np.cos(lat) * dlambda) * scalar_field.differentiate(lon_name)
-            dvar_dphi = 1. / (r_e * dphi) * scalar_field.differentiate(lat_name)
-            dvar_dlambda = dvar_dlambda.transpose(*scalar_field.dims)  # ensure that dimension ordering is not changed
+    @staticmethod
+    def get_geo_metric_terms(lat: np.ndarray, lon: np.ndarray, r_e: float = 6371.e3) -> dict:
+        """
+        Get the metric terms of the geographical grid for the finite differences. The terms are cached per grid.
+        :param lat: latitude coordinate in degrees
+        :param lon: longitude coordinate in degrees
+        :param r_e: radius of the sphere
+        :return: dictionary of metric terms
+        """
+        key = (lat.tobytes(), lon.tobytes(), r_e)
+        if key not in geo_metric_terms_cache:
+            lat_rad, lon_rad = np.deg2rad(lat), np.deg2rad(lon)
+            dphi, dlambda = lat_rad[1] - lat_rad[0], lon_rad[1] - lon_rad[0]
+            cos_lat = np.cos(lat_rad)[:, None]
+            geo_metric_terms_cache[key] = {"lat": lat, "lon": lon, "lat_rad": lat_rad, "lon_rad": lon_rad,
+                                           "cos_lat": cos_lat, "fac_lambda": 1. / (r_e * cos_lat * dlambda),
+                                           "fac_phi": 1. / (r_e * dphi), "fac_lapl": 1. / (r_e * r_e * cos_lat)}
 
-            var_diff_amplitude = np.sqrt(dvar_dlambda ** 2 + dvar_dphi ** 2)
-            if dom_avg: var_diff_amplitude = var_diff_amplitude.mean(dim=[lat_name, lon_name])
-        else:
-            raise ValueError(f"Second-order differentation is not implemenetd in {method} yet.")
+        return geo_metric_terms_cache[key]
 
-        return var_diff_amplitude
+    @staticmethod
+    def spatial_diff_stencil(*fields: np.ndarray, terms: dict, order: int = 1, dom_avg: bool = True,
+                             chunk_size: int = 256):
+        """
+        Compute the amplitude of the gradient or the Laplacian with centered finite differences (one-sided at the
+        domain boundaries). The gradient is scaled as in previous versions of calc_geo_spatial_diff (i.e.
+        xarray's differentiate w.r.t. the coordinates in degrees times the metric terms in radians), while the
+        Laplacian is computed in spherical coordinates.
+        :param fields: arrays with latitude and longitude as last two dimensions
+        :param terms: metric terms (see get_geo_metric_terms)
+        :param order: order of spatial differential operator
+        :param dom_avg: flag if the amplitude is averaged over the domain
+        :param chunk_size: number of 2D-fields that are processed at once
+        :return: amplitude for each field
+        """
+        amplitudes = []
+        for field in fields:
+            shape = field.shape
+            data = np.reshape(field, (-1, *shape[-2:]))
+            amp = np.empty(data.shape[0:1] if dom_avg else data.shape)
+            for istart in range(0, data.shape[0], chunk_size):
+                chunk = data[istart: istart + chunk_size].astype(np.float64)
+                if order == 1:
+                    dvar_dlambda = terms["fac_lambda"] * np.gradient(chunk, terms["lon"], axis=-1)
+                    dvar_dphi = terms["fac_phi"] * np.gradient(chunk, terms["lat"], axis=-2)
+                    amp_chunk = np.sqrt(dvar_dlambda ** 2 + dvar_dphi ** 2)
+                else:
+                    cos_lat, lat_rad, lon_rad = terms["cos_lat"], terms["lat_rad"], terms["lon_rad"]
+                    d2var_dlambda2 = np.gradient(np.gradient(chunk, lon_rad, axis=-1), lon_rad, axis=-1) / cos_lat
+                    d2var_dphi2 = np.gradient(cos_lat * np.gradient(chunk, lat_rad, axis=-2), lat_rad, axis=-2)
+                    amp_chunk = np.abs(terms["fac_lapl"] * (d2var_dlambda2 + d2var_dphi2))
+
+                if dom_avg:
+                    with np.errstate(invalid="ignore", divide="ignore"):
+                        valid = np.isfinite(amp_chunk)
+                        amp_chunk = np.where(valid, amp_chunk, 0.).sum(axis=(-2, -1)) / valid.sum(axis=(-2, -1))
+                amp[istart: istart + chunk_size] = amp_chunk
+
+            amplitudes.append(amp.reshape(shape[:-2] if dom_avg else shape))
+
+        return amplitudes[0] if len(amplitudes) == 1 else tuple(amplitudes)
@@ -1,7 +1,7 @@
 __author__ = "Michael Langguth"
 __email__ = "m.langguth@fz-juelich.de"
 __date__ = "2022-04-22"
-__update__ = "2022-08-22"
+__update__ = "2026-10-18"
 
 # doc-string
 """
@@ -14,17 +14,20 @@ IFS forecasts with lead time 6 to 17 hours is used.
 # doc-string
 
 import os, glob
+from functools import partial
 from typing import Union, List
 import logging
 import numbers
 import datetime as dt
 import numpy as np
 import pandas as pd
+import xarray as xr
 from collections import OrderedDict
 #from tfrecords_utils import IFS2TFRecords
 from abstract_preprocess import AbstractPreprocessing
 from preprocess_data_unet_tier1 import Preprocess_Unet_Tier1, CDOGridDes
 from pystager_utils import PyStager
+from remapping import remap_dataset, get_grid_des, get_grid_coords
 from tools_utils import CDO, NCRENAME, NCAP2, NCKS, NCEA, NCWA
 from other_utils import to_list, last_day_of_month, flatten, remove_files
 
@@ -43,11 +46,15 @@ class PreprocessERA5toIFS(AbstractPreprocessing):
     cpd, g = 1004.709, 9.80665
     # invariant variables expected in the invarinat files
     const_vars = ["z", "lsm"]
+    # supported preprocessing backends
+    known_backends = ["cdo", "xarray"]
 
     def __init__(self, in_datadir: str, tar_datadir: str, out_dir: str, in_constfile: str, grid_des_tar: str,
-                 predictors: dict, predictands: dict, downscaling_fac: int = 8):
+                 predictors: dict, predictands: dict, downscaling_fac: int = 8, backend: str = "cdo"):
         """
         Initialize class for ERA5-to-IFS downscaling class.
+        :param backend: backend for preprocessing, either 'cdo' (hourly processing with CDO/NCO) or 'xarray'
+                        (monthly processing in memory, see preprocess_worker_xr)
         """
         super().__init__("preprocess_ERA5_to_IFS", in_datadir, tar_datadir, predictors, predictands, out_dir)
 
@@ -60,6 +67,10 @@ class PreprocessERA5toIFS(AbstractPreprocessing):
         self.grid_des_tar = grid_des_tar
         self.invar_file = in_constfile
         self.downscaling_fac = downscaling_fac
+        if backend not in self.known_backends:
+            raise ValueError(f"Unknown backend '{backend}'. Choose one of the following: " +
+                             f"{', '.join(self.known_backends)}")
+        self.backend = backend
 
         self.my_rank = None                     # to be set in __call__
 
@@ -78,7 +89,8 @@ class PreprocessERA5toIFS(AbstractPreprocessing):
         months = PreprocessERA5toIFS.check_season(season)
 
         # initialize and set-up Pystager
-        preprocess_pystager = PyStager(self.preprocess_worker, "year_month_list", nmax_warn=3)
+        worker = self.preprocess_worker_xr if self.backend == "xarray" else self.preprocess_worker
+        preprocess_pystager = PyStager(worker, "year_month_list", nmax_warn=3)
         preprocess_pystager.setup(years, months)
 
         # Create grid description files needed for preprocessing (requires rank-information)
@@ -237,6 +249,309 @@ class PreprocessERA5toIFS(AbstractPreprocessing):
 
         return nwarn
 
+    @staticmethod
+    def preprocess_worker_xr(year_months: List, dirin_era5: str, dirin_ifs: str, invar_file: str, dirout: str,
+                             gdes_dict: dict, predictors: dict, predictands: dict, logger: logging.Logger,
+                             max_warn: int = 3):
+        """
+        Same as preprocess_worker, but the data of each month is processed in memory with xarray. The input files of
+        each month are opened once, and selection, transformation of 2m temperature, remapping, renaming and merging
+        is done in memory. Finally, one monthly file is written. Only the vertical interpolation of multi-level data
+        is still performed with CDO (see process_ml_file).
+        Requires cfgrib to read ERA5 GRIB-files.
+        :param year_months: List of Datetime-objects indicating year and month for which data should be preprocessed
+        :param dirin_era5: input directory of ERA5-dataset (top-level directory)
+        :param dirin_ifs: input directory of IFS-forecasts
+        :param invar_file: data file providing invariant variables
+        :param dirout: output directoty to store preprocessed data
+        :param predictors: nested dictionary of predictors (see preprocess_worker)
+        :param predictands: nested dictionary of predictands (see preprocess_worker)
+        :param gdes_dict: dictionary containing grid description dictionaries for target, base and coarse grid
+        :param logger: Logging instance for log process on worker
+        :param max_warn: allowed maximum number of warnings/problems met during processing (default:3)
+        :return: number of warnings
+        """
+        method = PreprocessERA5toIFS.preprocess_worker_xr.__name__
+
+        assert isinstance(logger, logging.Logger), "%{0}: logger-argument must be a logging.Logger instance" \
+                                                   .format(method)
+        if not os.path.isfile(invar_file):
+            raise FileNotFoundError("File providing invariant data '{0}' cannot be found.".format(invar_file))
+
+        # get lists of predictor and predictand variables
+        sfvars, mlvars, fc_sfvars, fc_mlvars = PreprocessERA5toIFS.organize_predictors(predictors)
+        all_predictors = to_list(sfvars) + PreprocessERA5toIFS.get_varnames_from_mlvars(mlvars) + \
+                         to_list(fc_sfvars) + PreprocessERA5toIFS.get_varnames_from_mlvars(fc_mlvars)
+        all_predictors = [e for e in all_predictors if e]
+
+        if any(vartype != "sf" for vartype in predictands.keys()):
+            raise ValueError("Only surface variables (i.e. vartype 'sf') are currently supported for IFS data.")
+        all_predictands = list(predictands["sf"].keys())
+
+        # z is required for remapping 2m temperature (2t) via the dry static energy
+        l2t = "2t" in all_predictors
+        sfvars, fc_sfvars = [var for var in to_list(sfvars) if var], [var for var in to_list(fc_sfvars) if var]
+        if l2t and "z" not in sfvars:
+            sfvars.append("z")
+        remap_vars = [var for var in all_predictors if var != "2t"]
+
+        grid_des_tar, grid_des_coarse = gdes_dict["tar_grid_des"], gdes_dict["coa_grid_des"]
+        # domain to crop the ERA5-data (coarse grid with margin of one coarse grid cell)
+        lonlatbox = PreprocessERA5toIFS.get_lonlatbox(grid_des_coarse)
+
+        nwarn = 0
+        for year_month in year_months:
+            assert isinstance(year_month, dt.datetime),\
+                "%{0}: All year_months-argument must be a datetime-object. Current one is of type '{1}'"\
+                .format(method, type(year_month))
+
+            last_day = last_day_of_month(year_month)
+            subdir_name = year_month.strftime("%Y-%m")
+            dest_dir = os.path.join(dirout, "netcdf_data", year_month.strftime("%Y"), subdir_name)
+            final_file = os.path.join(dest_dir, "preproc_{0}.nc".format(subdir_name))
+            os.makedirs(dest_dir, exist_ok=True)
+
+            if os.path.isfile(final_file):
+                logger.info(f"Monthly datafile '{final_file}' already exists. Skip month {subdir_name}.")
+                continue
+
+            dates2op = pd.date_range(year_month.replace(day=1, hour=0), last_day.replace(hour=23), freq="H")
+
+            logger.info("Start preprocessing data for month {0} with xarray...".format(subdir_name))
+
+            # get input files for all hours of the month and skip hours for which data is missing
+            files_dict, nwarn = PreprocessERA5toIFS.get_month_files(dates2op, dirin_era5, dirin_ifs, sfvars, mlvars,
+                                                                    fc_sfvars, fc_mlvars, logger, nwarn, max_warn)
+            if not files_dict["dates"]:
+                logger.error(f"No complete input data found for month {subdir_name}.")
+                continue
+
+            # read and merge predictor data
+            ds_list = []
+            sfvars_stat, sfvars_dyn = PreprocessERA5toIFS.split_dyn_static(sfvars)
+            if sfvars_dyn:
+                ds_list.append(PreprocessERA5toIFS.read_grib_files(files_dict["sf"], sfvars_dyn, lonlatbox))
+            if fc_sfvars:
+                ds_list.append(PreprocessERA5toIFS.read_grib_files(files_dict["fc_sf"], fc_sfvars, lonlatbox))
+            for vartype, ml_dict, interp in zip(["ml", "fc_ml"], [mlvars, fc_mlvars], [True, False]):
+                if ml_dict:
+                    ds_list.append(PreprocessERA5toIFS.read_ml_files(files_dict[vartype], dest_dir,
+                                                                     files_dict["dates"], ml_dict, interp))
+            ds_era5 = xr.merge(ds_list, join="inner")
+            if sfvars_stat:
+                ds_stat = PreprocessERA5toIFS.read_grib_files([invar_file], sfvars_stat, lonlatbox, lstatic=True)
+                for var in sfvars_stat:
+                    ds_era5[var] = ds_stat[var].expand_dims(time=ds_era5["time"])
+
+            # read predictand data
+            ds_ifs = PreprocessERA5toIFS.read_ifs_files(files_dict["ifs"], grid_des_tar, all_predictands)
+
+            # remap, rename and merge
+            logger.info(f"Remap and merge data for month {subdir_name}...")
+            ds_era5 = PreprocessERA5toIFS.remap_ds(ds_era5, grid_des_coarse, grid_des_tar, remap_vars, l2t, ds_ifs,
+                                                   weights_dir=dirout)
+            ds_era5 = ds_era5.rename({var: f"{var}_in".lower() for var in all_predictors})
+            ds_ifs = ds_ifs.rename({var: f"{var}_tar".lower() for var in all_predictands})
+
+            joint_times = sorted(list(set(ds_era5["time"].values) & set(ds_ifs["time"].values)))
+            if not joint_times:
+                raise ValueError(f"%{method}: No intersection on time dimension found for predictor and predictand "
+                                 f"data of month {subdir_name}.")
+            ds_final = xr.merge([ds_era5.sel(time=joint_times), ds_ifs.sel(time=joint_times)])
+
+            logger.info(f"Write monthly datafile '{final_file}'")
+            ds_final.to_netcdf(final_file)
+
+        return nwarn
+
+    @staticmethod
+    def get_month_files(dates: List, dirin_era5: str, dirin_ifs: str, sfvars: List, mlvars: dict, fc_sfvars: List,
+                        fc_mlvars: dict, logger: logging.Logger, nwarn: int, max_warn: int) -> (dict, int):
+        """
+        Get input files for all dates of a month. Dates for which any input file is missing are skipped and counted as
+        warning (cf. run_preproc_func).
+        :param dates: list of dates to process
+        :param dirin_era5: input directory of ERA5-dataset (top-level directory)
+        :param dirin_ifs: input directory of IFS-forecasts
+        :param sfvars: list of surface predictor variables
+        :param mlvars: dictionary of multi-level predictor variables
+        :param fc_sfvars: list of forecasted surface predictor variables
+        :param fc_mlvars: dictionary of forecasted multi-level predictor variables
+        :param logger: logger instance
+        :param nwarn: current number of issued warnings
+        :param max_warn: maximum allowed number of warnings
+        :return: dictionary with dates and files per variable type (ifs-files come with forecast hour) and nwarn
+        """
+        files_dict = {"dates": [], "sf": [], "ml": [], "fc_sf": [], "fc_ml": [], "ifs": []}
+
+        for date in dates:
+            date_str = date.strftime("%Y%m%d%H")
+            dir_era5 = os.path.join(dirin_era5, date.strftime("%Y"), date.strftime("%m"))
+            try:
+                files_now = {"sf": os.path.join(dir_era5, f"{date_str}_sf.grb"),
+                             "ml": os.path.join(dir_era5, f"{date_str}_ml.grb")}
+                files_now["fc_sf"] = PreprocessERA5toIFS.get_fc_file(dirin_era5, date, model="era5",
+                                                                     prefix="sf_fc")[0] if fc_sfvars else None
+                files_now["fc_ml"] = PreprocessERA5toIFS.get_fc_file(dirin_era5, date, model="era5",
+                                                                     prefix="ml_fc")[0] if fc_mlvars else None
+                files_now["ifs"] = PreprocessERA5toIFS.get_fc_file(dirin_ifs, date, model="ifs", suffix="sfc")
+                for vartype, lreq in zip(["sf", "ml"], [sfvars, mlvars]):
+                    if lreq and not os.path.isfile(files_now[vartype]):
+                        raise FileNotFoundError(f"Could not find required file '{files_now[vartype]}'")
+            except FileNotFoundError as err:
+                nwarn += 1
+                mess = "Pre-Processing data for {0} failed! ".format(date.strftime("%Y-%m-%d %H:00 UTC"))
+                if nwarn > max_warn:
+                    logger.fatal(mess + "Maximum number of warnings exceeded.")
+                    raise err
+                logger.error(mess), logger.error(str(err))
+                continue
+
+            files_dict["dates"].append(date)
+            for vartype in ["sf", "ml", "fc_sf", "fc_ml", "ifs"]:
+                files_dict[vartype].append(files_now[vartype])
+
+        return files_dict, nwarn
+
+    @staticmethod
+    def prepare_grib_ds(ds: xr.Dataset, varnames: List, lonlatbox: tuple, lstatic: bool = False) -> xr.Dataset:
+        """
+        Prepare dataset from ERA5 GRIB-file (read with cfgrib), i.e. rename variables to GRIB shortName (as with CDO),
+        crop data to lonlatbox, set time to validity time and drop auxiliary coordinates.
+        :param ds: dataset from ERA5 GRIB-file
+        :param varnames: variables to select
+        :param lonlatbox: domain to crop data (lon_min, lon_max, lat_min, lat_max)
+        :param lstatic: flag if data is invariant (time-coordinate is dropped)
+        :return: prepared dataset
+        """
+        ds = ds.rename({var: ds[var].attrs.get("GRIB_shortName", var) for var in ds.data_vars})
+        ds = ds.rename({"longitude": "lon", "latitude": "lat"})[varnames]
+
+        if lstatic:
+            ds = ds.drop_vars([coord for coord in ds.coords if coord not in ["lon", "lat"]])
+        else:
+            if "valid_time" in ds.coords:
+                ds = ds.assign_coords(time=ds["valid_time"].values)
+            ds = ds.drop_vars([coord for coord in ds.coords if coord not in ["time", "lon", "lat"]])
+            if "time" not in ds.dims:
+                ds = ds.expand_dims("time")
+
+        return PreprocessERA5toIFS.sel_lonlatbox(ds, lonlatbox)
+
+    @staticmethod
+    def read_grib_files(files: List, varnames: List, lonlatbox: tuple, lstatic: bool = False) -> xr.Dataset:
+        """
+        Read ERA5 GRIB-files with cfgrib into memory (see prepare_grib_ds).
+        :param files: list of GRIB-files (one time step per file)
+        :param varnames: variables to read
+        :param lonlatbox: domain to crop data (lon_min, lon_max, lat_min, lat_max), see get_lonlatbox
+        :param lstatic: flag if data is invariant
+        :return: dataset with data from all files
+        """
+        preprocess = partial(PreprocessERA5toIFS.prepare_grib_ds, varnames=varnames, lonlatbox=lonlatbox,
+                             lstatic=lstatic)
+        # avoid writing index-files next to the GRIB-files
+        with xr.open_mfdataset(files, engine="cfgrib", combine="nested", concat_dim=None if lstatic else "time",
+                               preprocess=preprocess, backend_kwargs={"indexpath": ""}) as ds:
+            ds = ds.load()
+
+        return ds
+
+    @staticmethod
+    def read_ml_files(ml_files: List, dest_dir: str, dates: List, mlvars: dict, interp: bool = True) -> xr.Dataset:
+        """
+        Read data from ERA5 multi-level files. Since vertical interpolation is not available in xarray, the hourly
+        files are processed with CDO first (see process_ml_file), but merged in memory.
+        :param ml_files: list of ERA5 multi-level files
+        :param dest_dir: directory to store temporary files
+        :param dates: list of dates corresponding to ml_files
+        :param mlvars: dictionary of predictor variables to be interpolated onto pressure levels
+        :param interp: True if pressure interpolation is required or False if data is available on pressure levels
+        :return: dataset with data from all files
+        """
+        tmp_files = [PreprocessERA5toIFS.process_ml_file(ml_file, dest_dir, date, mlvars, interp=interp)
+                     for ml_file, date in zip(ml_files, dates)]
+
+        with xr.open_mfdataset(tmp_files, combine="nested", concat_dim="time") as ds:
+            ds = ds.load()
+
+        remove_files(tmp_files, lbreak=False)
+        for tmp_dir in set(os.path.dirname(f) for f in tmp_files):
+            if not os.listdir(tmp_dir): os.rmdir(tmp_dir)
+
+        return ds
+
+    @staticmethod
+    def read_ifs_files(ifs_files: List, fgdes_tar: str, ifsvars: List) -> xr.Dataset:
+        """
+        Read predictand data from IFS forecast files. Each file is opened once for all requested time steps.
+        :param ifs_files: list of tuples (IFS-file, forecast hour) as returned by get_fc_file
+        :param fgdes_tar: grid description file for target (high-resolved) grid
+        :param ifsvars: list of predictand variables
+        :return: dataset with predictand data
+        """
+        gdes_tar = CDOGridDes(fgdes_tar)
+        gdes_dict = gdes_tar.grid_des_dict
+
+        lonlatbox = (*gdes_tar.get_slice_coords(gdes_dict["xfirst"], gdes_dict["xinc"], gdes_dict["xsize"]),
+                     *gdes_tar.get_slice_coords(gdes_dict["yfirst"], gdes_dict["yinc"], gdes_dict["ysize"]))
+
+        # group forecast hours by file
+        fh_dict = OrderedDict()
+        for ifs_file, fh in ifs_files:
+            fh_dict.setdefault(ifs_file, []).append(fh)
+
+        ds_list = []
+        for ifs_file, fhs in fh_dict.items():
+            with xr.open_dataset(ifs_file) as ds:
+                # same as CDO's seltimestep (1-based index)
+                ds = ds[ifsvars].isel(time=[fh - 1 for fh in fhs])
+                ds_list.append(PreprocessERA5toIFS.sel_lonlatbox(ds, lonlatbox).load())
+
+        return xr.concat(ds_list, dim="time")
+
+    @staticmethod
+    def get_lonlatbox(grid_des: Union[str, dict], nmargin: int = 1) -> tuple:
+        """
+        Get the domain to crop data from a grid description. The domain comprises all grid cells of the grid and a
+        margin of nmargin grid cells at each side. Thus, the domain derived from the coarse grid covers all data
+        required for remapping onto the coarse grid.
+        :param grid_des: CDO grid description file or grid description dictionary (regular lonlat-grid)
+        :param nmargin: number of grid cells added at each side of the domain (at least 1)
+        :return: domain to crop data (lon_min, lon_max, lat_min, lat_max)
+        """
+        method = PreprocessERA5toIFS.get_lonlatbox.__name__
+
+        if nmargin < 1:
+            raise ValueError(f"%{method}: The margin must comprise at least one grid cell, but is {nmargin:d}.")
+
+        gdes = get_grid_des(grid_des)
+        if gdes.get("gridtype", "lonlat") != "lonlat":
+            raise ValueError(f"%{method}: Grid type must be 'lonlat', but is '{gdes['gridtype']}'.")
+
+        lon, lat = get_grid_coords(gdes)
+        dlon, dlat = (nmargin + 0.5) * np.abs(float(gdes["xinc"])), (nmargin + 0.5) * np.abs(float(gdes["yinc"]))
+
+        return lon.min() - dlon, lon.max() + dlon, max(lat.min() - dlat, -90.), min(lat.max() + dlat, 90.)
+
+    @staticmethod
+    def sel_lonlatbox(ds: xr.Dataset, lonlatbox: tuple, lon_name: str = "lon", lat_name: str = "lat",
+                      eps: float = 1.e-05) -> xr.Dataset:
+        """
+        Crop data to domain (similar to CDO's sellonlatbox, but without shifting longitudes).
+        :param ds: the dataset to crop
+        :param lonlatbox: domain to crop data (lon_min, lon_max, lat_min, lat_max)
+        :param lon_name: name of longitude coordinate
+        :param lat_name: name of latitude coordinate
+        :param eps: tolerance for coordinate values at the domain boundaries
+        :return: cropped dataset
+        """
+        lon, lat = ds[lon_name].values, ds[lat_name].values
+        ilon = np.where((lon >= lonlatbox[0] - eps) & (lon <= lonlatbox[1] + eps))[0]
+        ilat = np.where((lat >= lonlatbox[2] - eps) & (lat <= lonlatbox[3] + eps))[0]
+
+        return ds.isel({lon_name: ilon, lat_name: ilat})
+
     @staticmethod
     def organize_predictors(predictors: dict) -> (List, dict, List, dict):
         """
@@ -418,6 +733,8 @@ class PreprocessERA5toIFS(AbstractPreprocessing):
         :param max_warn: maximum allowed number of warnings
         :return: updated nwarn and resulting merged netCDF-file
         """
+        method = PreprocessERA5toIFS.remap_and_merge_data.__name__
+
         cdo = PreprocessERA5toIFS.cdo
 
         if not file_in.endswith(".nc"):
@@ -432,12 +749,18 @@ class PreprocessERA5toIFS(AbstractPreprocessing):
         else:
             l2t = False
 
-        cdo.run([file_in, file_in_coa], OrderedDict([("-remapcon", gdes_coarse),
-                                                     ("-selname", ",".join(predictors))]))
-        cdo.run([file_in_coa, file_in_hres], OrderedDict([("-remapbil", gdes_tar)]))
+        try:
+            PreprocessERA5toIFS.remap_data(file_in, file_in_hres, gdes_coarse, gdes_tar, predictors, l2t, file_tar)
+        except Exception as err:
+            print(f"%{method}: Remapping data from '{file_in}' in Python failed ({err}). Fall back to CDO.")
+            cdo.run([file_in, file_in_coa], OrderedDict([("-remapcon", gdes_coarse),
+                                                         ("-selname", ",".join(predictors))]))
+            cdo.run([file_in_coa, file_in_hres], OrderedDict([("-remapbil", gdes_tar)]))
+
+            if l2t:
+                PreprocessERA5toIFS.remap2t_and_cat(file_in, file_in_hres, gdes_coarse, gdes_tar)
 
         if l2t:
-            PreprocessERA5toIFS.remap2t_and_cat(file_in, file_in_hres, gdes_coarse, gdes_tar)
             predictors.append("2t")                 # to ensure subsequent renaming
 
         # merge input and target data
@@ -446,10 +769,75 @@ class PreprocessERA5toIFS(AbstractPreprocessing):
         if not (stat and os.path.isfile(final_file)):
             nwarn = max_warn + 1
         else:
-            remove_files([file_in_coa, file_in_hres, file_tar], lbreak=True)
+            remove_files([file_in_coa, file_in_hres, file_tar], lbreak=False)
 
         return nwarn
 
+    @staticmethod
+    def remap_data(file_in: str, file_out: str, gdes_coarse: str, gdes_tar: str, predictors: List, l2t: bool = False,
+                   file_ref: str = None, weights_dir: str = None) -> None:
+        """
+        Remap predictor data in Python, i.e. conservative remapping onto the coarse grid followed by bilinear remapping
+        onto the target grid (cf. remapping with CDO in remap_and_merge_data). The remapping weights are computed once
+        and cached. 2m temperature is remapped via the dry static energy (see remap2t_and_cat).
+        :param file_in: netCDF-file with predictor data
+        :param file_out: netCDF-file to write the remapped data
+        :param gdes_coarse: CDO grid description file corresponding to the coarse-grained predictor data
+        :param gdes_tar: CDO grid description file corresponding to the high-resolved predictand data
+        :param predictors: list of predictor variables to remap (without 2t)
+        :param l2t: flag if 2m temperature is remapped as well (requires z in file_in)
+        :param file_ref: netCDF-file on target grid whose coordinates are copied to the remapped data (optional)
+        :param weights_dir: directory to persist remapping weights (default: directory of file_out)
+        :return: -
+        """
+        weights_dir = os.path.dirname(os.path.abspath(file_out)) if weights_dir is None else weights_dir
+
+        with xr.open_dataset(file_in) as ds:
+            ds = ds.load()
+
+        ds_ref = xr.open_dataset(file_ref) if file_ref is not None else None
+        try:
+            ds_hres = PreprocessERA5toIFS.remap_ds(ds, gdes_coarse, gdes_tar, predictors, l2t, ds_ref, weights_dir)
+        finally:
+            if ds_ref is not None: ds_ref.close()
+
+        ds_hres.to_netcdf(file_out)
+
+    @staticmethod
+    def remap_ds(ds: xr.Dataset, gdes_coarse: str, gdes_tar: str, predictors: List, l2t: bool = False,
+                 ds_ref: xr.Dataset = None, weights_dir: str = None) -> xr.Dataset:
+        """
+        Remap predictor data of a dataset in memory (see remap_data).
+        :param ds: dataset with predictor data
+        :param gdes_coarse: CDO grid description file corresponding to the coarse-grained predictor data
+        :param gdes_tar: CDO grid description file corresponding to the high-resolved predictand data
+        :param predictors: list of predictor variables to remap (without 2t)
+        :param l2t: flag if 2m temperature is remapped as well (requires z in ds)
+        :param ds_ref: dataset on target grid whose coordinates are copied to the remapped data (optional)
+        :param weights_dir: directory to persist remapping weights
+        :return: dataset with remapped predictor data
+        """
+        cpd, g = PreprocessERA5toIFS.cpd, PreprocessERA5toIFS.g
+
+        ds_coa = remap_dataset(ds, [gdes_coarse], ["con"], varnames=list(predictors) + (["z"] if l2t else []),
+                               weights_dir=weights_dir)
+        if l2t:
+            ds_s = remap_dataset((cpd*ds["2t"] + ds["z"] + g*2).to_dataset(name="s"), [gdes_coarse], ["con"],
+                                 weights_dir=weights_dir)
+            ds_coa["2t"] = (ds_s["s"] - ds_coa["z"] - g*2)/cpd
+            ds_coa["2t"].attrs = ds["2t"].attrs
+        ds_hres = remap_dataset(ds_coa, [gdes_tar], ["bil"], varnames=list(predictors) + (["2t"] if l2t else []),
+                                weights_dir=weights_dir)
+
+        # ensure identical coordinates for subsequent merging with the predictand data
+        if ds_ref is not None:
+            for coord in ["lat", "lon"]:
+                if coord in ds_ref.coords and coord in ds_hres.coords and \
+                        np.allclose(ds_ref[coord].values, ds_hres[coord].values, atol=1.e-04):
+                    ds_hres[coord] = ds_ref[coord].values
+
+        return ds_hres
+
     @staticmethod
     def manage_filemerge(filelist: List, file2merge: str, tmp_dir: str, search_patt: str = "*.nc"):
         """
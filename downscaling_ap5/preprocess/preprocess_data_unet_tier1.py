@@ -1,7 +1,7 @@
 __author__ = "Michael Langguth"
 __email__ = "m.langguth@fz-juelich.de"
 __date__ = "2022-03-16"
-__update__ = "2022-04-29"
+__update__ = "2023-05-22"
 
 # doc-string
 """
@@ -20,7 +20,7 @@ import datetime as dt
 import numpy as np
 from collections import OrderedDict
 from typing import Union, List
-#from tfrecords_utils import IFS2TFRecords
+from tfrecords_utils import IFS2TFRecords
 from other_utils import to_list
 from pystager_utils import PyStager
 from abstract_preprocess import AbstractPreprocessing, CDOGridDes
@@ -92,7 +92,7 @@ class Preprocess_Unet_Tier1(AbstractPreprocessing):
 
     @staticmethod
     def preprocess_worker(year_months: list, dir_in: str, dir_out: str, gdes_dict: dict, logger: logging.Logger,
-                          nmax_warn: int = 3, hour: int = None):
+                          nmax_warn: int = 3, hour: int = None, tfr_nshards: int = 4, tfr_compression: str = "GZIP"):
         """
         Function that runs job of an individual worker.
         :param year_months: Datetime-objdect indicating year and month for which data should be preprocessed
@@ -102,6 +102,8 @@ class Preprocess_Unet_Tier1(AbstractPreprocessing):
         :param logger: Logging instance for log process on worker
         :param nmax_warn: allowed maximum number of warnings/problems met during processing (default:3)
         :param hour: hour of the dy for which data should be preprocessed (default: None)
+        :param tfr_nshards: number of TFRecord-files (shards) per month (set to 0 to skip the TFRecord-conversion)
+        :param tfr_compression: compression type of the TFRecord-files ("", "GZIP" or "ZLIB")
         :return: number of warnings/problems met during processing (if they do not trigger an error)
         """
         method = Preprocess_Unet_Tier1.preprocess_worker.__name__
@@ -164,25 +166,23 @@ class Preprocess_Unet_Tier1(AbstractPreprocessing):
                         raise err
                     else:
                         pass
-            # Conversion to TFRecords does not work yet (2021-11-19)
-            # move remapped data to own directory
-            # tfr_data_dir = os.path.join(dir_out, "tfr_data")
-            # ifs_tfr = IFS2TFRecords(tfr_data_dir, os.path.join(dest_nc_dir, os.path.basename(nc_files[0])
-            #                                                    .replace(".nc", "_remapped.nc")))
-            # ifs_tfr.get_and_write_metadata()
-            # logger.info("%{0}: IFS2TFRecords-class instance has been initalized successully.".format(method))
-            # try:
-            #     ifs_tfr.write_monthly_data_to_tfr(dest_nc_dir, patt="*remapped.nc")
-            # except Exception as err:
-            #     logger.critical("%{0}: Error when writing TFRecord-file. Investigate error-message below."
-            #     .format(method))
-            #     raise err
-            #
-            # logger.info("%{0}: TFRecord-files have been created succesfully under '{1}'".format(method, tfr_data_dir))
-            # logger.info("%{0}: During processing {1:d} warnings have been faced.".format(method, nwarns))
-            #
-            # logger.info("%{0}: TFRecord-files have been created succesfully under '{1}'".format(method, tfr_data_dir))
-            # logger.info("%{0}: During processing {1:d} warnings have been faced.".format(method, nwarns))
+            if tfr_nshards > 0:
+                # convert remapped data to TFRecords (stored in own directory)
+                tfr_data_dir = os.path.join(dir_out, "tfr_data")
+                nc_file_ex = os.path.join(dest_nc_dir, os.path.basename(nc_files[0]).replace(".nc", "_remapped.nc"))
+                ifs_tfr = IFS2TFRecords(tfr_data_dir, nc_file_ex)
+                logger.info("%{0}: IFS2TFRecords-class instance has been initalized successully.".format(method))
+                try:
+                    ifs_tfr.write_monthly_data_to_tfr(dest_nc_dir, patt="*remapped.nc", nshards=tfr_nshards,
+                                                      compression=tfr_compression)
+                except Exception as err:
+                    logger.critical("%{0}: Error when writing TFRecord-file. Investigate error-message below."
+                                    .format(method))
+                    raise err
+
+                logger.info("%{0}: TFRecord-files have been created succesfully under '{1}'"
+                            .format(method, tfr_data_dir))
+            logger.info("%{0}: During processing {1:d} warnings have been faced.".format(method, nwarns))
 
         return nwarns
 
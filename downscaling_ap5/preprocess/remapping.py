@@ -0,0 +1,342 @@
+# SPDX-FileCopyrightText: 2023 Earth System Data Exploration (ESDE), Jülich Supercomputing Center (JSC)
+#
+# SPDX-License-Identifier: MIT
+
+"""
+Remapping of data between regular grids described by CDO grid description dictionaries (see CDOGridDes) in Python.
+Supported are first-order conservative remapping (cf. cdo remapcon) and bilinear remapping (cf. cdo remapbil).
+Since the grids are regular, the remapping weights are separable in x- and y-direction and the 2D weight matrix is
+the Kronecker product of the 1D weight matrices. The (sparse) weight matrices are computed only once, cached in memory
+and optionally persisted to disk. The remapping itself is a sparse matrix product applied to all time steps and
+variables at once.
+"""
+
+__author__ = "agent"
+__email__ = "agent@local"
+__date__ = "2026-10-18"
+__update__ = "2026-10-18"
+
+import os
+import json as js
+import hashlib
+from typing import List, Union
+import numpy as np
+import xarray as xr
+import scipy.sparse as sp_sparse
+from abstract_preprocess import CDOGridDes
+
+str_or_dict = Union[str, dict]
+
+# keys of grid description dictionaries that define the grid (used to identify weights)
+grid_keys = ["gridtype", "xsize", "ysize", "xfirst", "xinc", "yfirst", "yinc", "grid_north_pole_latitude",
+             "grid_north_pole_longitude"]
+known_methods = ["con", "bil"]
+
+# in-memory cache of weight matrices
+_weights_cache = {}
+
+
+def get_grid_des(gdes: str_or_dict) -> dict:
+    """
+    Get grid description dictionary from grid description file or dictionary.
+    :param gdes: path to CDO grid description file or grid description dictionary
+    :return: grid description dictionary
+    """
+    if isinstance(gdes, dict):
+        return gdes
+    elif isinstance(gdes, str):
+        return CDOGridDes.read_grid_des(gdes)
+    else:
+        raise ValueError(f"Grid description must be a file or a dictionary, but is of type {type(gdes)}.")
+
+
+def get_grid_des_from_coords(x: np.ndarray, y: np.ndarray, gridtype: str = "lonlat", xname: str = "lon",
+                             yname: str = "lat", dec: int = 6) -> dict:
+    """
+    Create grid description dictionary of a regular grid from its coordinates.
+    :param x: coordinate values in x-direction (longitude)
+    :param y: coordinate values in y-direction (latitude)
+    :param gridtype: type of grid
+    :param xname: name of x-coordinate
+    :param yname: name of y-coordinate
+    :param dec: number of decimals to round grid increments
+    :return: grid description dictionary
+    """
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    dx, dy = np.round(np.diff(x), dec), np.round(np.diff(y), dec)
+
+    if not (np.allclose(dx, dx[0]) and np.allclose(dy, dy[0])):
+        raise ValueError("Coordinates do not constitute a regular grid.")
+
+    return {"gridtype": gridtype, "xsize": len(x), "ysize": len(y), "xfirst": x[0], "xinc": dx[0], "yfirst": y[0],
+            "yinc": dy[0], "xname": xname, "yname": yname}
+
+
+def get_grid_coords(gdes: dict) -> (np.ndarray, np.ndarray):
+    """
+    Get coordinates of grid cell centers.
+    :param gdes: grid description dictionary
+    :return: tuple of coordinate arrays in x- and y-direction
+    """
+    x = float(gdes["xfirst"]) + np.arange(int(gdes["xsize"])) * float(gdes["xinc"])
+    y = float(gdes["yfirst"]) + np.arange(int(gdes["ysize"])) * float(gdes["yinc"])
+
+    return x, y
+
+
+def get_grid_key(gdes: dict, dec: int = 6) -> str:
+    """
+    Get string identifying a grid.
+    :param gdes: grid description dictionary
+    :param dec: number of decimals to consider for float values
+    :return: identifying string
+    """
+    key_list = []
+    for key in grid_keys:
+        val = gdes.get(key, None)
+        try:
+            val = f"{float(val):.{dec}f}"
+        except (TypeError, ValueError):
+            val = str(val)
+        key_list.append(f"{key}={val}")
+
+    return ";".join(key_list)
+
+
+def _cell_bounds(coords: np.ndarray) -> np.ndarray:
+    """
+    Get (ascending) bounds of grid cells of a regular 1D grid.
+    :param coords: coordinates of grid cell centers
+    :return: array of shape (n, 2) with lower and upper bound of each cell
+    """
+    dc = np.abs(coords[1] - coords[0]) if len(coords) > 1 else 1.
+    return np.stack([coords - dc / 2., coords + dc / 2.], axis=-1)
+
+
+def normalize_longitudes(lon: np.ndarray, lon_ref: np.ndarray) -> np.ndarray:
+    """
+    Convert longitudes to the convention of reference longitudes, i.e. [0, 360) if any reference longitude exceeds
+    180 degree and [-180, 180) otherwise.
+    :param lon: longitudes to convert
+    :param lon_ref: reference longitudes (e.g. of the source grid)
+    :return: converted longitudes
+    """
+    if np.any(np.asarray(lon_ref) > 180.):
+        return np.mod(lon, 360.)
+    else:
+        return np.mod(np.asarray(lon) + 180., 360.) - 180.
+
+
+def conservative_weights_1d(coords_in: np.ndarray, coords_out: np.ndarray, lsin: bool = False) -> np.ndarray:
+    """
+    Get first-order conservative remapping weights along one dimension, i.e. the overlap of the source cells with the
+    destination cells normalized by the overlapping part of the destination cells (cf. normalization 'fracarea' of CDO).
+    For latitudes, the overlap is computed in terms of sin(lat) such that the product of the weights in x- and
+    y-direction corresponds to the overlap of the cell areas on the sphere.
+    :param coords_in: coordinates of source grid cells
+    :param coords_out: coordinates of destination grid cells
+    :param lsin: flag to measure the overlap in sin(coordinate) (to be used for latitudes in degrees)
+    :return: dense weight matrix with shape (len(coords_out), len(coords_in))
+    """
+    bnds_in, bnds_out = _cell_bounds(coords_in), _cell_bounds(coords_out)
+
+    lower = np.maximum(bnds_out[:, None, 0], bnds_in[None, :, 0])
+    upper = np.minimum(bnds_out[:, None, 1], bnds_in[None, :, 1])
+    upper = np.maximum(upper, lower)
+
+    if lsin:
+        lower, upper = np.clip(lower, -90., 90.), np.clip(upper, -90., 90.)
+        overlap = np.sin(np.deg2rad(upper)) - np.sin(np.deg2rad(lower))
+    else:
+        overlap = upper - lower
+
+    norm = np.sum(overlap, axis=1, keepdims=True)
+
+    return np.divide(overlap, norm, out=np.zeros_like(overlap), where=norm > 0.)
+
+
+def bilinear_weights_1d(coords_in: np.ndarray, coords_out: np.ndarray) -> np.ndarray:
+    """
+    Get linear interpolation weights along one dimension. Destination points outside the source grid take the value
+    of the closest source grid point (edge clamping). To avoid silent extrapolation over large distances, destination
+    points must not lie more than half a grid cell outside the source grid.
+    :param coords_in: coordinates of source grid points (ascending or descending)
+    :param coords_out: coordinates of destination grid points
+    :return: dense weight matrix with shape (len(coords_out), len(coords_in))
+    """
+    nin, nout = len(coords_in), len(coords_out)
+    weights = np.zeros((nout, nin))
+
+    bnds_in = _cell_bounds(coords_in)
+    lower, upper = np.min(bnds_in[:, 0]), np.max(bnds_in[:, 1])
+    tol = 1.e-06 * (upper - lower)
+    if np.any(coords_out < lower - tol) or np.any(coords_out > upper + tol):
+        raise ValueError(f"Destination coordinates [{np.min(coords_out)}, {np.max(coords_out)}] exceed the source " +
+                         f"grid [{lower}, {upper}] by more than half a grid cell.")
+
+    if nin == 1:
+        weights[:, 0] = 1.
+        return weights
+
+    # work on ascending coordinates
+    lflip = coords_in[0] > coords_in[-1]
+    c_in = coords_in[::-1] if lflip else coords_in
+
+    i0 = np.clip(np.searchsorted(c_in, coords_out) - 1, 0, nin - 2)
+    frac = np.clip((coords_out - c_in[i0]) / (c_in[i0 + 1] - c_in[i0]), 0., 1.)
+
+    if lflip:
+        i0, i1 = nin - 1 - i0, nin - 2 - i0
+    else:
+        i1 = i0 + 1
+
+    iout = np.arange(nout)
+    np.add.at(weights, (iout, i0), 1. - frac)
+    np.add.at(weights, (iout, i1), frac)
+
+    return weights
+
+
+def compute_weights(gdes_in: dict, gdes_out: dict, method: str) -> sp_sparse.csr_matrix:
+    """
+    Compute sparse remapping weights between two regular grids.
+    :param gdes_in: grid description dictionary of source grid
+    :param gdes_out: grid description dictionary of destination grid
+    :param method: remapping method ('con' for first-order conservative, 'bil' for bilinear)
+    :return: sparse weight matrix with shape (ny_out*nx_out, ny_in*nx_in)
+    """
+    if method not in known_methods:
+        raise ValueError(f"Unknown remapping method '{method}'. Known methods are {', '.join(known_methods)}.")
+
+    if gdes_in.get("gridtype", "lonlat") != gdes_out.get("gridtype", "lonlat"):
+        raise ValueError("Source and destination grid must be of the same grid type.")
+
+    for key in ["grid_north_pole_latitude", "grid_north_pole_longitude"]:
+        if str(gdes_in.get(key, None)) != str(gdes_out.get(key, None)):
+            raise ValueError("Source and destination grid must share the same projection.")
+
+    x_in, y_in = get_grid_coords(gdes_in)
+    x_out, y_out = get_grid_coords(gdes_out)
+    if gdes_in.get("gridtype", "lonlat") == "lonlat":
+        # ensure that the longitudes of both grids follow the same convention
+        x_out = normalize_longitudes(x_out, x_in)
+
+    if method == "con":
+        wx, wy = conservative_weights_1d(x_in, x_out), conservative_weights_1d(y_in, y_out, lsin=True)
+        # no extrapolation for conservative remapping
+        if not (np.all(wx.sum(axis=1) > 0.) and np.all(wy.sum(axis=1) > 0.)):
+            raise ValueError("Destination grid is not fully covered by source grid.")
+    else:
+        wx, wy = bilinear_weights_1d(x_in, x_out), bilinear_weights_1d(y_in, y_out)
+
+    # data is flattened in C-order, i.e. (y, x)
+    weights = sp_sparse.kron(sp_sparse.csr_matrix(wy), sp_sparse.csr_matrix(wx), format="csr")
+    weights.eliminate_zeros()
+
+    return weights
+
+
+def get_weights(gdes_list: List[str_or_dict], methods: List[str], weights_dir: str = None) -> sp_sparse.csr_matrix:
+    """
+    Get (composed) sparse remapping weights for a chain of remapping steps. The weights are cached in memory and
+    persisted to weights_dir (if parsed).
+    :param gdes_list: list of grid descriptions (file or dictionary), starting with the source grid
+    :param methods: list of remapping methods for each step (len(methods) = len(gdes_list) - 1)
+    :param weights_dir: directory to persist weights (None: weights are cached in memory only)
+    :return: sparse weight matrix
+    """
+    if len(methods) != len(gdes_list) - 1:
+        raise ValueError(f"Number of remapping methods ({len(methods)}) does not match number of remapping steps " +
+                         f"({len(gdes_list) - 1}).")
+
+    gdes_list = [get_grid_des(gdes) for gdes in gdes_list]
+    key_str = js.dumps({"grids": [get_grid_key(gdes) for gdes in gdes_list], "methods": list(methods)})
+    key = hashlib.sha1(key_str.encode()).hexdigest()
+
+    if key in _weights_cache:
+        return _weights_cache[key]
+
+    weights_file = os.path.join(weights_dir, f"remap_weights_{'_'.join(methods)}_{key}.npz") if weights_dir else None
+    if weights_file and os.path.isfile(weights_file):
+        weights = sp_sparse.load_npz(weights_file).tocsr()
+    else:
+        weights = None
+        for gdes_in, gdes_out, method in zip(gdes_list[:-1], gdes_list[1:], methods):
+            weights_step = compute_weights(gdes_in, gdes_out, method)
+            weights = weights_step if weights is None else (weights_step @ weights).tocsr()
+        if weights_file:
+            os.makedirs(weights_dir, exist_ok=True)
+            # write to temporary file first to avoid that concurrent processes read incomplete files
+            weights_tmp = weights_file.replace(".npz", f"_{os.getpid()}.npz")
+            sp_sparse.save_npz(weights_tmp, weights)
+            os.replace(weights_tmp, weights_file)
+
+    _weights_cache[key] = weights
+
+    return weights
+
+
+def remap_array(data: np.ndarray, weights: sp_sparse.csr_matrix, shape_out: tuple) -> np.ndarray:
+    """
+    Remap data with a sparse weight matrix. All leading dimensions (e.g. time and variables) are processed at once.
+    Missing values (NaNs) are excluded and the weights are renormalized accordingly. Destination cells that do not
+    overlap with valid source cells are set to NaN.
+    :param data: data array with shape (..., ny_in, nx_in)
+    :param weights: sparse weight matrix with shape (ny_out*nx_out, ny_in*nx_in)
+    :param shape_out: shape of the destination grid, i.e. (ny_out, nx_out)
+    :return: remapped data with shape (..., ny_out, nx_out)
+    """
+    lead_shape = data.shape[:-2]
+    data2d = data.reshape(-1, data.shape[-2] * data.shape[-1]).T
+
+    lnan = np.isnan(data2d)
+    if np.any(lnan):
+        num = weights @ np.where(lnan, 0., data2d)
+        den = weights @ (~lnan).astype(data2d.dtype)
+    else:
+        num = weights @ data2d
+        den = np.asarray(weights.sum(axis=1))
+    data_out = np.divide(num, den, out=np.full(num.shape, np.nan, dtype=num.dtype), where=den > 1.e-12)
+
+    return data_out.T.reshape(*lead_shape, *shape_out).astype(data.dtype, copy=False)
+
+
+def remap_dataset(ds: xr.Dataset, gdes_list: List[str_or_dict], methods: List[str], varnames: List = None,
+                  weights_dir: str = None, xname_in: str = "lon", yname_in: str = "lat") -> xr.Dataset:
+    """
+    Remap variables of a dataset along a chain of grids. The source grid is retrieved from the dataset coordinates.
+    The longitudes of the destination grids may follow another convention than the source grid ([0, 360) vs.
+    [-180, 180)). A ValueError is raised if a destination grid is not covered by the source grid.
+    :param ds: the dataset to remap
+    :param gdes_list: list of grid descriptions (file or dictionary) of the subsequent remapping steps
+    :param methods: list of remapping methods for each step
+    :param varnames: list of variables to remap (None: all variables with dimensions yname_in and xname_in)
+    :param weights_dir: directory to persist weights
+    :param xname_in: name of x-coordinate in ds
+    :param yname_in: name of y-coordinate in ds
+    :return: dataset with remapped variables
+    """
+    gdes_in = get_grid_des_from_coords(ds[xname_in].values, ds[yname_in].values, xname=xname_in, yname=yname_in)
+    gdes_list = [gdes_in] + [get_grid_des(gdes) for gdes in gdes_list]
+    gdes_out = gdes_list[-1]
+    weights = get_weights(gdes_list, methods, weights_dir)
+
+    x_out, y_out = get_grid_coords(gdes_out)
+    xname_out, yname_out = gdes_out.get("xname", "lon"), gdes_out.get("yname", "lat")
+    shape_out = (len(y_out), len(x_out))
+
+    if varnames is None:
+        varnames = [var for var in ds.data_vars if xname_in in ds[var].dims and yname_in in ds[var].dims]
+
+    data_vars = {}
+    for var in varnames:
+        da = ds[var].transpose(..., yname_in, xname_in)
+        data_out = remap_array(da.values, weights, shape_out)
+        data_vars[var] = xr.DataArray(data_out, dims=(*da.dims[:-2], yname_out, xname_out), attrs=da.attrs)
+
+    coords = {name: ds[name] for name in ds.coords if xname_in not in ds[name].dims and yname_in not in ds[name].dims}
+    coords.update({yname_out: (yname_out, y_out), xname_out: (xname_out, x_out)})
+    ds_out = xr.Dataset(data_vars, coords=coords, attrs=ds.attrs)
+    ds_out[xname_out].attrs, ds_out[yname_out].attrs = ds[xname_in].attrs, ds[yname_in].attrs
+
+    return ds_out
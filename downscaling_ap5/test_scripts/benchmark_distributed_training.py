@@ -0,0 +1,165 @@
+# SPDX-FileCopyrightText: 2023 Earth System Data Exploration (ESDE), Jülich Supercomputing Center (JSC)
+#
+# SPDX-License-Identifier: MIT
+
+"""
+Scaling benchmark of data-parallel training with tf.distribute.MirroredStrategy.
+The throughput (samples/s) of the U-Net or WGAN is measured on synthetic data for an increasing number of replicas.
+Without GPUs, the CPU is split into virtual devices, so that the benchmark also runs on a laptop
+(e.g. python benchmark_distributed_training.py -model unet -replicas 1 2 4).
+For the WGAN, the step times with and without the fused, XLA-compiled critic loop can be compared
+(-fused_critic both). Before the benchmark, the fused critic loop is checked to run under a MirroredStrategy with
+two replicas (e.g. python benchmark_distributed_training.py -model wgan -fused_critic on -replicas 1 2).
+"""
+
+__author__ = "agent"
+__email__ = "agent@local"
+__date__ = "2026-10-18"
+__update__ = "2026-10-18"
+
+import argparse
+import tempfile
+import json as js
+import numpy as np
+import tensorflow as tf
+from model_utils import ModelEngine, TimeHistory, handle_opt_utils
+
+hparams_models = {"unet": {"z_branch": False, "n_predictands": 1, "lscheduled_train": False, "ngf": 16},
+                  "wgan": {"z_branch": False, "n_predictands": 1, "lscheduled_train": False, "ngf": 16,
+                           "d_steps": 2}}
+
+
+def set_devices(nreplicas_max: int):
+    """
+    Get devices for the benchmark. If less than nreplicas_max GPUs are available, the CPU is split into
+    nreplicas_max virtual devices.
+    :param nreplicas_max: maximum number of replicas
+    :return: list of device names
+    """
+    gpus = tf.config.list_physical_devices("GPU")
+    if len(gpus) >= nreplicas_max:
+        return [f"/gpu:{i:d}" for i in range(nreplicas_max)]
+
+    cpus = tf.config.list_physical_devices("CPU")
+    tf.config.set_logical_device_configuration(cpus[0], [tf.config.LogicalDeviceConfiguration()
+                                                         for _ in range(nreplicas_max)])
+    print(f"Use {nreplicas_max:d} virtual CPU devices.")
+
+    return [f"/cpu:{i:d}" for i in range(nreplicas_max)]
+
+
+def make_synthetic_dataset(shape_in, nsamples: int, batch_size: int):
+    rng = np.random.default_rng(42)
+    data_in = rng.normal(size=(nsamples, *shape_in)).astype("float32")
+    data_tar = rng.normal(size=(nsamples, *shape_in[:-1], 1)).astype("float32")
+
+    return tf.data.Dataset.from_tensor_slices((data_in, data_tar)).repeat().batch(batch_size, drop_remainder=True)
+
+
+def run_benchmark(model_name: str, devices, shape_in, batch_size: int, nsteps: int, nepochs: int,
+                  lfused_critic: bool = False):
+    """
+    Train model with MirroredStrategy on the parsed devices and measure the throughput.
+    :return: samples per second and mean step time in seconds (first epoch is excluded as warm-up)
+    """
+    strategy = tf.distribute.MirroredStrategy(devices=devices)
+    hparams = {**hparams_models[model_name], "batch_size": batch_size, "nepochs": nepochs}
+    if model_name == "wgan":
+        hparams["lfused_critic"] = lfused_critic
+    bs_train = batch_size * (hparams["d_steps"] + 1) if "d_steps" in hparams else batch_size
+    bs_global = bs_train * strategy.num_replicas_in_sync
+
+    with strategy.scope():
+        model = ModelEngine(model_name)(shape_in, ["t2m_tar"], hparams, tempfile.mkdtemp(), f"{model_name}_bm")
+        model.compile(**handle_opt_utils(model, "get_compile_opts"))
+
+    tfds = make_synthetic_dataset(shape_in, 4 * bs_global, bs_global)
+    time_tracker = TimeHistory()
+    model.fit(x=tfds, callbacks=[time_tracker], epochs=nepochs, steps_per_epoch=nsteps, verbose=0)
+
+    return nsteps * batch_size * strategy.num_replicas_in_sync / np.mean(time_tracker.epoch_times[1:]), \
+           time_tracker.get_step_time_stats()["mean step time"]
+
+
+def check_fused_critic_distributed(devices, shape_in, batch_size: int):
+    """
+    Check that the WGAN with the fused critic loop can be trained under a MirroredStrategy with multiple replicas
+    (i.e. that the optimizer's cross-replica update is not placed within a control flow body).
+    """
+    strategy = tf.distribute.MirroredStrategy(devices=devices)
+    hparams = {**hparams_models["wgan"], "batch_size": batch_size, "nepochs": 1, "lfused_critic": True}
+    bs_global = batch_size * (hparams["d_steps"] + 1) * strategy.num_replicas_in_sync
+
+    with strategy.scope():
+        model = ModelEngine("wgan")(shape_in, ["t2m_tar"], hparams, tempfile.mkdtemp(), "wgan_fused_check")
+        model.compile(**handle_opt_utils(model, "get_compile_opts"))
+
+    history = model.fit(x=make_synthetic_dataset(shape_in, 2 * bs_global, bs_global), epochs=1, steps_per_epoch=2,
+                        verbose=0)
+    losses = {key: val[-1] for key, val in history.history.items()}
+    assert all(np.isfinite(val) for val in losses.values()), f"Non-finite losses with fused critic: {losses}"
+    print(f"Fused critic loop runs with {strategy.num_replicas_in_sync:d} replicas (losses: {losses}).")
+
+
+def main(parser_args):
+    nreplicas_list = sorted(parser_args.nreplicas)
+    devices = set_devices(max(nreplicas_list[-1], 2))
+    shape_in = (parser_args.ny, parser_args.nx, parser_args.nchannels)
+
+    fused_variants = {"off": [False], "on": [True], "both": [False, True]}[parser_args.fused_critic]
+    if parser_args.model != "wgan":
+        fused_variants = [False]
+    elif True in fused_variants:
+        check_fused_critic_distributed(devices[:2], shape_in, parser_args.batch_size)
+
+    results = {}
+    for lfused in fused_variants:
+        variant = "fused" if lfused else "default"
+        results[variant] = {}
+        for nreplicas in nreplicas_list:
+            samples_s, step_time = run_benchmark(parser_args.model, devices[:nreplicas], shape_in,
+                                                 parser_args.batch_size, parser_args.nsteps, parser_args.nepochs,
+                                                 lfused)
+            results[variant][nreplicas] = {"samples per second": samples_s, "mean step time": step_time}
+            samples_s_ref = results[variant][nreplicas_list[0]]["samples per second"] / nreplicas_list[0]
+            print(f"{variant.capitalize()} step, {nreplicas:d} replica(s): {samples_s:.1f} samples/s, " +
+                  f"mean step time: {step_time * 1000.:.1f}ms " +
+                  f"(scaling efficiency: {samples_s / (nreplicas * samples_s_ref) * 100.:.1f}%)")
+
+    if len(results) == 2:
+        for nreplicas in nreplicas_list:
+            speedup = results["default"][nreplicas]["mean step time"] / results["fused"][nreplicas]["mean step time"]
+            print(f"Speed-up of fused critic loop with {nreplicas:d} replica(s): {speedup:.2f}")
+
+    if parser_args.js_out:
+        with open(parser_args.js_out, "w") as jsf:
+            js.dump({"model": parser_args.model, "devices": devices, "results": results}, jsf, indent=1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--downscaling_model", "-model", dest="model", type=str, default="unet",
+                        choices=list(hparams_models.keys()), help="Model to benchmark.")
+    parser.add_argument("--nreplicas", "-replicas", dest="nreplicas", type=int, nargs="+", default=[1, 2, 4],
+                        help="Number of replicas to benchmark.")
+    parser.add_argument("--batch_size", "-batch_size", dest="batch_size", type=int, default=8,
+                        help="Mini-batch size per replica.")
+    parser.add_argument("--nsteps", "-nsteps", dest="nsteps", type=int, default=20,
+                        help="Number of training steps per epoch.")
+    parser.add_argument("--nepochs", "-nepochs", dest="nepochs", type=int, default=3,
+                        help="Number of epochs (the first epoch is excluded as warm-up).")
+    parser.add_argument("--nx", "-nx", dest="nx", type=int, default=128, help="Number of grid points in x-direction.")
+    parser.add_argument("--ny", "-ny", dest="ny", type=int, default=96, help="Number of grid points in y-direction.")
+    parser.add_argument("--nchannels", "-nchannels", dest="nchannels", type=int, default=9,
+                        help="Number of input channels.")
+    parser.add_argument("--fused_critic", "-fused_critic", dest="fused_critic", type=str, default="off",
+                        choices=["off", "on", "both"],
+                        help="Use the fused, XLA-compiled critic loop of the WGAN (both: compare step times). " +
+                             "Note that the results differ from the unfused critic loop since the batch " +
+                             "normalization layers of the critic normalize over real, generated and mixed data " +
+                             "jointly.")
+    parser.add_argument("--json_out", "-js_out", dest="js_out", type=str, default=None,
+                        help="JSON-file to save the results.")
+
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,86 @@
+# SPDX-FileCopyrightText: 2023 Earth System Data Exploration (ESDE), Jülich Supercomputing Center (JSC)
+#
+# SPDX-License-Identifier: MIT
+
+"""
+Benchmark of the data backends of HandleDataClass.make_tf_dataset_allmem.
+For the validation and test dataset, the time-to-first-batch, the time for one epoch and the peak RSS are measured.
+Each backend is run in a separate process to get independent peak RSS values.
+"""
+
+__author__ = "agent"
+__email__ = "agent@local"
+__date__ = "2026-10-18"
+__update__ = "2026-10-18"
+
+import argparse
+import json as js
+import multiprocessing
+from timeit import default_timer as timer
+import numpy as np
+import xarray as xr
+from handle_data_class import HandleDataClass, get_dataset_filename
+from all_normalizations import ZScore
+from other_utils import get_max_memory_usage
+
+
+def run_backend(fdata: str, ds_dict: dict, js_norm: str, data_backend: str, result_queue):
+    t0 = timer()
+    data_norm = ZScore(ds_dict["norm_dims"])
+    data_norm.read_norm_from_file(js_norm)
+
+    with xr.open_dataset(fdata) as ds:
+        ds = data_norm.normalize(ds)
+    da = HandleDataClass.reshape_ds(ds.astype("float32", copy=False))
+    t_load = timer() - t0
+
+    tfds = HandleDataClass.make_tf_dataset_allmem(da, ds_dict["batch_size"], ds_dict["predictands"],
+                                                  predictors=ds_dict.get("predictors", None),
+                                                  var_tar2in=ds_dict["var_tar2in"], lrepeat=False,
+                                                  data_backend=data_backend)
+    nbatches = 0
+    t0 = timer()
+    for _ in tfds:
+        if nbatches == 0:
+            t_first = timer() - t0
+        nbatches += 1
+    t_epoch = timer() - t0
+
+    result_queue.put({"backend": data_backend, "loading time": t_load, "time to first batch": t_first,
+                      "epoch time": t_epoch, "#batches": nbatches, "peak RSS [GB]": get_max_memory_usage() / 1.e+09})
+
+
+def main():
+    parser = argparse.ArgumentParser("Benchmark of the data backends for the in-memory TF dataset.")
+    parser.add_argument("--data_dir", "-data_dir", dest="data_dir", type=str, required=True,
+                        help="Directory where the validation and test netCDF-files are stored.")
+    parser.add_argument("--dataset", "-dataset", dest="dataset", type=str, default="tier2",
+                        help="Name of the dataset.")
+    parser.add_argument("--configuration_dataset", "-conf_ds", dest="conf_ds", type=argparse.FileType("r"),
+                        required=True, help="JSON-file to configure dataset.")
+    parser.add_argument("--json_norm_file", "-js_norm", dest="js_norm", type=str, required=True,
+                        help="JSON-file providing normalization parameters.")
+    parser.add_argument("--data_backends", "-backends", dest="backends", nargs="+", default=["generator", "numpy"],
+                        help="Data backends to benchmark.")
+
+    args = parser.parse_args()
+
+    with args.conf_ds as dsf:
+        ds_dict = js.load(dsf)
+
+    ctx = multiprocessing.get_context("spawn")
+    for subset in ["val", "test"]:
+        fdata = get_dataset_filename(args.data_dir, args.dataset, subset, ds_dict.get("laugmented", False))
+        print(f"Benchmark for {subset} dataset '{fdata}':")
+        for backend in args.backends:
+            result_queue = ctx.Queue()
+            proc = ctx.Process(target=run_backend, args=(fdata, ds_dict, args.js_norm, backend, result_queue))
+            proc.start()
+            res = result_queue.get()
+            proc.join()
+            print(", ".join([f"{key}: {val:.2f}" if isinstance(val, (float, np.floating)) else f"{key}: {val}"
+                             for key, val in res.items()]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# SPDX-FileCopyrightText: 2023 Earth System Data Exploration (ESDE), Jülich Supercomputing Center (JSC)
+#
+# SPDX-License-Identifier: MIT
+
+"""
+Test of the vectorized block bootstrapping (see perform_block_bootstrap_metric) against a straightforward
+implementation based on xarray's isel and mean for a synthetic gridded metric.
+"""
+
+__author__ = "agent"
+__email__ = "agent@local"
+__date__ = "2026-10-18"
+__update__ = "2026-10-18"
+
+import argparse
+from timeit import default_timer as timer
+import numpy as np
+import pandas as pd
+import xarray as xr
+from statistical_evaluation import perform_block_bootstrap_metric
+
+
+def block_bootstrap_ref(metric: xr.DataArray, dim_name: str, block_length: int, nboots_block: int, seed: int):
+    nblocks = metric.sizes[dim_name] // block_length
+    metric_val_block = xr.concat([metric.isel({dim_name: slice(i * block_length, (i + 1) * block_length)})
+                                  .mean(dim=dim_name) for i in range(nblocks)], dim="iblock")
+
+    np.random.seed(seed)
+    iblocks_boot = np.sort(np.random.randint(nblocks, size=(nboots_block, nblocks)))
+
+    return xr.concat([metric_val_block.isel(iblock=iblocks_boot[i, :]).mean(dim="iblock")
+                      for i in range(nboots_block)], dim="iboot")
+
+
+def main(parser_args):
+    rng = np.random.default_rng(42)
+    times = pd.date_range("2018-01-01", periods=parser_args.ntimes, freq="H")
+    data = rng.normal(size=(len(times), parser_args.ny, parser_args.nx))
+    data[rng.random(data.shape) < 0.01] = np.nan
+    metric = xr.DataArray(data, coords={"time": times, "rlat": np.arange(parser_args.ny),
+                                        "rlon": np.arange(parser_args.nx)}, dims=["time", "rlat", "rlon"], name="rmse")
+
+    t0 = timer()
+    metric_boot = perform_block_bootstrap_metric(metric, "time", parser_args.block_length, parser_args.nboots,
+                                                 nworkers=parser_args.nworkers)
+    print(f"Vectorized block bootstrapping took {timer() - t0:.2f}s.")
+
+    t0 = timer()
+    metric_boot_ref = block_bootstrap_ref(metric, "time", parser_args.block_length, parser_args.nboots, 42)
+    print(f"Reference block bootstrapping took {timer() - t0:.2f}s.")
+
+    assert metric_boot.dims == ("iboot", "rlat", "rlon"), f"Unexpected dimensions {metric_boot.dims}."
+    assert np.allclose(metric_boot.values, metric_boot_ref.values, equal_nan=True), \
+        "Vectorized block bootstrapping deviates from reference."
+    print("Vectorized block bootstrapping agrees with reference.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ntimes", "-ntimes", dest="ntimes", type=int, default=24*90, help="Number of time steps.")
+    parser.add_argument("--ny", "-ny", dest="ny", type=int, default=48, help="Number of grid points in y-direction.")
+    parser.add_argument("--nx", "-nx", dest="nx", type=int, default=64, help="Number of grid points in x-direction.")
+    parser.add_argument("--block_length", "-block_length", dest="block_length", type=int, default=72,
+                        help="Block length.")
+    parser.add_argument("--nboots", "-nboots", dest="nboots", type=int, default=200,
+                        help="Number of bootstrapping steps.")
+    parser.add_argument("--nworkers", "-nworkers", dest="nworkers", type=int, default=2, help="Number of threads.")
+
+    args = parser.parse_args()
+    main(args)
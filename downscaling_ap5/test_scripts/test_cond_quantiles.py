@@ -0,0 +1,96 @@
+# SPDX-FileCopyrightText: 2023 Earth System Data Exploration (ESDE), Jülich Supercomputing Center (JSC)
+#
+# SPDX-License-Identifier: MIT
+
+"""
+Test of the sort-based conditional quantiles (see calculate_cond_quantiles) against the bin-wise calculation with
+xarray's where and quantile. The streamed calculation with the histogram sketch must agree within the resolution of
+the sketch for all bins, including sparsely populated bins.
+"""
+
+__author__ = "agent"
+__email__ = "agent@local"
+__date__ = "2026-10-18"
+__update__ = "2026-10-18"
+
+import argparse
+from timeit import default_timer as timer
+import numpy as np
+import pandas as pd
+import xarray as xr
+from statistical_evaluation import calculate_cond_quantiles, CondHistogramSketch
+
+
+def cond_quantiles_ref(data_cond: xr.DataArray, data_tar: xr.DataArray, quantiles):
+    bins = list(np.arange(int(np.floor(np.min(data_cond))), int(np.ceil(np.max(data_cond))) + 1))
+    cond_quantiles = np.full((len(bins) - 1, len(quantiles)), np.nan)
+    for i in range(len(bins) - 1):
+        data_cropped = data_tar.where(np.logical_and(data_cond >= bins[i], data_cond < bins[i + 1]))
+        cond_quantiles[i] = data_cropped.quantile(quantiles)
+
+    return bins, cond_quantiles
+
+
+def check_sparse_bins(resolution: float = 0.01):
+    # bins with one, two and three samples
+    data_cond, data_tar = np.array([0.5, 1.5, 1.5, 2.5, 2.5, 2.5]), np.array([3., 0., 10., 1., 2., 7.])
+    sketch = CondHistogramSketch(0, 3, (0., 10.), resolution)
+    sketch.update(data_cond, data_tar)
+    quantiles = (0.05, 0.5, 0.95)
+    cond_quantiles = sketch.get_quantiles(quantiles)
+
+    cond_quantiles_ref = np.array([np.quantile(data_tar[np.floor(data_cond) == b], quantiles) for b in range(3)])
+    assert np.isclose(cond_quantiles[1, 1], 5., atol=resolution), \
+        f"Median of the bin with samples (0, 10) is {cond_quantiles[1, 1]:.3f} instead of 5."
+    assert np.all(np.abs(cond_quantiles - cond_quantiles_ref) <= resolution), \
+        "Conditional quantiles of the histogram sketch deviate in sparsely populated bins."
+    print("Histogram sketch is correct for sparsely populated bins.")
+
+
+def main(parser_args):
+    rng = np.random.default_rng(42)
+    times = pd.date_range("2018-01-01", periods=parser_args.ntimes, freq="H")
+    coords, dims = {"time": times, "rlat": np.arange(parser_args.ny), "rlon": np.arange(parser_args.nx)}, \
+                   ["time", "rlat", "rlon"]
+    ref = 285. + 8. * rng.normal(size=(len(times), parser_args.ny, parser_args.nx))
+    fcst = ref + rng.normal(scale=1.5, size=ref.shape)
+    data_ref, data_fcst = xr.DataArray(ref, coords=coords, dims=dims), xr.DataArray(fcst, coords=coords, dims=dims)
+    quantiles = (0.05, 0.5, 0.95)
+
+    t0 = timer()
+    quantile_panel, _ = calculate_cond_quantiles(data_fcst, data_ref, quantiles=quantiles)
+    print(f"Sort-based conditional quantiles took {timer() - t0:.2f}s.")
+
+    t0 = timer()
+    bins, cond_quantiles = cond_quantiles_ref(data_fcst, data_ref, quantiles)
+    print(f"Bin-wise conditional quantiles took {timer() - t0:.2f}s.")
+
+    bins_c = 0.5 * (np.asarray(bins[:-1]) + np.asarray(bins[1:]))
+    quantiles_sorted = quantile_panel.sel({"bin_center": bins_c}).values
+    assert np.array_equal(quantiles_sorted, cond_quantiles, equal_nan=True), \
+        "Sort-based conditional quantiles deviate from the bin-wise calculation."
+
+    t0 = timer()
+    quantile_panel_sk, _ = calculate_cond_quantiles(data_fcst, data_ref, quantiles=quantiles,
+                                                    chunk_size=parser_args.chunk_size, sketch_resolution=0.01)
+    print(f"Streamed conditional quantiles with histogram sketch took {timer() - t0:.2f}s.")
+    # all non-empty bins are compared (the outermost bins are sparsely populated)
+    counts = np.array([np.count_nonzero((fcst >= b) & (fcst < b + 1)) for b in bins[:-1]])
+    print(f"Number of bins with less than 10 samples: {np.count_nonzero((counts > 0) & (counts < 10)):d}")
+    max_diff = np.max(np.abs(quantile_panel_sk.sel({"bin_center": bins_c}).values - cond_quantiles)[counts > 0])
+    print(f"Maximum deviation of the histogram sketch: {max_diff:.4f}")
+    assert max_diff <= 0.01, "Conditional quantiles of the histogram sketch deviate by more than the resolution."
+    check_sparse_bins()
+    print("Conditional quantiles agree with the bin-wise calculation.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ntimes", "-ntimes", dest="ntimes", type=int, default=24*30, help="Number of time steps.")
+    parser.add_argument("--ny", "-ny", dest="ny", type=int, default=48, help="Number of grid points in y-direction.")
+    parser.add_argument("--nx", "-nx", dest="nx", type=int, default=64, help="Number of grid points in x-direction.")
+    parser.add_argument("--chunk_size", "-chunk_size", dest="chunk_size", type=int, default=100,
+                        help="Number of samples per chunk for the streamed calculation.")
+
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,75 @@
+# SPDX-FileCopyrightText: 2023 Earth System Data Exploration (ESDE), Jülich Supercomputing Center (JSC)
+#
+# SPDX-License-Identifier: MIT
+
+"""
+Test of the stencil-based spatial differential operators (see Scores.calc_geo_spatial_diff).
+The gradient amplitude is compared against the previous implementation based on xarray's differentiate and the
+Laplacian is checked with the analytical solution for f = sin(phi), i.e. Laplace(f) = -2 sin(phi) / r_e^2.
+"""
+
+__author__ = "agent"
+__email__ = "agent@local"
+__date__ = "2026-10-18"
+__update__ = "2026-10-18"
+
+import argparse
+from timeit import default_timer as timer
+import numpy as np
+import pandas as pd
+import xarray as xr
+from statistical_evaluation import Scores
+
+
+def calc_grad_amplitude_ref(scalar_field: xr.DataArray, r_e: float = 6371.e3):
+    lat, lon = np.deg2rad(scalar_field["lat"]), np.deg2rad(scalar_field["lon"])
+    dphi, dlambda = lat[1].values - lat[0].values, lon[1].values - lon[0].values
+
+    dvar_dlambda = 1. / (r_e * np.cos(lat) * dlambda) * scalar_field.differentiate("lon")
+    dvar_dphi = 1. / (r_e * dphi) * scalar_field.differentiate("lat")
+    dvar_dlambda = dvar_dlambda.transpose(*scalar_field.dims)
+
+    return np.sqrt(dvar_dlambda ** 2 + dvar_dphi ** 2).mean(dim=["lat", "lon"])
+
+
+def main(parser_args):
+    rng = np.random.default_rng(42)
+    coords = {"time": pd.date_range("2018-01-01", periods=parser_args.ntimes, freq="H"),
+              "lat": np.linspace(40., 60., parser_args.ny), "lon": np.linspace(0., 20., parser_args.nx)}
+    dims = list(coords.keys())
+    fcst = xr.DataArray(rng.normal(size=(parser_args.ntimes, parser_args.ny, parser_args.nx)), coords=coords,
+                        dims=dims)
+    ref = xr.DataArray(rng.normal(size=fcst.shape), coords=coords, dims=dims)
+
+    t0 = timer()
+    fcst_grad, ref_grad = Scores.calc_geo_spatial_diff(fcst, ref)
+    print(f"Stencil-based gradient amplitude of forecast and reference took {timer() - t0:.2f}s.")
+
+    t0 = timer()
+    fcst_grad_ref, ref_grad_ref = calc_grad_amplitude_ref(fcst), calc_grad_amplitude_ref(ref)
+    print(f"Gradient amplitude with xarray's differentiate took {timer() - t0:.2f}s.")
+
+    assert np.allclose(fcst_grad, fcst_grad_ref) and np.allclose(ref_grad, ref_grad_ref), \
+        "Stencil-based gradient amplitude deviates from previous implementation."
+
+    # test Laplacian
+    r_e = 6371.e3
+    field = xr.DataArray(np.broadcast_to(np.sin(np.deg2rad(coords["lat"]))[:, None], (parser_args.ny, parser_args.nx)),
+                         coords={"lat": coords["lat"], "lon": coords["lon"]}, dims=["lat", "lon"])
+    lapl = Scores.calc_geo_spatial_diff(field, order=2, r_e=r_e, dom_avg=False)
+    lapl_exact = 2. * np.abs(field) / r_e ** 2
+    rel_err = np.abs(lapl - lapl_exact)[2:-2, 2:-2].max() / lapl_exact.max()
+    print(f"Maximum relative error of Laplacian in the interior: {rel_err.values:.2e}")
+    assert rel_err < 1.e-02, "Laplacian deviates from the analytical solution."
+
+    print("Stencil-based differential operators are correct.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ntimes", "-ntimes", dest="ntimes", type=int, default=500, help="Number of time steps.")
+    parser.add_argument("--ny", "-ny", dest="ny", type=int, default=96, help="Number of grid points in y-direction.")
+    parser.add_argument("--nx", "-nx", dest="nx", type=int, default=128, help="Number of grid points in x-direction.")
+
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,54 @@
+# SPDX-FileCopyrightText: 2023 Earth System Data Exploration (ESDE), Jülich Supercomputing Center (JSC)
+#
+# SPDX-License-Identifier: MIT
+
+"""
+Test of the vectorized diurnal/seasonal aggregation (see get_hour_season_stats in postprocess.py) against xarray's
+groupby for a synthetic time series and synthetic maps.
+"""
+
+__author__ = "agent"
+__email__ = "agent@local"
+__date__ = "2026-10-18"
+__update__ = "2026-10-18"
+
+import argparse
+from timeit import default_timer as timer
+import numpy as np
+import pandas as pd
+import xarray as xr
+from postprocess import get_hour_season_stats
+
+
+def main(parser_args):
+    rng = np.random.default_rng(42)
+    times = pd.date_range("2018-01-01", periods=parser_args.ntimes, freq="H")
+    score = xr.DataArray(rng.normal(size=(len(times), parser_args.ny, parser_args.nx)),
+                         coords={"time": times, "rlat": np.arange(parser_args.ny), "rlon": np.arange(parser_args.nx)},
+                         dims=["time", "rlat", "rlon"])
+
+    for score_now in [score.mean(dim=["rlat", "rlon"]), score]:
+        t0 = timer()
+        stats = get_hour_season_stats(score_now)
+        print(f"Vectorized aggregation of data with shape {score_now.shape} took {timer() - t0:.2f}s.")
+
+        t0 = timer()
+        hourly = score_now.groupby("time.hour")
+        assert np.allclose(stats["hourly_mean"], hourly.mean()) and np.allclose(stats["hourly_std"], hourly.std())
+        for hh in range(24):
+            tmp = score_now.isel({"time": score_now.time.dt.hour == hh}).groupby("time.season")
+            assert np.allclose(stats["mean"].sel({"hour": hh}), tmp.mean()) and \
+                   np.allclose(stats["std"].sel({"hour": hh}), tmp.std()), f"Statistics differ at {hh:02d} UTC."
+        print(f"Aggregation with groupby took {timer() - t0:.2f}s.")
+
+    print("Vectorized aggregation agrees with groupby.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ntimes", "-ntimes", dest="ntimes", type=int, default=24*365, help="Number of time steps.")
+    parser.add_argument("--ny", "-ny", dest="ny", type=int, default=48, help="Number of grid points in y-direction.")
+    parser.add_argument("--nx", "-nx", dest="nx", type=int, default=64, help="Number of grid points in x-direction.")
+
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,139 @@
+# SPDX-FileCopyrightText: 2023 Earth System Data Exploration (ESDE), Jülich Supercomputing Center (JSC)
+#
+# SPDX-License-Identifier: MIT
+
+"""
+Regression test of the Python remapping (see remapping.py) against CDO's remapcon and remapbil on small synthetic grids.
+Requires CDO to be available (the comparison is skipped otherwise). The conversion of longitudes and the detection of
+destination grids that are not covered by the source grid are tested without CDO.
+"""
+
+__author__ = "agent"
+__email__ = "agent@local"
+__date__ = "2026-10-18"
+__update__ = "2026-10-18"
+
+import os
+import shutil
+import argparse
+import tempfile
+from collections import OrderedDict
+from timeit import default_timer as timer
+import numpy as np
+import pandas as pd
+import xarray as xr
+from abstract_preprocess import CDOGridDes
+from tools_utils import CDO
+from remapping import remap_dataset, get_grid_coords
+
+# source grid (similar to ERA5), coarse grid and target grid (similar to IFS HRES)
+gdes_src = {"gridtype": "lonlat", "xsize": 72, "ysize": 56, "xfirst": 1.0, "xinc": 0.25, "yfirst": 57.5,
+            "yinc": -0.25}
+gdes_coa = {"gridtype": "lonlat", "xsize": 16, "ysize": 12, "xfirst": 4.35, "xinc": 0.8, "yfirst": 54.15,
+            "yinc": -0.8}
+gdes_tar = {"gridtype": "lonlat", "xsize": 128, "ysize": 96, "xfirst": 4.0, "xinc": 0.1, "yfirst": 54.5,
+            "yinc": -0.1}
+
+
+def create_data(ntimes: int = 4) -> xr.Dataset:
+    lon, lat = get_grid_coords(gdes_src)
+    times = pd.date_range("2018-01-01 00:00", periods=ntimes, freq="H")
+    lon2d, lat2d = np.meshgrid(lon, lat)
+
+    rng = np.random.default_rng(42)
+    data = np.stack([280. + 10.*np.sin(np.deg2rad(8.*lon2d + it*10.))*np.cos(np.deg2rad(6.*lat2d)) +
+                     rng.normal(scale=0.5, size=lon2d.shape) for it in range(ntimes)]).astype("float32")
+
+    ds = xr.Dataset({"t": (("time", "lat", "lon"), data), "z": (("time", "lat", "lon"), data*10.)},
+                    coords={"time": times, "lat": lat, "lon": lon})
+    ds["lon"].attrs, ds["lat"].attrs = {"units": "degrees_east"}, {"units": "degrees_north"}
+
+    return ds
+
+
+def compare(ds_cdo: xr.Dataset, ds_py: xr.Dataset, varnames, tol: float):
+    lok = True
+    for var in varnames:
+        diff = np.abs(ds_cdo[var].values - ds_py[var].values)
+        rel_diff = np.nanmax(diff/np.abs(ds_cdo[var].values))
+        print(f"Variable {var}: max. abs. difference: {np.nanmax(diff):.3e}, max. rel. difference: {rel_diff:.3e}")
+        lok = lok and rel_diff < tol
+
+    return lok
+
+
+def check_grid_bounds():
+    ds = create_data(ntimes=1)
+    ds_ref = remap_dataset(ds, [gdes_tar], ["bil"])
+
+    # source data with longitudes in [0, 360) and target grid with longitudes in [-180, 180)
+    gdes_tar_180 = {**gdes_tar, "xfirst": gdes_tar["xfirst"] - 20.}
+    ds_shift = remap_dataset(ds.assign_coords({"lon": ds["lon"] + 340.}), [gdes_tar_180], ["bil"])
+    assert np.allclose(ds_shift["t"].values, ds_ref["t"].values), "Conversion of longitudes failed."
+
+    # target grid exceeding the source grid
+    for key, shift in [("xfirst", 3.), ("yfirst", 4.)]:
+        try:
+            remap_dataset(ds, [{**gdes_tar, key: gdes_tar[key] + shift}], ["bil"])
+        except ValueError:
+            continue
+        raise AssertionError(f"Remapping onto a grid exceeding the source grid ({key}) did not raise a ValueError.")
+
+    print("Conversion of longitudes and check of grid bounds are correct.")
+
+
+def main(parser_args):
+    check_grid_bounds()
+
+    if shutil.which("cdo") is None:
+        print("CDO is not available. Skip comparison with CDO.")
+        return
+
+    tmp_dir = tempfile.mkdtemp() if parser_args.tmp_dir is None else parser_args.tmp_dir
+    os.makedirs(tmp_dir, exist_ok=True)
+    cdo = CDO(tool_envs={"REMAP_EXTRAPOLATE": "on"})
+
+    fgdes_coa, fgdes_tar = os.path.join(tmp_dir, "coarsened_grid"), os.path.join(tmp_dir, "target_grid")
+    CDOGridDes(gdes_dict=gdes_tar).write_grid_des_from_dict(fgdes_tar)
+    CDOGridDes(gdes_dict=gdes_coa).write_grid_des_from_dict(fgdes_coa)
+
+    fsrc = os.path.join(tmp_dir, "remap_src.nc")
+    ds = create_data()
+    ds.to_netcdf(fsrc)
+
+    # CDO
+    fcoa_cdo, ftar_cdo = fsrc.replace(".nc", "_coa_cdo.nc"), fsrc.replace(".nc", "_tar_cdo.nc")
+    t0 = timer()
+    cdo.run([fsrc, fcoa_cdo], OrderedDict([("-remapcon", fgdes_coa)]))
+    cdo.run([fcoa_cdo, ftar_cdo], OrderedDict([("-remapbil", fgdes_tar)]))
+    print(f"Remapping with CDO took {timer() - t0:.3f}s.")
+
+    # Python (first call computes the weights, second call uses the cached weights)
+    for i in range(2):
+        t0 = timer()
+        ds_coa = remap_dataset(ds, [fgdes_coa], ["con"], weights_dir=tmp_dir)
+        ds_tar = remap_dataset(ds_coa, [fgdes_tar], ["bil"], weights_dir=tmp_dir)
+        print(f"Remapping in Python took {timer() - t0:.3f}s ({'with' if i > 0 else 'without'} cached weights).")
+
+    with xr.open_dataset(fcoa_cdo) as ds_coa_cdo, xr.open_dataset(ftar_cdo) as ds_tar_cdo:
+        print("Conservative remapping onto coarse grid:")
+        lok_coa = compare(ds_coa_cdo, ds_coa, ["t", "z"], parser_args.tol)
+        print("Bilinear remapping onto target grid:")
+        lok_tar = compare(ds_tar_cdo, ds_tar, ["t", "z"], parser_args.tol)
+
+    if parser_args.tmp_dir is None:
+        shutil.rmtree(tmp_dir)
+
+    assert lok_coa and lok_tar, f"Python remapping deviates from CDO by more than {parser_args.tol:.1e}."
+    print("Python remapping agrees with CDO.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tmp_dir", "-tmp_dir", dest="tmp_dir", type=str, default=None,
+                        help="Directory to write temporary files (default: temporary directory which is removed).")
+    parser.add_argument("--tolerance", "-tol", dest="tol", type=float, default=1.e-04,
+                        help="Tolerated maximum relative difference between CDO and Python remapping.")
+
+    args = parser.parse_args()
+    main(args)
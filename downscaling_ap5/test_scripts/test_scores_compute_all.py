@@ -0,0 +1,81 @@
+# SPDX-FileCopyrightText: 2023 Earth System Data Exploration (ESDE), Jülich Supercomputing Center (JSC)
+#
+# SPDX-License-Identifier: MIT
+
+"""
+Test of the single-pass evaluation (Scores.compute_all) against the individual score-functions of the Scores-class.
+Synthetic data on a regular lat/lon-grid is used and the run times of both approaches are compared.
+Furthermore, it is checked that lazily opened (dask-backed) data yields the same results.
+"""
+
+__author__ = "agent"
+__email__ = "agent@local"
+__date__ = "2026-10-18"
+__update__ = "2026-10-18"
+
+import argparse
+from timeit import default_timer as timer
+import numpy as np
+import pandas as pd
+import xarray as xr
+from statistical_evaluation import Scores
+
+
+def create_data(ntimes: int, ny: int, nx: int):
+    rng = np.random.default_rng(42)
+    coords = {"time": pd.date_range("2018-01-01", periods=ntimes, freq="H"),
+              "lat": np.linspace(45., 55., ny), "lon": np.linspace(5., 15., nx)}
+    ref = 280. + 10. * rng.normal(size=(ntimes, ny, nx))
+    fcst = ref + rng.normal(loc=0.2, size=(ntimes, ny, nx))
+    dims = list(coords.keys())
+
+    return xr.DataArray(fcst, coords=coords, dims=dims), xr.DataArray(ref, coords=coords, dims=dims)
+
+
+def main(parser_args):
+    fcst, ref = create_data(parser_args.ntimes, parser_args.ny, parser_args.nx)
+    metrics = ["mse", "rmse", "bias", "psnr", "grad_amplitude"]
+    reductions = {"dom": ["lat", "lon"], "map": ["time"], "all": ["time", "lat", "lon"]}
+
+    t0 = timer()
+    ds_scores = Scores(fcst, ref, None).compute_all(metrics, reduce_dims=reductions, chunk_size=parser_args.chunk_size,
+                                                    pixel_max=300.)
+    print(f"Single-pass evaluation took {timer() - t0:.2f}s.")
+
+    t0 = timer()
+    for red, dims in reductions.items():
+        score_engine = Scores(fcst, ref, dims)
+        for metric in metrics:
+            if metric == "grad_amplitude":
+                ref_score = score_engine(metric, non_spatial_avg_dims=[dim for dim in dims if dim == "time"] or None)
+            else:
+                ref_score = score_engine(metric, pixel_max=300.)
+            assert np.allclose(ds_scores[f"{metric}_{red}"], ref_score), \
+                f"Metric {metric} with reduction '{red}' deviates from the score-function."
+    print(f"Evaluation with the score-functions took {timer() - t0:.2f}s.")
+
+    # out-of-core evaluation with time-chunked dask-arrays
+    t0 = timer()
+    chunks = {"time": parser_args.chunk_size}
+    ds_scores_lazy = Scores(fcst.chunk(chunks), ref.chunk(chunks), None)\
+        .compute_all(metrics, reduce_dims={**reductions, "none": []}, chunk_size=parser_args.chunk_size,
+                     scheduler=parser_args.scheduler, pixel_max=300.)
+    print(f"Single-pass evaluation of dask-backed data took {timer() - t0:.2f}s.")
+    for var in ds_scores.data_vars:
+        assert np.allclose(ds_scores_lazy[var], ds_scores[var]), f"{var} of dask-backed data deviates."
+    assert np.allclose(ds_scores_lazy["bias_none"].compute(), fcst - ref), "Lazy bias deviates."
+    print("Single-pass evaluation agrees with the score-functions.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ntimes", "-ntimes", dest="ntimes", type=int, default=500, help="Number of time steps.")
+    parser.add_argument("--ny", "-ny", dest="ny", type=int, default=96, help="Number of grid points in y-direction.")
+    parser.add_argument("--nx", "-nx", dest="nx", type=int, default=128, help="Number of grid points in x-direction.")
+    parser.add_argument("--chunk_size", "-chunk_size", dest="chunk_size", type=int, default=128,
+                        help="Number of samples per chunk.")
+    parser.add_argument("--scheduler", "-scheduler", dest="scheduler", type=str, default="threads",
+                        choices=["threads", "processes", "synchronous"], help="Local dask-scheduler.")
+
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,81 @@
+# SPDX-FileCopyrightText: 2023 Earth System Data Exploration (ESDE), Jülich Supercomputing Center (JSC)
+#
+# SPDX-License-Identifier: MIT
+
+"""
+Test of the streaming inference (see stream_inference in inference_utils.py) with the chunk-wise denormalization of
+main_postprocess.py. The number of samples is chosen such that the last chunk comprises a single sample only.
+A perfect model (returning the normalized target) is used, i.e. the streamed prediction must reproduce the target data.
+"""
+
+__author__ = "agent"
+__email__ = "agent@local"
+__date__ = "2026-10-18"
+__update__ = "2026-10-18"
+
+import os
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+import xarray as xr
+from handle_data_class import HandleDataClass
+from all_normalizations import ZScore
+from inference_utils import stream_inference
+from main_postprocess import get_input_data, denormalize_prediction, get_output_ds
+
+
+def main(parser_args):
+    rng = np.random.default_rng(42)
+    ntimes = 3 * parser_args.chunk_size + 1
+    coords = {"time": pd.date_range("2018-01-01", periods=ntimes, freq="H"),
+              "rlat": np.arange(parser_args.ny), "rlon": np.arange(parser_args.nx)}
+    dims = list(coords.keys())
+    ds = xr.Dataset({var: (dims, mu + sigma * rng.normal(size=(ntimes, parser_args.ny, parser_args.nx)))
+                     for var, mu, sigma in [("t2m_in", 280., 8.), ("z_in", 5.e+04, 100.), ("t2m_tar", 281., 9.)]},
+                    coords=coords)
+    predictands, tar_varname = ["t2m_tar"], "t2m_tar"
+
+    norm = ZScore(["time", "rlat", "rlon"])
+    _ = norm.normalize(ds)
+
+    def process_chunk(ds_chunk: xr.Dataset) -> xr.Dataset:
+        da_chunk = HandleDataClass.reshape_ds(norm.normalize(ds_chunk).astype("float32", copy=False))
+        data_chunk_in = get_input_data(da_chunk, predictands)
+        _, da_chunk_tar = HandleDataClass.split_in_tar(da_chunk, predictands=predictands)
+        assert data_chunk_in.shape[0] == da_chunk_tar.sizes["time"]
+        # perfect model
+        y_pred_chunk = da_chunk_tar.transpose("time", ..., "variables").values
+
+        y_pred_chunk = denormalize_prediction(y_pred_chunk, da_chunk_tar, norm, tar_varname)
+        assert y_pred_chunk.dims == ("time", "rlat", "rlon"), f"Unexpected dimensions {y_pred_chunk.dims}."
+
+        return get_output_ds(y_pred_chunk, ds_chunk[tar_varname].astype("float32", copy=False), tar_varname)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        fname_in = os.path.join(tmp_dir, "test_data.nc")
+        ds.to_netcdf(fname_in)
+        for suffix in ["nc", "zarr"] if parser_args.lzarr else ["nc"]:
+            fname_out = os.path.join(tmp_dir, f"postprocessed_ds_test.{suffix}")
+            stream_inference(fname_in, fname_out, process_chunk, parser_args.chunk_size)
+
+            ds_out = xr.open_zarr(fname_out) if suffix == "zarr" else xr.open_dataset(fname_out)
+            assert ds_out.sizes["time"] == ntimes, f"Expected {ntimes:d} time steps, got {ds_out.sizes['time']:d}."
+            assert np.allclose(ds_out[f"{tar_varname}_fcst"], ds[tar_varname], rtol=1.e-05), \
+                f"Streamed prediction deviates from the target data ({suffix})."
+            ds_out.close()
+
+    print("Streaming inference reproduces the target data including the remainder chunk with a single sample.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ny", "-ny", dest="ny", type=int, default=48, help="Number of grid points in y-direction.")
+    parser.add_argument("--nx", "-nx", dest="nx", type=int, default=64, help="Number of grid points in x-direction.")
+    parser.add_argument("--chunk_size", "-chunk_size", dest="chunk_size", type=int, default=25,
+                        help="Number of samples per chunk.")
+    parser.add_argument("--zarr", "-zarr", dest="lzarr", default=False, action="store_true",
+                        help="Flag to additionally test writing to a Zarr-store.")
+
+    args = parser.parse_args()
+    main(args)
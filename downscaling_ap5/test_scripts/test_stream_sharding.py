@@ -0,0 +1,111 @@
+# SPDX-FileCopyrightText: 2023 Earth System Data Exploration (ESDE), Jülich Supercomputing Center (JSC)
+#
+# SPDX-License-Identifier: MIT
+
+"""
+Test of the rank-aware data sharding in StreamMonthlyNetCDF. Synthetic monthly netCDF-files with varying number of
+samples are streamed by world_size local processes. It is checked that the data subsets of the ranks are disjoint
+within each epoch, that all ranks provide the same number of mini-batches per epoch and that all ranks use the same
+normalization parameters (computed by rank 0 and shared via the cache-file).
+"""
+
+__author__ = "agent"
+__email__ = "agent@local"
+__date__ = "2026-10-18"
+__update__ = "2026-10-18"
+
+import os
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+import numpy as np
+import pandas as pd
+import xarray as xr
+from handle_data_class import StreamMonthlyNetCDF
+
+predictors, predictands = ["t2m_in", "z_in"], ["t2m_tar"]
+
+
+def create_data(data_dir: str, nfiles: int, nx: int = 16, ny: int = 12):
+    rng = np.random.default_rng(42)
+    for month in range(nfiles):
+        times = pd.date_range(f"2018-{month % 12 + 1:02d}-01", periods=rng.integers(20, 32), freq="D")
+        ds = xr.Dataset({var: (("time", "lat", "lon"), rng.normal(size=(len(times), ny, nx)).astype("float32"))
+                         for var in predictors + predictands},
+                        coords={"time": times, "lat": np.arange(ny, dtype="float32"),
+                                "lon": np.arange(nx, dtype="float32")})
+        ds.to_netcdf(os.path.join(data_dir, f"data_{month + 1:03d}.nc"))
+
+
+def run_rank(rank: int, world_size: int, parser_args, norm_cache: str, results):
+    ds_obj = StreamMonthlyNetCDF(parser_args.data_dir, "data_*.nc", parser_args.nfiles_merge, predictands,
+                                 selected_predictors=predictors, norm_dims=["time", "lat", "lon"], nworkers=2,
+                                 norm_cache=norm_cache, rank=rank, world_size=world_size)
+    ds_obj.set_subset_plan(parser_args.batch_size, parser_args.nepochs)
+    # check that the data subsets can be loaded
+    nsamples_subset = ds_obj.load_subset(0).shape[0]
+    ds_obj.pool.close()
+
+    results.put((rank, {"plan": ds_obj.subset_plan, "nbatches_epoch": ds_obj.nbatches_epoch,
+                        "nsamples_subset": nsamples_subset,
+                        "mu": ds_obj.norm_params[0].to_array().values,
+                        "sigma": ds_obj.norm_params[1].to_array().values}))
+
+
+def main(parser_args):
+    tmp_dir = tempfile.mkdtemp()
+    if parser_args.data_dir is None:
+        parser_args.data_dir = tmp_dir
+        create_data(tmp_dir, parser_args.nfiles)
+    norm_cache = os.path.join(tmp_dir, "norm_cache.json")
+    world_size = parser_args.world_size
+
+    results = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=run_rank, args=(rank, world_size, parser_args, norm_cache, results))
+             for rank in range(world_size)]
+    for proc in procs:
+        proc.start()
+    res = dict(results.get() for _ in procs)
+    for proc in procs:
+        proc.join()
+    shutil.rmtree(tmp_dir)
+
+    nsubsets = len(res[0]["plan"]) // parser_args.nepochs
+    nbatches = [res[rank]["nbatches_epoch"] for rank in range(world_size)]
+    print(f"Mini-batches per epoch on ranks: {nbatches}")
+    assert len(set(nbatches)) == 1, "Number of mini-batches per epoch differs between ranks."
+
+    for epoch in range(parser_args.nepochs):
+        files_epoch = []
+        for rank in range(world_size):
+            plan_epoch = res[rank]["plan"][epoch * nsubsets: (epoch + 1) * nsubsets]
+            assert sum(subset["nbatches"] for subset in plan_epoch) == nbatches[0], \
+                f"Budget of mini-batches on rank {rank:d} does not match in epoch {epoch:d}."
+            files_epoch += [f for subset in plan_epoch for f in subset["files"]]
+        assert len(files_epoch) == len(set(files_epoch)), f"Data subsets of ranks overlap in epoch {epoch:d}."
+
+    for rank in range(1, world_size):
+        assert np.allclose(res[rank]["mu"], res[0]["mu"]) and np.allclose(res[rank]["sigma"], res[0]["sigma"]), \
+            f"Normalization parameters of rank {rank:d} differ from rank 0."
+
+    print("Data subsets are disjoint and balanced across ranks.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data_dir", "-data_dir", dest="data_dir", type=str, default=None,
+                        help="Directory with netCDF-files 'data_*.nc' (default: synthetic data).")
+    parser.add_argument("--world_size", "-world_size", dest="world_size", type=int, default=2,
+                        help="Number of local processes.")
+    parser.add_argument("--nfiles", "-nfiles", dest="nfiles", type=int, default=12,
+                        help="Number of synthetic files.")
+    parser.add_argument("--nfiles_merge", "-nfiles_merge", dest="nfiles_merge", type=int, default=2,
+                        help="Number of files per data subset.")
+    parser.add_argument("--batch_size", "-batch_size", dest="batch_size", type=int, default=8,
+                        help="Mini-batch size.")
+    parser.add_argument("--nepochs", "-nepochs", dest="nepochs", type=int, default=3,
+                        help="Number of epochs.")
+
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,81 @@
+# SPDX-FileCopyrightText: 2023 Earth System Data Exploration (ESDE), Jülich Supercomputing Center (JSC)
+#
+# SPDX-License-Identifier: MIT
+
+"""
+Test of the tiled inference (see inference_utils.py) against inference on whole fields. A U-Net (sha_unet) with random
+weights is applied to smooth synthetic data. Since the receptive field of the U-Net exceeds the overlap of the tiles,
+the results are not identical, but should agree within a tolerance in the interior of the domain.
+"""
+
+__author__ = "agent"
+__email__ = "agent@local"
+__date__ = "2026-10-18"
+__update__ = "2026-10-18"
+
+import argparse
+from timeit import default_timer as timer
+import numpy as np
+import tensorflow as tf
+from unet_model import sha_unet
+from inference_utils import predict_tiled
+from other_utils import get_max_memory_usage
+
+
+def create_data(nsamples: int, ny: int, nx: int, nchannels: int) -> np.ndarray:
+    y, x = np.meshgrid(np.linspace(0., 4. * np.pi, ny), np.linspace(0., 6. * np.pi, nx), indexing="ij")
+    data = np.stack([np.stack([np.sin(x + 0.3 * it + ic) * np.cos(y - 0.2 * ic) for ic in range(nchannels)], axis=-1)
+                     for it in range(nsamples)])
+
+    return data.astype("float32")
+
+
+def main(parser_args):
+    tf.random.set_seed(42)
+    data_in = create_data(parser_args.nsamples, parser_args.ny, parser_args.nx, parser_args.nchannels)
+    model = sha_unet((None, None, parser_args.nchannels), 1, channels_start=parser_args.ngf)
+
+    t0 = timer()
+    y_full = model.predict(data_in, batch_size=parser_args.batch_size)
+    print(f"Inference on whole fields took {timer() - t0:.2f}s.")
+
+    t0 = timer()
+    y_tiled = predict_tiled(model, data_in, parser_args.tile_size, parser_args.tile_overlap,
+                            batch_size=parser_args.batch_size, window=parser_args.blend_window)
+    print(f"Tiled inference took {timer() - t0:.2f}s (peak RSS: {get_max_memory_usage() / 1.e+09:.2f} GB).")
+
+    # exclude the margin of the domain where both approaches are affected by padding
+    my, mx = parser_args.margin
+    diff = np.abs(y_full - y_tiled)[:, my:-my or None, mx:-mx or None]
+    rel_diff = np.mean(diff) / np.std(y_full)
+    print(f"Interior: max. abs. difference: {np.max(diff):.3e}, mean abs. difference relative to std. dev.: " +
+          f"{rel_diff:.3e}")
+
+    assert rel_diff < parser_args.tol, f"Tiled inference deviates by more than {parser_args.tol:.1e} " + \
+                                       "from inference on whole fields."
+    print("Tiled inference agrees with inference on whole fields.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nsamples", "-nsamples", dest="nsamples", type=int, default=4, help="Number of samples.")
+    parser.add_argument("--ny", "-ny", dest="ny", type=int, default=192, help="Number of grid points in y-direction.")
+    parser.add_argument("--nx", "-nx", dest="nx", type=int, default=256, help="Number of grid points in x-direction.")
+    parser.add_argument("--nchannels", "-nchannels", dest="nchannels", type=int, default=3,
+                        help="Number of input channels.")
+    parser.add_argument("--ngf", "-ngf", dest="ngf", type=int, default=16, help="Number of channels in first layer.")
+    parser.add_argument("--tile_size", "-tile_size", dest="tile_size", type=int, nargs=2, default=[96, 96],
+                        help="Tile size (ny, nx).")
+    parser.add_argument("--tile_overlap", "-tile_overlap", dest="tile_overlap", type=int, nargs=2, default=[32, 32],
+                        help="Overlap (ny, nx) of neighbouring tiles.")
+    parser.add_argument("--blend_window", "-blend_window", dest="blend_window", type=str, default="hann",
+                        choices=["hann", "linear", "uniform"], help="Blending window.")
+    parser.add_argument("--batch_size", "-batch_size", dest="batch_size", type=int, default=8,
+                        help="Mini-batch size.")
+    parser.add_argument("--margin", "-margin", dest="margin", type=int, nargs=2, default=[8, 8],
+                        help="Margin (ny, nx) at the domain edges which is excluded from the comparison.")
+    parser.add_argument("--tolerance", "-tol", dest="tol", type=float, default=5.e-02,
+                        help="Tolerated mean absolute difference relative to the standard deviation of the output.")
+
+    args = parser.parse_args()
+    main(args)
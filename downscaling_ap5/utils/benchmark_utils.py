@@ -1,14 +1,17 @@
 __author__ = "Michael Langguth"
 __email__ = "m.langguth@fz-juelich.de"
 __date__ = "2022-01-24"
-__update__ = "2022-01-24"
+__update__ = "2026-10-18"
 
 import os
 import json
+from typing import List
 from collections import OrderedDict
+from timeit import default_timer as timer
 import numpy as np
 import pandas as pd
-from handle_data_class import HandleDataClass
+import xarray as xr
+from handle_data_class import HandleDataClass, StreamMonthlyNetCDF
 
 
 class BenchmarkCSV(object):
@@ -24,7 +27,10 @@ class BenchmarkCSV(object):
                      "Avg. training time per epoch", "First epoch training time",
                      "Min. training time per epoch", "Max. training time per epoch",
                      "Avg. training time per iteration", "Final training loss", "Final validation loss",
-                     "Saving model time", "Node ID", "Max. GPU power", "GPU energy consumption"]
+                     "Saving model time", "Node ID", "Max. GPU power", "GPU energy consumption",
+                     "Samples per second", "Peak RSS [GB]"]
+    # columns added later, CSV-files without these columns are extended
+    added_cols = ["Samples per second", "Peak RSS [GB]"]
 
     def __init__(self, csvfile: str):
         """
@@ -51,10 +57,15 @@ class BenchmarkCSV(object):
         """
         Write benchmark dictionary to csv-file. Either append an existing one or create it.
         :param benchmark_dict: the dictionary whose keys must provide all elements listed in 'expected_cols'.
+                               The columns listed in 'added_cols' are optional and set to NaN if missing.
         :return: Updated/created csv-file on disk
         """
         
         benchmark_dict[BenchmarkCSV.expected_cols[0]] = self.exp_number
+        dict_keys_l = [key.lower() for key in benchmark_dict.keys()]
+        for col in BenchmarkCSV.added_cols:
+            if col.lower() not in dict_keys_l:
+                benchmark_dict[col] = np.nan
         dict_keys = benchmark_dict.keys()
 
         _ = BenchmarkCSV.check_collist(dict_keys, ignore_case=True)
@@ -90,8 +101,15 @@ class BenchmarkCSV(object):
                 print("%{0}: Unable to open existing csv-file ''. Inspect error-message.".format(method, csvfile))
                 raise err
 
-            # check if expected columns are present
+            # check if expected columns are present (CSV-files from earlier versions are extended by added columns)
             columns = list(data.columns)
+            miss_cols = [col for col in BenchmarkCSV.added_cols if col not in columns]
+            if miss_cols:
+                print("%{0}: Extend existing csv-file '{1}' by columns {2}.".format(method, csvfile,
+                                                                                    ", ".join(miss_cols)))
+                data = data.reindex(columns=columns + miss_cols)
+                data.to_csv(csvfile, index=False)
+                columns = list(data.columns)
             _ = BenchmarkCSV.check_collist(columns)
 
             mode = "a"
@@ -169,14 +187,47 @@ def write_dataset_info(data_obj: HandleDataClass, nsamples: int, shape_sample: t
             print(data_old)
 
 
-
-
-
-
-
-
-
-
-
-
-
+def benchmark_batch_gathering(ds: xr.Dataset, batch_size: int, var_list: List, var_tar2in: str = None,
+                              nbatches: int = 100, sample_dim: str = "time", seed: int = 42):
+    """
+    Micro-benchmark to compare the throughput of mini-batch gathering in StreamMonthlyNetCDF.getitems.
+    The former xarray-based path (see StreamMonthlyNetCDF.getitems_xr) is compared against
+    the fancy-indexing on a contiguous data block (see StreamMonthlyNetCDF.ds_to_block).
+    :param ds: (normalized) dataset which is loaded into memory
+    :param batch_size: size of mini-batches
+    :param var_list: list of variables to gather (predictors and predictands)
+    :param var_tar2in: name of target variable to be added to input
+    :param nbatches: number of mini-batches to gather with each method
+    :param sample_dim: name of sample dimension
+    :param seed: seed for drawing random sample indices
+    :return: dictionary with throughput in batches per second for both methods
+    """
+    ds = ds[var_list].astype("float32").load()
+    nsamples = ds.dims[sample_dim]
+    rng = np.random.default_rng(seed)
+    batch_inds = [rng.choice(nsamples, batch_size, replace=False) for _ in range(nbatches)]
+
+    # legacy path
+    t0 = timer()
+    for inds in batch_inds:
+        _ = StreamMonthlyNetCDF.getitems_xr(ds, inds, var_tar2in, sample_dim).values
+    t_xr = timer() - t0
+
+    # gathering from contiguous data block (conversion is done once per data subset and thus not timed)
+    block_vars = [var_tar2in] + list(var_list) if var_tar2in is not None else list(var_list)
+    data_block = StreamMonthlyNetCDF.ds_to_block(ds, block_vars, sample_dim)
+    t0 = timer()
+    for inds in batch_inds:
+        _ = np.take(data_block, inds, axis=0)
+    t_np = timer() - t0
+
+    # gathering all batches at once
+    t0 = timer()
+    _ = np.take(data_block, np.stack(batch_inds), axis=0)
+    t_np_vec = timer() - t0
+
+    bm_dict = {"xarray [batches/s]": nbatches / t_xr, "numpy [batches/s]": nbatches / t_np,
+               "numpy vectorized [batches/s]": nbatches / t_np_vec}
+    print(", ".join([f"{key}: {val:.1f}" for key, val in bm_dict.items()]))
+
+    return bm_dict
@@ -17,6 +17,7 @@ Some auxiliary functions for the project:
     * remove_files
     * check_str_in_list
     * find_closest_divisor
+    * get_np_dtype
     * free_mem
     * print_gpu_usage
     * print_cpu_usage
@@ -29,7 +30,7 @@ Some auxiliary functions for the project:
 __author__ = "Michael Langguth"
 __email__ = "m.langguth@fz-juelich.de"
 __date__ = "2022-01-20"
-__update__ = "2023-03-17"
+__update__ = "2026-10-18"
 
 import os
 import gc
@@ -275,6 +276,22 @@ def find_closest_divisor(n1, div):
         return all_divs[i]
 
 
+def get_np_dtype(dtype_name: str):
+    """
+    Get numpy data type from its name. Besides the native numpy data types, bfloat16 is supported
+    (via the numpy extension type provided by TensorFlow).
+    :param dtype_name: name of data type, e.g. 'float32', 'float16' or 'bfloat16'
+    :return: numpy data type
+    """
+    if str(dtype_name) == "bfloat16":
+        return np.dtype(tf.bfloat16.as_numpy_dtype)
+
+    try:
+        return np.dtype(dtype_name)
+    except TypeError:
+        raise ValueError(f"Unknown data type '{dtype_name}'.")
+
+
 def free_mem(var_list: List):
     """
     Delete all variables in var_list and release memory
@@ -1,6 +1,6 @@
 # ********** Info **********
 # @Creation: 2021-07-28
-# @Update: 2021-07-28
+# @Update: 2023-05-22
 # @Author: Michael Langguth
 # @Site: Juelich supercomputing Centre (JSC) @ FZJ
 # @File: tfrecords_utils.py
@@ -11,20 +11,30 @@ import glob
 import subprocess as sp
 import sys
 import datetime as dt
+from functools import partial
+from typing import List
+import multiprocessing
 import numpy as np
 import xarray as xr
 import pandas as pd
 import json as js
 import tensorflow as tf
-from helper_utils import ensure_datetime, extract_date, subset_files_on_date
+from other_utils import ensure_datetime, extract_date, subset_files_on_date
 
 
 class IFS2TFRecords(object):
     class_name = "IFS2TFRecords"
 
     date_fmt = "%Y-%m-%dT%H:%M"
+    allowed_compressions = ("", "GZIP", "ZLIB")
 
-    def __init__(self, tfr_dir: str, example_nc_file: str, create_tfr_dir: bool = True):
+    def __init__(self, tfr_dir: str, example_nc_file: str, create_tfr_dir: bool = True, meta_dict: dict = None):
+        """
+        :param tfr_dir: directory where TFRecord-files are stored
+        :param example_nc_file: netCDF-file from which the metadata is retrieved
+        :param create_tfr_dir: flag to create tfr_dir if it is not existing
+        :param meta_dict: metadata dictionary (e.g. read from metadata.json) to use instead of example_nc_file
+        """
 
         method = "%{0}->{1}".format(IFS2TFRecords.class_name, IFS2TFRecords.__init__.__name__)
         self.tfr_dir = tfr_dir
@@ -39,7 +49,8 @@ class IFS2TFRecords(object):
                 raise NotADirectoryError("%{0}: TFRecords-directory does not exist.".format(method) +
                                          "Either create it manually or set create_tfr_dir to True.")
 
-        meta_dict = self.get_and_write_metadata()
+        if meta_dict is None:
+            meta_dict = self.get_and_write_metadata()
         self.variables = meta_dict["coordinates"]["variable"]
         self.data_dim = (meta_dict["shape"]["nvars"], meta_dict["shape"]["nlat"], meta_dict["shape"]["nlon"])
 
@@ -67,26 +78,85 @@ class IFS2TFRecords(object):
 
         return meta_dict
 
-    def get_data_from_file(self, fname):
-
+    def get_data_from_file(self, fname, compression: str = ""):
+        """
+        Get dataset of (channel last) data arrays from a single TFRecord-file.
+        :param fname: name of TFRecord-file (under self.tfr_dir)
+        :param compression: compression type of the TFRecord-file ("", "GZIP" or "ZLIB")
+        :return: TF dataset yielding data arrays with shape (nlat, nlon, nvars)
+        """
         method = IFS2TFRecords.get_data_from_file.__name__
 
         suffix_tfr = ".tfrecords"
-        tfr_file = os.path.join(self.tfr_dir, fname+".tfrecords" if fname.endswith(suffix_tfr) else fname)
+        tfr_file = os.path.join(self.tfr_dir, fname if fname.endswith(suffix_tfr) else fname + suffix_tfr)
 
         if not os.path.isfile(tfr_file):
             raise FileNotFoundError("%{0}: TFRecord-file '{1}' does not exist.".format(method, tfr_file))
 
-        data = tf.data.TFRecordDataset(tfr_file)
+        data = tf.data.TFRecordDataset(tfr_file, compression_type=compression)
 
-        data = data.map(IFS2TFRecords.parse_one_data_arr)
+        data = data.map(partial(IFS2TFRecords.parse_example, data_dim=self.data_dim))
 
         return data
 
-    def write_monthly_data_to_tfr(self, dir_in, hour=None, patt="*.nc"):
+    def get_dataset(self, patt: str = "*.tfrecords", compression: str = "", lshuffle: bool = True,
+                    cycle_length: int = 8, seed: int = None):
+        """
+        Get dataset from all TFRecord-files matching the pattern. Files are read interleaved and the examples are
+        parsed in parallel.
+        :param patt: filename pattern of TFRecord-files (under self.tfr_dir)
+        :param compression: compression type of the TFRecord-files ("", "GZIP" or "ZLIB")
+        :param lshuffle: flag to shuffle the order of the files (in each iteration)
+        :param cycle_length: number of files that are read concurrently
+        :param seed: seed for shuffling the files
+        :return: TF dataset yielding data arrays with shape (nlat, nlon, nvars)
+        """
+        method = IFS2TFRecords.get_dataset.__name__
+
+        tfr_files = sorted(glob.glob(os.path.join(self.tfr_dir, patt)))
+        if not tfr_files:
+            raise FileNotFoundError("%{0}: Could not find any TFRecord-files with pattern '{1}' under '{2}'."
+                                    .format(method, patt, self.tfr_dir))
+
+        files = tf.data.Dataset.from_tensor_slices(tfr_files)
+        if lshuffle:
+            files = files.shuffle(len(tfr_files), seed=seed, reshuffle_each_iteration=True)
+
+        data = files.interleave(lambda f: tf.data.TFRecordDataset(f, compression_type=compression),
+                                cycle_length=min(cycle_length, len(tfr_files)), num_parallel_calls=tf.data.AUTOTUNE,
+                                deterministic=not lshuffle)
+        data = data.map(partial(IFS2TFRecords.parse_example, data_dim=self.data_dim),
+                        num_parallel_calls=tf.data.AUTOTUNE)
+
+        return data
+
+    def get_nsamples(self, patt: str = "*.tfrecords"):
+        """
+        Get the number of examples in all TFRecord-files matching the pattern from the JSON-files written alongside.
+        :param patt: filename pattern of TFRecord-files (under self.tfr_dir)
+        :return: number of examples
+        """
+        nsamples = 0
+        for tfr_file in glob.glob(os.path.join(self.tfr_dir, patt)):
+            with open(tfr_file + ".json", "r") as js_file:
+                nsamples += js.load(js_file)["nsamples"]
+
+        return nsamples
+
+    def write_monthly_data_to_tfr(self, dir_in, hour=None, patt="*.nc", nshards: int = 4, compression: str = "",
+                                  nworkers: int = None):
         """
         Use dates=pd.date_range(start_date, end_date, freq="M", normalize=True)
         and then dates_red = dates[dates.quarter.isin([2,3])] for generating year_months
+        The netCDF-files are distributed over nshards TFRecord-files which are written in parallel.
+        Each netCDF-file is read separately, i.e. the data of the whole month is never loaded at once.
+        :param dir_in: directory where netCDF-files of one month are located
+        :param hour: hour of the day for which data should be written (default: None, i.e. all hours)
+        :param patt: filename pattern of netCDF-files
+        :param nshards: number of TFRecord-files (shards) per month
+        :param compression: compression type of the TFRecord-files ("", "GZIP" or "ZLIB")
+        :param nworkers: number of worker processes (default: nshards)
+        :return: list of written TFRecord-files
         """
 
         method = "%{0}->{1}".format(IFS2TFRecords.class_name, IFS2TFRecords.write_monthly_data_to_tfr.__name__)
@@ -94,6 +164,10 @@ class IFS2TFRecords(object):
         if not os.path.isdir(dir_in):
             raise NotADirectoryError("%{0}: Passed directory '{1}' does not exist.".format(method, dir_in))
 
+        if compression not in IFS2TFRecords.allowed_compressions:
+            raise ValueError("%{0}: Unknown compression type '{1}'. Allowed types are {2}."
+                             .format(method, compression, ", ".join(IFS2TFRecords.allowed_compressions)))
+
         nc_files = sorted(glob.glob(os.path.join(dir_in, patt)))
 
         if not nc_files:
@@ -103,38 +177,81 @@ class IFS2TFRecords(object):
             pass
         else:
             nc_files = subset_files_on_date(nc_files, int(hour))
-        # create temprorary working directory to merge netCDF-files into a single one
-        #tmp_dir = os.path.join(dir_in, os.path.basename(dir_in) + "_subset")
-        #os.mkdir(tmp_dir)
-        #for nc_file in nc_files:
-        #    os.symlink(nc_file, os.path.join(tmp_dir, os.path.basename(nc_file)))
 
-        #dest_file = os.path.join(tmp_dir, "merged_data.nc")
-        #cmd = "cdo mergetime ${0}/*.nc ${1}".format(tmp_dir, dest_file)
+        nshards = min(nshards, len(nc_files))
+        # contiguous chunks of files per shard
+        file_chunks = [list(chunk) for chunk in np.array_split(nc_files, nshards)]
+
+        with xr.open_dataset(nc_files[0]) as ds:
+            date_start = ensure_datetime(ds["time"][0].values)
+        with xr.open_dataset(nc_files[-1]) as ds:
+            date_end = ensure_datetime(ds["time"][-1].values)
 
-        #_ = sp.check_output(cmd, shell=True)
+        date_fmt = "%Y%m%d%H"
+        fname_base = "ifs_data_{0}_{1}".format(date_start.strftime(date_fmt), date_end.strftime(date_fmt))
+        tfr_files = [os.path.join(self.tfr_dir, "{0}_{1:03d}-of-{2:03d}.tfrecords".format(fname_base, i, nshards))
+                     for i in range(nshards)]
+
+        func_write = partial(IFS2TFRecords.write_files_to_tfr, variables=self.variables, data_dim=self.data_dim,
+                             compression=compression)
+        nworkers = nshards if nworkers is None else nworkers
+        if nworkers > 1:
+            # spawn is used to avoid forking an initialized TensorFlow runtime
+            with multiprocessing.get_context("spawn").Pool(min(nworkers, nshards)) as pool:
+                nsamples = pool.starmap(func_write, zip(file_chunks, tfr_files))
+        else:
+            nsamples = [func_write(files, tfr_file) for files, tfr_file in zip(file_chunks, tfr_files)]
+
+        print("%{0}: Wrote {1:d} elements to {2:d} TFRecord-files under '{3}'.".format(method, sum(nsamples), nshards,
+                                                                                        self.tfr_dir))
+
+        return tfr_files
+
+    @staticmethod
+    def write_files_to_tfr(nc_files: List, tfr_file: str, variables: List, data_dim: tuple, compression: str = ""):
+        """
+        Write the data of a list of netCDF-files to one TFRecord-file (one example per time step). The number of
+        written examples is stored in a JSON-file alongside (<tfr_file>.json).
+        :param nc_files: list of netCDF-files
+        :param tfr_file: name of TFRecord-file to be created
+        :param variables: expected list of variables
+        :param data_dim: expected shape of data, i.e. (nvars, nlat, nlon)
+        :param compression: compression type of the TFRecord-file ("", "GZIP" or "ZLIB")
+        :return: number of written examples
+        """
+        method = IFS2TFRecords.write_files_to_tfr.__name__
 
+        nsamples = 0
+        options = tf.io.TFRecordOptions(compression_type=compression)
         try:
-            with xr.open_mfdataset(nc_files) as dataset:
-                print("%{0}: Opening netCDF-files from directory '{1}'...".format(method, dir_in))
-                data_arr_all = dataset.to_array()
-                data_arr_all = data_arr_all.transpose("time", "variable", ...)
+            with tf.io.TFRecordWriter(tfr_file, options=options) as tfr_writer:
+                for nc_file in nc_files:
+                    with xr.open_dataset(nc_file) as ds:
+                        data_arr = ds.to_array().transpose("time", "variable", ...).astype("float32").load()
+
+                    dims2check = data_arr.isel(time=0).squeeze().shape
+                    vars2check = list(data_arr["variable"].values)
+                    assert dims2check == tuple(data_dim), \
+                        "%{0}: Shape of data from netCDF-file {1} does not match expected shape {2}" \
+                        .format(method, dims2check, data_dim)
+                    assert vars2check == list(variables), "%{0} Unexpected set of variables {1}"\
+                        .format(method, ",".join(vars2check))
+
+                    for itime in range(len(data_arr["time"])):
+                        out = IFS2TFRecords.parse_one_data_arr(data_arr.isel(time=itime))
+                        tfr_writer.write(out.SerializeToString())
+                        nsamples += 1
         except Exception as err:
-            print("%{0}: Failed to open netCDF-files from directory '{1}'.".format(method, dir_in))
+            print("%{0}: Failed to write data to TFRecord-file '{1}'. See error below.".format(method, tfr_file))
             raise err
 
-        dims2check = data_arr_all.isel(time=0).squeeze().shape
-        vars2check = list(data_arr_all["variable"].values)
-        assert dims2check == self.data_dim, \
-               "%{0}: Shape of data from netCDF-file list {1} does not match expected shape {2}"\
-               .format(method, dims2check, self.data_dim)
+        with open(tfr_file + ".json", "w") as js_file:
+            js.dump({"nsamples": nsamples, "source_files": [os.path.basename(f) for f in nc_files]}, js_file)
 
-        assert vars2check == self.variables, "%{0} Unexpected set of varibales {1}".format(method, ",".join(vars2check))
-
-        IFS2TFRecords.write_dataset_to_tfr(data_arr_all, self.tfr_dir)
+        return nsamples
 
     @staticmethod
-    def write_dataset_to_tfr(data_arr: xr.DataArray, dirout:str):
+    def write_dataset_to_tfr(data_arr: xr.DataArray, dirout: str, compression: str = ""):
 
         method = IFS2TFRecords.write_dataset_to_tfr.__name__
 
@@ -152,11 +269,15 @@ class IFS2TFRecords(object):
             tfr_file = os.path.join(dirout, "ifs_data_{0}_{1}.tfrecords".format(date_start.strftime(date_fmt),
                                                                                 date_end.strftime(date_fmt)))
 
-            with tf.io.TFRecordWriter(tfr_file) as tfr_writer:
+            options = tf.io.TFRecordOptions(compression_type=compression)
+            with tf.io.TFRecordWriter(tfr_file, options=options) as tfr_writer:
                 for itime in np.arange(ntimes):
                     out = IFS2TFRecords.parse_one_data_arr(data_arr.isel(time=itime))
                     tfr_writer.write(out.SerializeToString())
 
+            with open(tfr_file + ".json", "w") as js_file:
+                js.dump({"nsamples": int(ntimes)}, js_file)
+
             print("%{0}: Wrote {1:d} elements to TFRecord-file '{2}'".format(method, ntimes, tfr_file))
         except Exception as err:
             print("%{0}: Failed to write DataArray to TFRecord-file. See error below.".format(method))
@@ -180,9 +301,10 @@ class IFS2TFRecords(object):
         data_dict = {"nvars": IFS2TFRecords._int64_feature(dim_sh[0]),
                      "nlat": IFS2TFRecords._int64_feature(dim_sh[1]),
                      "nlon": IFS2TFRecords._int64_feature(dim_sh[2]),
-                     "variable": IFS2TFRecords._bytes_list_feature(data_arr["variable"].values),
-                     "time": IFS2TFRecords._bytes_feature(ensure_datetime(data_arr["time"][0].values)
-                                                          .strftime(date_fmt)),
+                     "variable": IFS2TFRecords._bytes_list_feature([str(var).encode() for var in
+                                                                    data_arr["variable"].values]),
+                     "time": IFS2TFRecords._bytes_feature(ensure_datetime(data_arr["time"].values)
+                                                          .strftime(date_fmt).encode()),
                      "data_array": IFS2TFRecords._bytes_feature(IFS2TFRecords.serialize_array(data_arr.values))
                      }
 
@@ -191,23 +313,34 @@ class IFS2TFRecords(object):
 
         return out
 
+    @staticmethod
+    def parse_example(serialized, data_dim: tuple, dtype=tf.float32):
+        """
+        Parse a serialized example (see parse_one_data_arr) to get the data array.
+        :param serialized: the serialized example
+        :param data_dim: shape of the data, i.e. (nvars, nlat, nlon)
+        :param dtype: data type of the data
+        :return: data array with channels last, i.e. with shape (nlat, nlon, nvars)
+        """
+        feature_desc = {"data_array": tf.io.FixedLenFeature([], tf.string)}
+        example = tf.io.parse_single_example(serialized, feature_desc)
+        data = tf.io.parse_tensor(example["data_array"], out_type=dtype)
+        data = tf.ensure_shape(data, data_dim)
+
+        return tf.transpose(data, perm=[1, 2, 0])
+
     # Methods to convert data to TF protocol buffer messages
     @staticmethod
     def serialize_array(array):
         method = IFS2TFRecords.serialize_array.__name__
 
-        # method that should be used locally only
-        def map_np_dtype(arr, name="arr"):
-            dict_map = {name: tf.dtypes.as_dtype(arr[0].dtype)}
-            return dict_map
+        if not isinstance(array, np.ndarray):
+            raise ValueError("%{0}: Input data must be a numpy array, but is of type {1}.".format(method, type(array)))
 
-        try:
-            dtype_dict = map_np_dtype(array)
-            new = tf.io.serialize_tensor(array)
-        except Exception as err:
-            assert type(array) == np.array, "%{0}: Input data must be a numpy array.".format(method)
-            raise err
-        return new, dtype_dict
+        # parse_tensor requires to know the data type, thus float32 is enforced
+        new = tf.io.serialize_tensor(array.astype(np.float32)).numpy()
+
+        return new
 
     @staticmethod
     def _bytes_feature(value):